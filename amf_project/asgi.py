@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'amf_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready; serves the dashboard's live-updates
+# stream and hands every other request to Django.
+from finance.live import LiveUpdates  # noqa: E402
+
+application = LiveUpdates(django_application)
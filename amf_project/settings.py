@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,11 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'finance.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'finance.routers.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,13 +79,88 @@ WSGI_APPLICATION = 'amf_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# AMF_DB_PROFILE selects how SQLite is tuned:
+#   'default' - SQLite's defaults (rollback journal, deferred transactions, new connection per request)
+#   'tuned'   - WAL journal, relaxed fsync, larger page cache and mmap, busy timeout
+#               and BEGIN IMMEDIATE for atomic blocks
+# BEGIN IMMEDIATE takes the write lock when an atomic block starts instead of at its
+# first write, so writers queue on the busy timeout rather than failing with
+# "database is locked" when a read lock cannot be upgraded. The cost: every atomic()
+# block, read-only ones included, holds the single write lock until it ends, so keep
+# atomic() to write paths (reads need none) and keep those blocks short.
+#
+# AMF_CONN_MAX_AGE keeps connections open between requests (seconds, default 0).
+# wsgi.py opts in with 600. Leave it at 0 under ASGI: async views' connections live
+# in per-request executor threads, so persistent ones are never reused and only
+# pile up.
+SQLITE_PROFILES = {
+    'default': {},
+    'tuned': {
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-65536;'  # 64 MiB
+                'PRAGMA mmap_size=268435456;'  # 256 MiB
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'timeout': 20,  # seconds to wait on a locked database
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+DATABASE_PROFILE = os.environ.get('AMF_DB_PROFILE', 'tuned')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('AMF_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        # A file-backed test database lets threaded tests use separate connections.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        **SQLITE_PROFILES[DATABASE_PROFILE],
+        'CONN_MAX_AGE': int(os.environ.get('AMF_CONN_MAX_AGE', 0)),
+    }
+}
+
+# Read replicas: AMF_DB_REPLICAS is a comma-separated list of SQLite files kept in
+# sync with the primary (locally by `manage.py sync_replicas`). Exports and the
+# transaction list read from them; cached pages (dashboard, reports) are built on
+# the primary. A user who just posted reads from the primary for REPLICA_STICKY_SECONDS.
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(filter(None, os.environ.get('AMF_DB_REPLICAS', '').split(',')), 1):
+    DATABASE_REPLICAS.append(f'replica{_index}')
+    DATABASES[f'replica{_index}'] = {**DATABASES['default'], 'NAME': _name, 'TEST': {'MIRROR': 'default'}}
+
+# Transaction archive: with AMF_ARCHIVE_DB set, transactions archived by
+# `manage.py archive_transactions` go to that SQLite file (create it with
+# `manage.py migrate --database archive`); otherwise to a table in the primary.
+if os.environ.get('AMF_ARCHIVE_DB'):
+    DATABASES['archive'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['AMF_ARCHIVE_DB'],
+        'TEST': {'NAME': BASE_DIR / 'test_archive.sqlite3'},
+    }
+
+DATABASE_ROUTERS = ['finance.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Dashboard and report summaries are cached per user. The cache must be shared
+# between processes: run_jobs workers refresh reports for the web processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('AMF_CACHE_DIR', BASE_DIR / 'cache'),
     }
 }
 
+FINANCE_CACHE_ALIAS = 'default'
+FINANCE_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,4 +205,83 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 LOGIN_REDIRECT_URL = 'dashboard'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Finance app
+
+# Rows per page in the keyset-paginated transaction list.
+TRANSACTION_PAGE_SIZE = 50
+
+# Full-text search (transaction list ?q=) returns at most this many ranked matches.
+SEARCH_RESULT_LIMIT = 50
+
+# Seconds a replayed money-moving POST returns the original response.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Rows per bulk_create batch when importing statements.
+IMPORT_BATCH_SIZE = 1000
+
+# Statements at least this many bytes are imported by a job worker (manage.py run_jobs).
+IMPORT_BACKGROUND_BYTES = 1024 * 1024
+JOB_UPLOAD_ROOT = BASE_DIR / 'job_uploads'
+
+# Job queue: worker processes started by run_jobs, seconds between polls of an
+# empty queue, first retry delay (doubled per attempt) and its cap, and how long
+# a running job may go without finishing before it is considered abandoned.
+JOB_WORKER_PROCESSES = 2
+JOB_POLL_INTERVAL = 1.0
+JOB_RETRY_BACKOFF = 30
+JOB_MAX_BACKOFF = 60 * 60
+JOB_LOCK_TIMEOUT = 30 * 60
+
+# After a change, reports serve the previous figures while a job rebuilds them. A
+# rebuild still queued this many seconds after it was due means no worker is
+# running, and the page rebuilds inline instead.
+REPORT_REFRESH_GRACE = 60
+
+# Transactions older than this many days (rounded down to a month start) are
+# moved to the archive by `manage.py archive_transactions`. Keep it above
+# GOAL_FORECAST_WINDOW_DAYS: forecasts only read the hot table.
+ARCHIVE_AFTER_DAYS = 365
+
+# `manage.py run_scheduler` posts due recurring transactions every
+# RECURRING_POLL_INTERVAL seconds, RECURRING_BATCH_SIZE rules per commit.
+RECURRING_POLL_INTERVAL = 60.0
+RECURRING_BATCH_SIZE = 5000
+
+# Live dashboard updates (finance.live). LocalBackend reaches the streams of
+# one process; with several ASGI workers on PostgreSQL use
+# 'finance.live.PostgresBackend'. Idle streams get a heartbeat comment every
+# LIVE_HEARTBEAT seconds so proxies keep them open.
+LIVE_UPDATES_BACKEND = 'finance.live.LocalBackend'
+LIVE_HEARTBEAT = 25.0
+
+# Days of goal transactions averaged into the saving rate used by goal forecasts.
+GOAL_FORECAST_WINDOW_DAYS = 90
+
+# Per-view query budgets checked by finance.middleware.PerformanceMiddleware.
+# Over-budget views are logged, or raise QueryBudgetExceeded when PERF_STRICT is on.
+PERF_STRICT = False
+PERF_SAMPLE_SIZE = 1000
+PERF_QUERY_BUDGETS = {
+    'dashboard': 10,
+    'reports': 10,
+    'transaction-list': 10,
+    'account-list': 5,
+    'account-detail': 5,
+    'account-balance': 8,
+    'goal-list': 5,
+    'goal-detail': 6,
+    'transaction-detail': 5,
+    'account_deposit': 25,
+    'account_withdraw': 25,
+    'goal_deposit': 25,
+    'goal_withdraw': 25,
+    'transaction-create': 25,
+    'transfer-create': 40,
+    'api-accounts': 3,
+    'api-goals': 3,
+    'api-transactions': 5,
+    'api-summary': 7,
+    'recurring-list': 3,
+}
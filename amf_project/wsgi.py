@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'amf_project.settings')
+# WSGI workers reuse their threads, so persistent connections pay off (see settings).
+os.environ.setdefault('AMF_CONN_MAX_AGE', '600')
 
 application = get_wsgi_application()
@@ -0,0 +1,215 @@
+from array import array
+from collections import defaultdict
+from datetime import date
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import archive
+from .models import DailyRollup, Goal, Transaction
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is not installed
+    np = None
+
+ROLLING_WINDOWS = (30, 90)
+SERIES_DAYS = 180
+MONTHS = 24
+TOP_EXPENSES = 5
+KIND = {'income': 1, 'expense': -1}
+
+
+def _archived_expenses(user):
+    # Archived rows are JSON, not rows the database can group: total them here.
+    # A goal deleted since archiving left its rows as plain expenses (as in the rollups).
+    rows = list(archive.History(user).raw_rows())
+    if not rows:
+        return []
+    goals = set(Goal.objects.filter(account__user=user).values_list('pk', flat=True))
+    if np is None:
+        totals = defaultdict(lambda: [0.0, 0])
+        for row in rows:
+            if row[archive.TYPE] == 'expense' and row[archive.GOAL] not in goals:
+                totals[row[archive.NAME]][0] += float(row[archive.AMOUNT])
+                totals[row[archive.NAME]][1] += 1
+        return [(name, total, count) for name, (total, count) in totals.items()]
+    columns = list(zip(*rows))
+    goal = np.nan_to_num(np.array(columns[archive.GOAL], dtype=np.float64)).astype(np.int64)  # None -> nan -> 0
+    spend = (np.array(columns[archive.TYPE], dtype=object) == 'expense') & ~np.isin(goal, list(goals))
+    names, inverse = np.unique(np.array(columns[archive.NAME], dtype=object)[spend], return_inverse=True)
+    inverse = inverse.reshape(-1)
+    totals = np.bincount(inverse, weights=np.array(columns[archive.AMOUNT], dtype=np.float64)[spend], minlength=len(names))
+    counts = np.bincount(inverse, minlength=len(names))
+    return list(zip(names.tolist(), totals.tolist(), counts.tolist()))
+
+
+def load_columns(user):
+    """Fetch the user's history, hot and archived, as aggregated columns.
+
+    ``day``/``month``/``kind``/``goal`` with ``amount`` and ``count`` hold one
+    entry per day, type and goal, read from the daily rollups, which already
+    count archived rows. Spending without a goal is also totalled per name
+    (``names`` with ``name_amount`` and ``name_count``) by the database,
+    plus the archive. No per-transaction work happens in Python.
+    """
+    cols = {'day': array('q'), 'month': array('q'), 'kind': array('b'), 'goal': array('q'),
+            'amount': array('d'), 'count': array('q')}
+    rows = (
+        DailyRollup.objects.filter(account__user=user, count__gt=0)
+        .values_list('day', 'type', 'goal_id')
+        .order_by()
+        .annotate(total=Sum('total'), count=Sum('count'))
+    )
+    for day, type, goal_id, total, count in rows:
+        cols['day'].append(day.toordinal())
+        cols['month'].append(day.year * 12 + day.month - 1)
+        cols['kind'].append(KIND.get(type, 0))
+        cols['goal'].append(goal_id or 0)
+        cols['amount'].append(float(total))
+        cols['count'].append(count)
+
+    by_name = defaultdict(lambda: [0.0, 0])
+    hot = (
+        Transaction.objects.filter(account__user=user, type='expense', goal__isnull=True)
+        .values_list('name')
+        .order_by()
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    for name, total, count in [*hot, *_archived_expenses(user)]:
+        by_name[name][0] += float(total)
+        by_name[name][1] += count
+    cols['names'] = list(by_name)
+    cols['name_amount'] = array('d', (total for total, _ in by_name.values()))
+    cols['name_count'] = array('q', (count for _, count in by_name.values()))
+    return cols
+
+
+def _month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _result(today, month_start, income, expense, spend, series_start, top, goal_rows, count, backend):
+    # Shared formatting for both backends; every argument is already aggregated.
+    monthly = [
+        {'month': _month_label(month_start + i), 'income': round(inc, 2), 'expense': round(exp, 2), 'net': round(inc - exp, 2)}
+        for i, (inc, exp) in enumerate(zip(income, expense))
+    ]
+    labels = [date.fromordinal(series_start + i).isoformat() for i in range(len(spend[ROLLING_WINDOWS[0]]))]
+    return {
+        'backend': backend,
+        'transactions': count,
+        'monthly': monthly[-MONTHS:],
+        'rolling': {
+            'labels': labels,
+            **{f'avg{w}': [round(v, 2) for v in spend[w]] for w in ROLLING_WINDOWS},
+            **{f'current{w}': round(spend[w][-1], 2) if spend[w] else 0 for w in ROLLING_WINDOWS},
+        },
+        'top_expenses': [{'name': name, 'total': round(total, 2), 'count': n} for name, total, n in top],
+        'goal_velocity': [
+            {'goal_id': goal_id, 'deposited': round(dep, 2), 'withdrawn': round(wd, 2),
+             'per_30_days': round((dep - wd) / max(1, today - first + 1) * 30, 2)}
+            for goal_id, dep, wd, first in goal_rows
+        ],
+    }
+
+
+def _compute_numpy(cols, today):
+    day = np.asarray(cols['day'], dtype=np.int64)
+    month = np.asarray(cols['month'], dtype=np.int64)
+    kind = np.asarray(cols['kind'], dtype=np.int8)
+    amount = np.asarray(cols['amount'], dtype=np.float64)
+    goal = np.asarray(cols['goal'], dtype=np.int64)
+    count = np.asarray(cols['count'], dtype=np.int64)
+    income_mask, expense_mask, has_goal = kind == 1, kind == -1, goal > 0
+
+    # Monthly cash flow
+    month_start = int(month.min())
+    n_months = int(month.max()) - month_start + 1
+    income = np.bincount(month - month_start, weights=amount * income_mask, minlength=n_months)
+    expense = np.bincount(month - month_start, weights=amount * expense_mask, minlength=n_months)
+
+    # Rolling average daily spending (expenses not moved into a goal)
+    widest = max(ROLLING_WINDOWS)
+    start = today - SERIES_DAYS - widest + 2
+    spend_mask = expense_mask & ~has_goal & (day >= start) & (day <= today)
+    daily = np.bincount(day[spend_mask] - start, weights=amount[spend_mask], minlength=today - start + 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    spend = {}
+    for w in ROLLING_WINDOWS:
+        rolling = (cumulative[w:] - cumulative[:-w]) / w
+        spend[w] = rolling[-SERIES_DAYS:].tolist()
+
+    # Top expense names
+    vocabulary = cols['names']
+    totals = np.asarray(cols['name_amount'], dtype=np.float64)
+    counts = np.asarray(cols['name_count'], dtype=np.int64)
+    # Rank by total, then by name, to match the pure-Python path.
+    ranked = sorted(np.flatnonzero(counts).tolist(), key=lambda i: (-totals[i], vocabulary[i]))[:TOP_EXPENSES]
+    top = [(vocabulary[i], float(totals[i]), int(counts[i])) for i in ranked]
+
+    # Per-goal deposit velocity
+    goal_rows = []
+    if has_goal.any():
+        ids, inverse = np.unique(goal[has_goal], return_inverse=True)
+        g_amount, g_kind, g_day = amount[has_goal], kind[has_goal], day[has_goal]
+        deposited = np.bincount(inverse, weights=g_amount * (g_kind == -1), minlength=len(ids))
+        withdrawn = np.bincount(inverse, weights=g_amount * (g_kind == 1), minlength=len(ids))
+        first = np.full(len(ids), np.iinfo(np.int64).max)
+        np.minimum.at(first, inverse, g_day)
+        goal_rows = [(int(i), float(d), float(w), int(f)) for i, d, w, f in zip(ids, deposited, withdrawn, first)]
+
+    return _result(today, month_start, income.tolist(), expense.tolist(), spend, today - SERIES_DAYS + 1,
+                   top, goal_rows, int(count.sum()), 'numpy')
+
+
+def _compute_python(cols, today):
+    month_start = min(cols['month'])
+    n_months = max(cols['month']) - month_start + 1
+    income, expense = [0.0] * n_months, [0.0] * n_months
+    widest = max(ROLLING_WINDOWS)
+    start = today - SERIES_DAYS - widest + 2
+    daily = [0.0] * (today - start + 1)
+    goals = {}
+    for day, month, kind, amount, goal in zip(cols['day'], cols['month'], cols['kind'], cols['amount'], cols['goal']):
+        if kind == 1:
+            income[month - month_start] += amount
+        elif kind == -1:
+            expense[month - month_start] += amount
+        if goal:
+            row = goals.setdefault(goal, [0.0, 0.0, day])
+            row[0 if kind == -1 else 1] += amount if kind else 0
+            row[2] = min(row[2], day)
+        elif kind == -1 and start <= day <= today:
+            daily[day - start] += amount
+    cumulative = [0.0]
+    for value in daily:
+        cumulative.append(cumulative[-1] + value)
+    spend = {
+        w: [(cumulative[i] - cumulative[i - w]) / w for i in range(w, len(cumulative))][-SERIES_DAYS:]
+        for w in ROLLING_WINDOWS
+    }
+    by_name = [(name, total, n) for name, total, n in zip(cols['names'], cols['name_amount'], cols['name_count']) if n]
+    top = sorted(by_name, key=lambda item: (-item[1], item[0]))[:TOP_EXPENSES]
+    goal_rows = [(goal, dep, wd, first) for goal, (dep, wd, first) in sorted(goals.items())]
+    return _result(today, month_start, income, expense, spend, today - SERIES_DAYS + 1,
+                   top, goal_rows, sum(cols['count']), 'python')
+
+
+def compute(cols, today=None, use_numpy=None):
+    """Aggregate columns from ``load_columns``; NumPy when available, plain lists otherwise."""
+    today = (today or timezone.localdate()).toordinal()
+    if not len(cols['day']):
+        return None
+    if use_numpy is None:
+        use_numpy = np is not None
+    return _compute_numpy(cols, today) if use_numpy else _compute_python(cols, today)
+
+
+def build_analytics(user):
+    result = compute(load_columns(user))
+    if result is not None:
+        names = dict(Goal.objects.filter(account__user=user).values_list('id', 'name'))
+        for row in result['goal_velocity']:
+            row['goal'] = names.get(row['goal_id'], '(deleted goal)')
+    return result
@@ -0,0 +1,170 @@
+import hashlib
+from decimal import Decimal
+from functools import wraps
+
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_safe
+
+from . import caching, rollups
+from .forms import TransactionFilterForm
+from .models import Account, Goal, Transaction
+from .pagination import InvalidCursor, keyset_values
+
+# Public field name -> values() lookup; ?fields= picks a subset.
+ACCOUNT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'balance': 'balance',
+    'created_at': 'created_at',
+}
+GOAL_FIELDS = {
+    'id': 'id',
+    'account': 'account_id',
+    'name': 'name',
+    'target_amount': 'target_amount',
+    'current_amount': 'current_amount',
+    'deadline': 'deadline',
+    'created_at': 'created_at',
+}
+TRANSACTION_FIELDS = {
+    'id': 'id',
+    'date': 'date',
+    'account': 'account_id',
+    'account_name': 'account__name',
+    'goal': 'goal_id',
+    'goal_name': 'goal__name',
+    'type': 'type',
+    'name': 'name',
+    'amount': 'amount',
+    'description': 'description',
+    'transfer_id': 'transfer_id',
+}
+
+
+CENT = Decimal('0.01')
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _etag(request, *args, **kwargs):
+    # Every write bumps the user's summary version (see signals), so it
+    # identifies the data; the digest tells representations of it apart.
+    digest = hashlib.blake2s(request.get_full_path().encode(), digest_size=6).hexdigest()
+    return f'W/"{caching.get_version(request.user.pk)}-{digest}"'
+
+
+def api_view(view):
+    """A read-only JSON endpoint with weak ETags.
+
+    A request whose If-None-Match matches the user's current data version is
+    answered 304 before the view runs any query of its own. Unauthenticated
+    requests get a 401 rather than a redirect to the login page, and a
+    ``BadRequest`` raised by the view becomes a 400.
+    """
+    @wraps(view)
+    def checked(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+
+    conditional = condition(etag_func=_etag)(checked)
+
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Authentication required."}, status=401)
+        response = conditional(request, *args, **kwargs)
+        # Revalidate every time: the ETag makes that a cheap 304.
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+    return wrapper
+
+
+def select_fields(request, available):
+    """Return ``{name: lookup}`` for the ``?fields=`` named in ``request`` (default: all)."""
+    requested = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}.")
+    return {name: available[name] for name in requested} if requested else dict(available)
+
+
+def _rows(rows, fields):
+    return [{name: row[lookup] for name, lookup in fields.items()} for row in rows]
+
+
+@api_view
+def accounts(request):
+    fields = select_fields(request, ACCOUNT_FIELDS)
+    rows = Account.objects.filter(user=request.user).order_by('pk').values(*fields.values())
+    return JsonResponse({'results': _rows(rows, fields)})
+
+
+@api_view
+def goals(request):
+    fields = select_fields(request, GOAL_FIELDS)
+    rows = Goal.objects.filter(account__user=request.user).order_by('pk').values(*fields.values())
+    return JsonResponse({'results': _rows(rows, fields)})
+
+
+@api_view
+def transactions(request):
+    """Newest first, filtered like the transaction list; follow ``next`` as ``?after=``."""
+    fields = select_fields(request, TRANSACTION_FIELDS)
+    filter_form = TransactionFilterForm(request.GET, user=request.user)
+    if not filter_form.is_valid():
+        raise BadRequest(' '.join(f"{name}: {' '.join(errors)}" for name, errors in filter_form.errors.items()))
+    queryset = filter_form.filter(Transaction.objects.filter(account__user=request.user))
+    try:
+        rows, next_cursor = keyset_values(queryset, list(fields.values()), request.GET.get('after'),
+                                          history=filter_form.history(request.user))
+    except InvalidCursor:
+        raise BadRequest("Invalid 'after' cursor.") from None
+    return JsonResponse({'results': _rows(rows, fields), 'next': next_cursor})
+
+
+def _money(total):
+    # Rollup sums come back without a fixed scale on SQLite.
+    return Decimal(total or 0).quantize(CENT)
+
+
+def build_summary(user):
+    """Report totals as plain values: overall, per account and per goal."""
+    account_totals = rollups.totals_by(user, 'account')
+    goal_totals = rollups.totals_by(user, 'goal')
+    by_type = rollups.totals_by_type(user)
+    empty = {'income': None, 'expense': None, 'count': 0}
+    accounts = []
+    for row in Account.objects.filter(user=user).order_by('pk').values('id', 'name', 'balance'):
+        totals = account_totals.get(row['id'], empty)
+        accounts.append({**row, 'income': _money(totals['income']), 'expense': _money(totals['expense']),
+                         'count': totals['count']})
+    goals = []
+    for row in Goal.objects.filter(account__user=user).order_by('pk').values(
+            'id', 'account_id', 'name', 'current_amount', 'target_amount'):
+        totals = goal_totals.get(row['id'], empty)
+        target = row['target_amount']
+        goals.append({
+            'id': row['id'], 'account': row['account_id'], 'name': row['name'],
+            'current_amount': row['current_amount'], 'target_amount': target,
+            'deposit': _money(totals['expense']), 'withdraw': _money(totals['income']),
+            'progress_percent': round(row['current_amount'] / target * 100, 2) if target > 0 else 0,
+        })
+    return {
+        'total_income': _money(by_type.get('income', {}).get('total')),
+        'total_expense': _money(by_type.get('expense', {}).get('total')),
+        'total_transactions': sum(row['count'] for row in account_totals.values()),
+        'accounts': accounts,
+        'goals': goals,
+    }
+
+
+@api_view
+def summary(request):
+    return JsonResponse(caching.cached(request.user, 'api-summary', build_summary))
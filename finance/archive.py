@@ -0,0 +1,360 @@
+import json
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import caching
+from .models import Account, Goal, Transaction, TransactionArchive
+from .pagination import row_key
+
+DEFAULT_AFTER_DAYS = 365
+COMPRESSION_LEVEL = 6
+DELETE_CHUNK_SIZE = 500
+ZERO = Decimal('0')
+
+# Position of each field in an archived row.
+ID, GOAL, TYPE, NAME, AMOUNT, DATE, DESCRIPTION, TRANSFER = range(8)
+
+_UNTIL_KEY = 'finance:archive:until'
+
+
+@dataclass
+class ArchiveResult:
+    batches: int
+    rows: int
+    seconds: float
+
+
+def get_after_days():
+    return getattr(settings, 'ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS)
+
+
+def _month(when):
+    return timezone.localdate(when).replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _aware(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def cutoff(now=None, days=None):
+    """Transactions dated before this month start are archived."""
+    days = get_after_days() if days is None else days
+    return _aware(_month((now or timezone.now()) - timedelta(days=days)))
+
+
+def _signed(type, amount):
+    return amount if type in ('income', 'transfer') else -amount if type == 'expense' else ZERO
+
+
+def _pack(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def _unpack(batch):
+    return json.loads(zlib.decompress(bytes(batch.data)))
+
+
+def _row(txn):
+    return [txn.pk, txn.goal_id, txn.type, txn.name, str(txn.amount), txn.date.isoformat(), txn.description,
+            txn.transfer_id and str(txn.transfer_id)]
+
+
+def _transaction(batch, row):
+    txn = Transaction(
+        id=row[ID], account_id=batch.account_id, goal_id=row[GOAL], type=row[TYPE], name=row[NAME],
+        amount=Decimal(row[AMOUNT]), date=datetime.fromisoformat(row[DATE]), description=row[DESCRIPTION],
+        transfer_id=row[TRANSFER] if len(row) > TRANSFER else None,
+    )
+    txn.archived = True
+    return txn
+
+
+def archived_until():
+    """Every archived transaction is dated before this; None while the archive is empty."""
+    until = caching.get_cache().get(_UNTIL_KEY)
+    if until is None:
+        until = _refresh_until()
+    return until or None
+
+
+def _refresh_until():
+    last = TransactionArchive.objects.aggregate(month=Max('month'))['month']
+    until = _aware(_next_month(last)) if last else ''
+    caching.get_cache().set(_UNTIL_KEY, until, None)
+    return until
+
+
+def _delete_hot(ids):
+    # A raw DELETE: Django's delete() would send post_delete, and the signal
+    # handlers would take archived rows out of the rollups and checkpoints.
+    connection = connections[router.db_for_write(Transaction)]
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    with connection.cursor() as cursor:
+        for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[i:i + DELETE_CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def archive_month(account_id, user_id, month):
+    """Move ``account_id``'s transactions dated in ``month`` into its archive batch; return how many.
+
+    Rows already in the batch are replaced by id, so a run interrupted
+    between the archive write and the delete is safe to repeat.
+    """
+    hot = list(Transaction.objects.filter(
+        account_id=account_id, date__gte=_aware(month), date__lt=_aware(_next_month(month)),
+    ))
+    if not hot:
+        return 0
+    with db_transaction.atomic(using=router.db_for_write(Transaction)), \
+            db_transaction.atomic(using=router.db_for_write(TransactionArchive)):
+        batch = TransactionArchive.objects.filter(account_id=account_id, month=month).first()
+        rows = {row[ID]: row for row in _unpack(batch)} if batch else {}
+        rows.update((txn.pk, _row(txn)) for txn in hot)
+        rows = sorted(rows.values(), key=lambda row: (row[DATE], row[ID]))
+        TransactionArchive.objects.update_or_create(account_id=account_id, month=month, defaults={
+            'user_id': user_id,
+            'count': len(rows),
+            'net': sum((_signed(row[TYPE], Decimal(row[AMOUNT])) for row in rows), ZERO),
+            'min_id': min(row[ID] for row in rows),
+            'max_id': max(row[ID] for row in rows),
+            'data': _pack(rows),
+        })
+        _delete_hot([txn.pk for txn in hot])
+    return len(hot)
+
+
+def archive(before=None, max_batches=None):
+    """Archive every account-month of transactions dated before ``before`` (default: ``cutoff()``).
+
+    ``max_batches`` bounds one run, oldest months first, so the command can
+    be run repeatedly in small steps. Rollups and balance checkpoints are
+    untouched: archived transactions still count towards every total.
+    """
+    started = time.perf_counter()
+    groups = (
+        Transaction.objects.filter(date__lt=before or cutoff())
+        .values('account', 'account__user', month=TruncMonth('date'))
+        .order_by('month', 'account')
+        .annotate(count=Count('id'))
+    )
+    if max_batches is not None:
+        groups = groups[:max_batches]
+    batches = rows = 0
+    users = set()
+    for group in list(groups):
+        rows += archive_month(group['account'], group['account__user'], timezone.localdate(group['month']))
+        batches += 1
+        users.add(group['account__user'])
+    for user_id in users:
+        caching.invalidate_user(user_id, ('summary',))
+    if batches:
+        _refresh_until()
+    return ArchiveResult(batches=batches, rows=rows, seconds=time.perf_counter() - started)
+
+
+def forget(account_id):
+    """Drop a deleted account's archive."""
+    if TransactionArchive.objects.filter(account_id=account_id).delete()[0]:
+        _refresh_until()
+
+
+def attach(transactions):
+    """Give archived transactions their account and goal with two queries; deleted goals become None."""
+    accounts = Account.objects.in_bulk({txn.account_id for txn in transactions})
+    goals = Goal.objects.in_bulk({txn.goal_id for txn in transactions if txn.goal_id})
+    for txn in transactions:
+        txn.account = accounts[txn.account_id]
+        txn.goal = goals.get(txn.goal_id)
+    return transactions
+
+
+def _sort_key(txn):
+    return txn.date, txn.pk
+
+
+class History:
+    """A user's archived transactions, filtered like the transaction list and read newest first."""
+
+    def __init__(self, user, account=None, goal=None, type=None, start=None, end=None):
+        self.user = user
+        self.account = account
+        self.goal = goal
+        self.type = type
+        self.start = start
+        self.end = end
+
+    def _batches(self, last=None):
+        batches = TransactionArchive.objects.filter(user_id=self.user.pk)
+        if self.account:
+            batches = batches.filter(account_id=self.account.pk)
+        if self.start:
+            batches = batches.filter(month__gte=_month(self.start))
+        if last:
+            batches = batches.filter(month__lte=_month(last))
+        return batches
+
+    def _matches(self, txn):
+        return (
+            (not self.goal or txn.goal_id == self.goal.pk)
+            and (not self.type or txn.type == self.type)
+            and (not self.start or txn.date >= self.start)
+            and (not self.end or txn.date < self.end)
+        )
+
+    def needed(self, rows, page_size):
+        """Whether a page of hot ``rows`` (``page_size + 1`` at most, instances or dicts) could include archived ones."""
+        until = archived_until()
+        if until is None or (self.start and self.start >= until):
+            return False
+        return len(rows) <= page_size or row_key(rows[-1])[0] < until
+
+    def iter(self, before=None):
+        """Yield matching transactions newest first, starting after the ``(date, id)`` key ``before``."""
+        last = self.end
+        if before is not None and (last is None or before[0] < last):
+            last = before[0]
+        month, rows = None, []
+        for batch in self._batches(last).order_by('-month').iterator():
+            if batch.month != month:
+                yield from self._flush(rows, before)
+                month, rows = batch.month, []
+            rows.extend(txn for txn in (_transaction(batch, row) for row in _unpack(batch)) if self._matches(txn))
+        yield from self._flush(rows, before)
+
+    @staticmethod
+    def _flush(rows, before):
+        rows.sort(key=_sort_key, reverse=True)
+        return (txn for txn in rows if before is None or _sort_key(txn) < before)
+
+    def page(self, before, limit):
+        return attach(list(islice(self.iter(before), limit)))
+
+    def get(self, pk):
+        """Return the archived transaction ``pk`` with its account and goal, or None."""
+        for batch in self._batches().filter(min_id__lte=pk, max_id__gte=pk):
+            for row in _unpack(batch):
+                if row[ID] == pk:
+                    return attach([_transaction(batch, row)])[0]
+        return None
+
+    def values(self):
+        """Yield ``(date, type, amount, name, goal_id)`` for every matching transaction, in no order."""
+        for batch in self._batches(self.end).iterator():
+            for row in _unpack(batch):
+                txn = _transaction(batch, row)
+                if self._matches(txn):
+                    yield txn.date, txn.type, txn.amount, txn.name, txn.goal_id
+
+    def raw_rows(self):
+        """Yield every archived row of the selected batches as stored (indexed by ``ID``...), unfiltered."""
+        for batch in self._batches(self.end).iterator():
+            yield from _unpack(batch)
+
+    def export_rows(self):
+        """Yield rows shaped like ``exports.TRANSACTION_COLUMNS``."""
+        accounts = dict(Account.objects.filter(user=self.user).values_list('pk', 'name'))
+        goals = dict(Goal.objects.filter(account__user=self.user).values_list('pk', 'name'))
+        for batch in self._batches(self.end).order_by('month', 'account_id').iterator():
+            for row in _unpack(batch):
+                txn = _transaction(batch, row)
+                if self._matches(txn):
+                    yield (txn.pk, txn.date, accounts.get(txn.account_id), goals.get(txn.goal_id),
+                           txn.type, txn.name, txn.amount, txn.description)
+
+
+def net(account_id, start=None, end=None):
+    """Income minus expense of ``account_id``'s archived transactions dated in ``[start, end)``.
+
+    Whole months inside the range use the stored batch net; only the months
+    at either edge are decompressed.
+    """
+    until = archived_until()
+    if until is None or (start is not None and start >= until):
+        return ZERO
+    batches = TransactionArchive.objects.filter(account_id=account_id).defer('data')
+    if start is not None:
+        batches = batches.filter(month__gte=_month(start))
+    if end is not None:
+        batches = batches.filter(month__lte=_month(end))
+    total = ZERO
+    for batch in batches:
+        first, last = _aware(batch.month), _aware(_next_month(batch.month))
+        if (start is None or start <= first) and (end is None or last <= end):
+            total += batch.net
+            continue
+        for row in _unpack(batch):
+            when = datetime.fromisoformat(row[DATE])
+            if (start is None or when >= start) and (end is None or when < end):
+                total += _signed(row[TYPE], Decimal(row[AMOUNT]))
+    return total
+
+
+def monthly_nets():
+    """Return ``{(account_id, month): net}`` for every batch."""
+    return {
+        (account_id, month): total
+        for account_id, month, total in TransactionArchive.objects.values_list('account_id', 'month', 'net')
+    }
+
+
+def daily_totals():
+    """Yield rollup-shaped ``{account, goal, type, day, total, count}`` dicts for the whole archive."""
+    goals = set(Goal.objects.values_list('pk', flat=True))
+    for batch in TransactionArchive.objects.order_by('account_id', 'month').iterator():
+        totals = {}
+        for row in _unpack(batch):
+            goal = row[GOAL] if row[GOAL] in goals else None
+            key = (goal, row[TYPE], timezone.localdate(datetime.fromisoformat(row[DATE])))
+            total, count = totals.get(key, (ZERO, 0))
+            totals[key] = (total + Decimal(row[AMOUNT]), count + 1)
+        for (goal, type, day), (total, count) in totals.items():
+            yield {'account': batch.account_id, 'goal': goal, 'type': type, 'day': day, 'total': total, 'count': count}
+
+
+def database_size(using='default'):
+    """Return ``(used_bytes, free_bytes)`` of the database file (SQLite) or the transaction table (PostgreSQL)."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("PRAGMA page_size")
+            page_size = cursor.fetchone()[0]
+            cursor.execute("PRAGMA page_count")
+            pages = cursor.fetchone()[0]
+            cursor.execute("PRAGMA freelist_count")
+            free = cursor.fetchone()[0]
+            return (pages - free) * page_size, free * page_size
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_total_relation_size(%s)", [Transaction._meta.db_table])
+            return cursor.fetchone()[0], 0
+    return 0, 0
+
+
+def compact(using='default'):
+    """Give the space of archived rows back: VACUUM the SQLite file, or the table on PostgreSQL.
+
+    Returns False when that is impossible because a transaction is open.
+    """
+    connection = connections[using]
+    if connection.in_atomic_block:
+        return False
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("VACUUM")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"VACUUM ANALYZE {Transaction._meta.db_table}")
+    return True
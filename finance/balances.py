@@ -0,0 +1,207 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import archive
+from .ledger import balance_effects
+from .models import Account, BalanceCheckpoint, DailyRollup, MonthlyRollup, Transaction
+
+ZERO = Decimal('0')
+MAX_SERIES_DAYS = 366
+
+
+def _signed(field):
+    # Income adds to the account balance, expense subtracts and transfer legs are
+    # already signed (see ledger.balance_effects).
+    return Case(
+        When(type__in=['income', 'transfer'], then=F(field)),
+        When(type='expense', then=-F(field)),
+        default=Value(ZERO),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+SIGNED_AMOUNT = _signed('amount')
+
+
+def month_start(when):
+    """Local midnight on the first day of ``when``'s month; checkpoints are only taken there."""
+    day = timezone.localdate(when).replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _aware(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _net(account, start=None, end=None):
+    # Income minus expense dated in [start, end), hot and archived.
+    transactions = Transaction.objects.filter(account=account)
+    if start is not None:
+        transactions = transactions.filter(date__gte=start)
+    if end is not None:
+        transactions = transactions.filter(date__lt=end)
+    hot = transactions.aggregate(net=Sum(SIGNED_AMOUNT))['net'] or ZERO
+    return hot + archive.net(account.pk, start, end)
+
+
+def shift(account_id, after, delta):
+    """Add ``delta`` to ``account_id``'s checkpoints taken after ``after`` (all of them if None).
+
+    Checkpoints never lie in the current month, so transactions dated this
+    month or later skip the query entirely.
+    """
+    if not delta or (after is not None and after >= month_start(timezone.now())):
+        return
+    checkpoints = BalanceCheckpoint.objects.filter(account_id=account_id)
+    if after is not None:
+        checkpoints = checkpoints.filter(as_of__gt=after)
+    checkpoints.update(balance=F('balance') + delta)
+
+
+def record(txn, sign=1):
+    """Carry a back-dated transaction (or its removal, ``sign=-1``) into later checkpoints."""
+    shift(txn.account_id, txn.date, sign * balance_effects(txn.type, txn.amount, False)[0])
+
+
+@db_transaction.atomic
+def checkpoint(account, until=None):
+    """Write month-start checkpoints for ``account`` up to ``until`` (default: now); return how many.
+
+    Monthly nets come from the rollups, so this costs a few queries however
+    many transactions the account has. The first run anchors the history on
+    the current balance; later runs continue from the latest checkpoint.
+    """
+    until = month_start(until or timezone.now())
+    latest = account.checkpoints.order_by('-as_of').first()
+    months = dict(
+        MonthlyRollup.objects.filter(account=account)
+        .values_list('month')
+        .order_by()
+        .annotate(net=Sum(_signed('total')))
+    )
+    if latest is not None:
+        first, balance = timezone.localdate(latest.as_of), latest.balance
+    else:
+        current = Account.objects.filter(pk=account.pk).values_list('balance', flat=True).get()
+        first = min(months, default=until.date())
+        balance = current - sum(months.values(), ZERO)
+    checkpoints = []
+    month = first
+    while month <= until.date():
+        if latest is None or month > first:
+            checkpoints.append(BalanceCheckpoint(account=account, as_of=_aware(month), balance=balance))
+        balance += months.get(month, ZERO)
+        month = _next_month(month)
+    BalanceCheckpoint.objects.bulk_create(checkpoints)
+    return len(checkpoints)
+
+
+def checkpoint_all(until=None):
+    total = 0
+    for account in Account.objects.order_by('pk').iterator():
+        total += checkpoint(account, until)
+    return total
+
+
+def balance_at(account, when):
+    """Return ``account``'s balance at ``when``, counting transactions dated before it.
+
+    Starts from the nearest checkpoint on either side (the live balance is
+    the checkpoint after everything) and applies only the transactions in
+    between.
+    """
+    before = account.checkpoints.filter(as_of__lte=when).order_by('-as_of').first()
+    after = account.checkpoints.filter(as_of__gt=when).order_by('as_of').first()
+    if before is not None and (after is None or when - before.as_of <= after.as_of - when):
+        return before.balance + _net(account, before.as_of, when)
+    if after is not None:
+        return after.balance - _net(account, when, after.as_of)
+    current = Account.objects.filter(pk=account.pk).values_list('balance', flat=True).get()
+    return current - _net(account, when)
+
+
+def daily_balances(account, start, end):
+    """Return ``[(day, closing balance), ...]`` for local dates ``start`` through ``end``."""
+    balance = balance_at(account, _aware(start))
+    nets = dict(
+        DailyRollup.objects.filter(account=account, day__gte=start, day__lte=end)
+        .values_list('day')
+        .order_by()
+        .annotate(net=Sum(_signed('total')))
+    )
+    series = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        balance += nets.get(day, ZERO)
+        series.append((day, balance))
+    return series
+
+
+def reconcile(accounts=None):
+    """Return ``(account, expected, actual)`` for every checkpointed account whose balance is off.
+
+    Expected is the latest checkpoint plus the transactions dated since, so
+    each account costs at most a month of ledger rows, in a single query.
+    Accounts without a checkpoint are not checked.
+    """
+    latest = BalanceCheckpoint.objects.filter(account=OuterRef('pk')).order_by('-as_of')
+    since = (
+        Transaction.objects.filter(account=OuterRef('pk'), date__gte=OuterRef('checkpoint_as_of'))
+        .order_by()
+        .values('account')
+        .annotate(net=Sum(SIGNED_AMOUNT))
+        .values('net')
+    )
+    rows = (
+        (accounts if accounts is not None else Account.objects.all())
+        .annotate(checkpoint_as_of=Subquery(latest.values('as_of')[:1]),
+                  checkpoint_balance=Subquery(latest.values('balance')[:1]))
+        .filter(checkpoint_as_of__isnull=False)
+        .annotate(net_since=Subquery(since, output_field=SIGNED_AMOUNT.output_field))
+        .order_by('pk')
+    )
+    mismatches = []
+    for account in rows.iterator():
+        expected = account.checkpoint_balance + (account.net_since or ZERO)
+        if expected != account.balance:
+            mismatches.append((account, expected, account.balance))
+    return mismatches
+
+
+def verify_checkpoints(accounts=None):
+    """Return ``(account_id, as_of, expected, actual)`` for checkpoints that disagree with the ledger.
+
+    Each checkpoint must equal the one before it plus the transactions in
+    between. This reads every transaction, so it is for occasional audits.
+    """
+    accounts = accounts if accounts is not None else Account.objects.all()
+    nets = {
+        (row['account'], timezone.localdate(row['month'])): row['net'] or ZERO
+        for row in Transaction.objects.filter(account__in=accounts)
+        .values('account', month=TruncMonth('date'))
+        .order_by()
+        .annotate(net=Sum(SIGNED_AMOUNT))
+    }
+    for key, total in archive.monthly_nets().items():
+        nets[key] = nets.get(key, ZERO) + total
+    mismatches = []
+    previous = None
+    for row in BalanceCheckpoint.objects.filter(account__in=accounts).order_by('account', 'as_of'):
+        if previous is not None and previous.account_id == row.account_id:
+            expected, month = previous.balance, timezone.localdate(previous.as_of)
+            while month < timezone.localdate(row.as_of):
+                expected += nets.get((row.account_id, month), ZERO)
+                month = _next_month(month)
+            if expected != row.balance:
+                mismatches.append((row.account_id, row.as_of, expected, row.balance))
+        previous = row
+    return mismatches
@@ -0,0 +1,407 @@
+import asyncio
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction as db_transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, caching, ledger, live, rollups
+from .models import Account, Goal, Transaction
+
+BENCH_PASSWORD = 'bench-password'
+EXPENSE_NAMES = ['Rent', 'Groceries', 'School fees', 'Fuel', 'Electricity', 'Water', 'Airtime', 'Transport']
+
+
+def generate(users=1, accounts_per_user=3, goals_per_account=2, transactions_per_user=10000,
+             seed=0, batch_size=5000, days=730):
+    """Create deterministic synthetic users, accounts, goals and transactions.
+
+    Transactions are written with bulk_create in ``batch_size`` chunks, so
+    millions of rows need only one chunk in memory. Balances and rollups are
+    derived from the generated rows afterwards. Returns the created users.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    created = []
+    with db_transaction.atomic():
+        for u in range(users):
+            user = User.objects.create_user(f'bench{seed}_{u}', password=BENCH_PASSWORD)
+            created.append(user)
+            accounts = Account.objects.bulk_create(
+                [Account(user=user, name=f'Account {a}') for a in range(accounts_per_user)]
+            )
+            goals = Goal.objects.bulk_create([
+                Goal(account=account, name=f'Goal {a}-{g}', target_amount=Decimal(rng.randrange(10000, 500000)),
+                     deadline=(now + timedelta(days=rng.randrange(30, 1000))).date())
+                for a, account in enumerate(accounts) for g in range(goals_per_account)
+            ])
+            batch = []
+            for _ in range(transactions_per_user):
+                account = rng.choice(accounts)
+                roll = rng.random()
+                goal = None
+                if roll < 0.25:
+                    type, name, amount = 'income', 'Salary', rng.randrange(1000, 100000)
+                elif roll < 0.35 and goals:
+                    goal = rng.choice(goals)
+                    account = goal.account
+                    type, name, amount = 'expense', f'Save for {goal.name}', rng.randrange(100, 5000)
+                else:
+                    type, name, amount = 'expense', rng.choice(EXPENSE_NAMES), rng.randrange(50, 20000)
+                batch.append(Transaction(
+                    account=account, goal=goal, type=type, name=name,
+                    amount=Decimal(amount) / 100,
+                    date=now - timedelta(seconds=rng.randrange(days * 86400)),
+                ))
+                if len(batch) >= batch_size:
+                    Transaction.objects.bulk_create(batch)
+                    batch.clear()
+            Transaction.objects.bulk_create(batch)
+        _derive_balances(created)
+    rollups.rebuild()
+    return created
+
+
+def _derive_balances(users):
+    def total(type, field):
+        rows = (
+            Transaction.objects.filter(type=type, **{field: OuterRef('pk')})
+            .values(field).order_by().annotate(total=Sum('amount')).values('total')
+        )
+        return Coalesce(Subquery(rows), Value(Decimal('0')), output_field=DecimalField())
+
+    Account.objects.filter(user__in=users).update(
+        balance=total('income', 'account') - total('expense', 'account') + Value(Decimal('1000000'))
+    )
+    Goal.objects.filter(account__user__in=users).update(current_amount=total('expense', 'goal'))
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _scenarios(user):
+    account = Account.objects.filter(user=user).order_by('pk').first()
+    goal = Goal.objects.filter(account__user=user).order_by('pk').first()
+    yield 'dashboard', 'get', reverse('dashboard'), None
+    yield 'reports', 'get', reverse('reports'), None
+    yield 'transaction_list', 'get', reverse('transaction-list'), None
+    yield 'transaction_list_filtered', 'get', reverse('transaction-list') + f'?account={account.pk}&type=expense', None
+    yield 'api_transactions', 'get', reverse('api-transactions'), None
+    yield 'api_summary', 'get', reverse('api-summary'), None
+    yield 'transaction_search', 'get', reverse('transaction-list') + '?q=rent', None
+    yield 'transaction_search_prefix', 'get', reverse('transaction-list') + f'?q=sch+fe&account={account.pk}', None
+    yield 'account_deposit', 'post', reverse('account_deposit', args=[account.pk]), {'amount': '10'}
+    yield 'account_withdraw', 'post', reverse('account_withdraw', args=[account.pk]), {'amount': '5'}
+    if goal is not None:
+        yield 'goal_deposit', 'post', reverse('goal_deposit', args=[goal.pk]), {'amount': '2'}
+        yield 'goal_withdraw', 'post', reverse('goal_withdraw', args=[goal.pk]), {'amount': '1'}
+
+
+def _summarize(latencies, queries, elapsed):
+    ordered = sorted(latencies)
+
+    def pct(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {
+        'requests': len(ordered),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed else None,
+        'queries_per_request': round(statistics.fmean(queries), 2),
+    }
+
+
+def run(users, requests=50, warmup=3, cold_cache=False):
+    """Drive every scenario ``requests`` times per user through the test client."""
+    results = {}
+    for user in users:
+        client = Client()
+        client.force_login(user)
+        for name, method, url, data in _scenarios(user):
+            latencies, queries = [], []
+            for i in range(warmup + requests):
+                if cold_cache:
+                    caching.get_cache().clear()
+                counter = _QueryCounter()
+                started = time.perf_counter()
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(counter))
+                    response = getattr(client, method)(url, data)
+                took = time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{name} returned {response.status_code}")
+                if i >= warmup:
+                    latencies.append(took)
+                    queries.append(counter.count)
+            bucket = results.setdefault(name, {'latencies': [], 'queries': [], 'elapsed': 0.0})
+            bucket['latencies'] += latencies
+            bucket['queries'] += queries
+            bucket['elapsed'] += sum(latencies)
+    return {name: _summarize(b['latencies'], b['queries'], b['elapsed']) for name, b in results.items()}
+
+
+def _read_urls(user):
+    account = Account.objects.filter(user=user).order_by('pk').first()
+    goal = Goal.objects.filter(account__user=user).order_by('pk').first()
+    transaction = Transaction.objects.filter(account__user=user).order_by('pk').first()
+    urls = [reverse('dashboard'), reverse('reports'), reverse('transaction-list'),
+            reverse('account-detail', args=[account.pk])]
+    if goal is not None:
+        urls.append(reverse('goal-detail', args=[goal.pk]))
+    if transaction is not None:
+        urls.append(reverse('transaction-detail', args=[transaction.pk]))
+    return urls
+
+
+def _session_key(user):
+    client = Client()
+    client.force_login(user)
+    return client.session.session_key
+
+
+def _logged_in(client, session_key):
+    client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    return client
+
+
+def _drive_wsgi(jobs, concurrency):
+    local = threading.local()
+
+    def one(job):
+        session_key, url = job
+        clients = local.__dict__.setdefault('clients', {})
+        client = clients.get(session_key) or clients.setdefault(session_key, _logged_in(Client(), session_key))
+        started = time.perf_counter()
+        response = client.get(url)
+        took = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+        return took
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(one, jobs))
+
+
+def _drive_asgi(jobs, concurrency):
+    async def main():
+        clients = {}
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(job):
+            session_key, url = job
+            client = clients.get(session_key) or clients.setdefault(session_key, _logged_in(AsyncClient(), session_key))
+            async with gate:
+                # What ASGIHandler does per request: sync work gets its own thread.
+                async with ThreadSensitiveContext():
+                    started = time.perf_counter()
+                    response = await client.get(url)
+                    took = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            return took
+
+        return await asyncio.gather(*(one(job) for job in jobs))
+
+    return asyncio.run(main())
+
+
+def run_concurrent(users, requests=50, concurrency=8, interfaces=('wsgi', 'asgi')):
+    """Compare the WSGI and ASGI request paths under ``concurrency`` requests in flight.
+
+    Each interface gets ``requests`` GETs per read-heavy URL per user. WSGI
+    requests run on a thread pool, as in a threaded WSGI server; ASGI requests
+    go through the async handler on one event loop, as in an ASGI server.
+    """
+    jobs = []
+    for user in users:
+        session_key = _session_key(user)
+        jobs += [(session_key, url) for url in _read_urls(user)] * requests
+    rng = random.Random(0)
+    rng.shuffle(jobs)
+    drivers = {'wsgi': _drive_wsgi, 'asgi': _drive_asgi}
+    results = {}
+    for interface in interfaces:
+        drivers[interface](jobs[:concurrency], concurrency)  # warm up caches and connections
+        started = time.perf_counter()
+        latencies = drivers[interface](jobs, concurrency)
+        elapsed = time.perf_counter() - started
+        summary = _summarize(latencies, [0], elapsed)
+        del summary['queries_per_request']
+        results[interface] = {'concurrency': concurrency, **summary}
+    if {'wsgi', 'asgi'} <= results.keys() and results['wsgi']['throughput_rps']:
+        results['asgi_speedup'] = round(results['asgi']['throughput_rps'] / results['wsgi']['throughput_rps'], 2)
+    return results
+
+
+def run_transfers(users, transfers=1000, batch_size=100):
+    """Compare ways of moving money between each user's first two accounts.
+
+    ``pair`` posts a withdrawal and a deposit, ``single`` posts one linked
+    transfer per commit and ``batch`` settles ``batch_size`` transfers per
+    commit. Balances are left where they started.
+    """
+    results = {}
+    for user in users:
+        source, destination = Account.objects.filter(user=user).order_by('pk')[:2]
+        amount = Decimal('1.00')
+
+        def pair():
+            with db_transaction.atomic():
+                ledger.post(source, 'expense', amount, name='Transfer out')
+                ledger.post(destination, 'income', amount, name='Transfer in')
+
+        def single():
+            ledger.transfer(source, destination, amount, check_funds=False)
+
+        def batch():
+            ledger.post_transfers([ledger.Transfer(source, destination, amount)] * batch_size, check_funds=False)
+
+        modes = (('pair', pair, transfers), ('single', single, transfers), ('batch', batch, max(1, transfers // batch_size)))
+        for name, func, calls in modes:
+            started = time.perf_counter()
+            for _ in range(calls):
+                func()
+            elapsed = time.perf_counter() - started
+            moved = calls * (batch_size if name == 'batch' else 1)
+            bucket = results.setdefault(name, {'transfers': 0, 'elapsed': 0.0})
+            bucket['transfers'] += moved
+            bucket['elapsed'] += elapsed
+            ledger.transfer(destination, source, moved * amount, check_funds=False)
+    return {
+        name: {'transfers': b['transfers'], 'transfers_per_s': round(b['transfers'] / b['elapsed'], 1)}
+        for name, b in results.items()
+    }
+
+
+def run_analytics(users, repeat=3):
+    """Time the reports analytics end to end: ``load_columns`` plus ``compute``, best of ``repeat`` per user."""
+    results = []
+    for user in users:
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cols = analytics.load_columns(user)
+            loaded = time.perf_counter()
+            result = analytics.compute(cols)
+            done = time.perf_counter()
+            if best is None or done - started < best[2]:
+                best = (loaded - started, done - loaded, done - started)
+        results.append((result['transactions'] if result else 0,) + best)
+    return {
+        'backend': 'numpy' if analytics.np is not None else 'python',
+        'transactions': sum(r[0] for r in results),
+        'load_s': round(sum(r[1] for r in results), 4),
+        'compute_s': round(sum(r[2] for r in results), 4),
+        'total_s': round(sum(r[3] for r in results), 4),
+    }
+
+
+def run_live(users, streams=1000):
+    """Hold ``streams`` idle live-update streams open on one event loop and measure their cost.
+
+    Streams go through ``live.LiveUpdates`` in front of Django's ASGI handler,
+    spread over ``users``. Reports the memory and threads added per open
+    stream, how long opening them took, and how long one ledger change per
+    user takes to reach every stream.
+    """
+    from django.core.asgi import get_asgi_application
+
+    app = live.LiveUpdates(get_asgi_application())
+    sessions = [_session_key(user) for user in users]
+    path = reverse('live-updates')
+    for user in users:
+        # The throwaway database reuses user ids, so earlier runs' summaries may still be cached.
+        caching.bump_version(user.pk)
+
+    async def main():
+        queues = []
+
+        def connect(session_key):
+            sent, received = asyncio.Queue(), asyncio.Queue()
+            scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                     'scheme': 'http', 'path': path, 'query_string': b'', 'root_path': '',
+                     'headers': [(b'host', b'testserver'),
+                                 (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode())],
+                     'client': ('127.0.0.1', 0), 'server': ('testserver', 80)}
+            queues.append((sent, received))
+            return asyncio.ensure_future(app(scope, received.get, sent.put))
+
+        async def until_patched(sent):
+            while True:
+                message = await sent.get()
+                if message.get('status', 200) != 200:
+                    raise RuntimeError(f"{path} returned {message['status']}")
+                if b'event: patch' in message.get('body', b''):
+                    return
+
+        threads = threading.active_count()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        tasks = [connect(sessions[i % len(sessions)]) for i in range(streams)]
+        await asyncio.gather(*(until_patched(sent) for sent, _ in queues))
+        opened = time.perf_counter() - started
+        # Peak resident size, in KiB on Linux: an upper bound on what the idle streams hold.
+        per_stream = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) * 1024 / streams
+        added_threads = threading.active_count() - threads
+
+        started = time.perf_counter()
+        for user in users:
+            account = await Account.objects.filter(user=user).order_by('pk').afirst()
+            await sync_to_async(ledger.post)(account, 'income', Decimal('1.00'), name='Live benchmark')
+        await asyncio.gather(*(until_patched(sent) for sent, _ in queues))
+        fan_out = time.perf_counter() - started
+
+        for _, received in queues:
+            received.put_nowait({'type': 'http.disconnect'})
+        await asyncio.gather(*tasks)
+        return {
+            'streams': streams,
+            'open_s': round(opened, 3),
+            'bytes_per_idle_stream': round(per_stream),
+            'threads_added': added_threads,
+            'fan_out_ms': round(fan_out * 1000, 1),
+        }
+
+    return asyncio.run(main())
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connections['default'].vendor,
+        'timestamp': timezone.now().isoformat(),
+    }
@@ -0,0 +1,195 @@
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+
+from . import live
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_STALE_TIMEOUT = 24 * 60 * 60
+# Independent version tokens per user: 'summary' covers everything, 'goals'
+# only changes with goals and goal transactions.
+SCOPES = ('summary', 'goals')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'FINANCE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id, scope):
+    return f'finance:version:{scope}:{user_id}'
+
+
+def get_version(user_id, scope='summary'):
+    cache = get_cache()
+    key = _version_key(user_id, scope)
+    version = cache.get(key)
+    if version is None:
+        # add() so two concurrent first readers agree on the version.
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(user_id, scope='summary'):
+    cache = get_cache()
+    key = _version_key(user_id, scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(user_id, scopes=SCOPES):
+    # A fresh random token rather than a counter: no incr() race on file/db backends,
+    # and old keys can never be reused after a cache eviction.
+    get_cache().set_many({_version_key(user_id, scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+def invalidate_user(user_id, scopes=SCOPES):
+    """Invalidate ``user_id``'s cached values in ``scopes`` once the current transaction commits.
+
+    The user's live dashboards are told after the new version is in place.
+    """
+    def bump():
+        bump_version(user_id, scopes)
+        live.publish([user_id])
+    db_transaction.on_commit(bump)
+
+
+def invalidate_users(user_ids, scopes=SCOPES):
+    """``invalidate_user`` for many users, with a single ``set_many`` after commit."""
+    user_ids = set(user_ids)
+    keys = [_version_key(user_id, scope) for user_id in user_ids for scope in scopes]
+    if not keys:
+        return
+
+    def bump():
+        get_cache().set_many({key: uuid.uuid4().hex for key in keys}, None)
+        live.publish(user_ids)
+    db_transaction.on_commit(bump)
+
+
+def _count(name, outcome):
+    with _stats_lock:
+        _stats[(name, outcome)] += 1
+
+
+def _key(name, user_id, version):
+    return f'finance:{name}:{user_id}:{version}'
+
+
+def _timeouts():
+    return (getattr(settings, 'FINANCE_CACHE_TIMEOUT', DEFAULT_TIMEOUT),
+            getattr(settings, 'FINANCE_STALE_TIMEOUT', DEFAULT_STALE_TIMEOUT))
+
+
+def cached(user, name, compute, scope='summary'):
+    """Return ``compute(user)`` from the cache, keyed by user and their ``scope`` data version."""
+    cache = get_cache()
+    key = _key(name, user.pk, get_version(user.pk, scope))
+    value = cache.get(key)
+    if value is not None:
+        _count(name, 'hit')
+        return value
+    _count(name, 'miss')
+    value = compute(user)
+    cache.set(key, value, _timeouts()[0])
+    return value
+
+
+def _latest_key(name, user_id):
+    return f'finance:{name}:{user_id}:latest'
+
+
+async def acached(user, name, compute, scope='summary'):
+    """Async ``cached``; ``compute`` is a coroutine function."""
+    cache = get_cache()
+    key = _key(name, user.pk, await aget_version(user.pk, scope))
+    value = await cache.aget(key)
+    if value is not None:
+        _count(name, 'hit')
+        return value
+    _count(name, 'miss')
+    value = await compute(user)
+    await cache.aset(key, value, _timeouts()[0])
+    return value
+
+
+def refresh(user, name, compute, scope='summary'):
+    """Recompute ``name`` for ``user`` and store it as both current and latest value."""
+    # Read the version first: if data changes while computing, the result is filed
+    # under the old version and the next read schedules another refresh.
+    version = get_version(user.pk, scope)
+    value = compute(user)
+    timeout, stale_timeout = _timeouts()
+    cache = get_cache()
+    cache.set(_key(name, user.pk, version), value, timeout)
+    cache.set(_latest_key(name, user.pk), value, stale_timeout)
+    return value
+
+
+async def arefresh(user, name, compute, scope='summary'):
+    version = await aget_version(user.pk, scope)
+    value = await compute(user)
+    timeout, stale_timeout = _timeouts()
+    cache = get_cache()
+    await cache.aset(_key(name, user.pk, version), value, timeout)
+    await cache.aset(_latest_key(name, user.pk), value, stale_timeout)
+    return value
+
+
+def cached_stale(user, name, compute, schedule, scope='summary'):
+    """Like ``cached``, but once the data changes serve the last value and call ``schedule(user)``.
+
+    ``schedule`` should arrange for ``refresh`` to run outside the request,
+    and return False when that will not happen soon (no worker is running).
+    Then, and for a user with no earlier value, this computes inline.
+    """
+    cache = get_cache()
+    value = cache.get(_key(name, user.pk, get_version(user.pk, scope)))
+    if value is not None:
+        _count(name, 'hit')
+        return value
+    value = cache.get(_latest_key(name, user.pk))
+    if value is not None and schedule(user) is not False:
+        _count(name, 'stale')
+        return value
+    _count(name, 'miss')
+    return refresh(user, name, compute, scope)
+
+
+async def acached_stale(user, name, compute, schedule, scope='summary'):
+    """Async ``cached_stale``; ``compute`` and ``schedule`` are coroutine functions."""
+    cache = get_cache()
+    value = await cache.aget(_key(name, user.pk, await aget_version(user.pk, scope)))
+    if value is not None:
+        _count(name, 'hit')
+        return value
+    value = await cache.aget(_latest_key(name, user.pk))
+    if value is not None and await schedule(user) is not False:
+        _count(name, 'stale')
+        return value
+    _count(name, 'miss')
+    return await arefresh(user, name, compute, scope)
+
+
+def stats():
+    """Return ``{name: {'hit': n, 'miss': n}}`` counters (plus ``'stale'`` if any) for this process."""
+    with _stats_lock:
+        result = {}
+        for (name, outcome), count in _stats.items():
+            result.setdefault(name, {'hit': 0, 'miss': 0})[outcome] = count
+        return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,104 @@
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
+
+EXPORT_CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+TRANSACTION_COLUMNS = [
+    ('id', 'id'),
+    ('date', 'date'),
+    ('account', 'account__name'),
+    ('goal', 'goal__name'),
+    ('type', 'type'),
+    ('name', 'name'),
+    ('amount', 'amount'),
+    ('description', 'description'),
+]
+REPORT_COLUMNS = ['section', 'name', 'account', 'balance', 'income', 'expense', 'goal_count',
+                  'current_amount', 'target_amount', 'deposit', 'withdraw', 'progress_percent']
+
+
+def transaction_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream ``queryset`` as tuples; only the exported columns are fetched, ``chunk_size`` rows at a time."""
+    lookups = [lookup for _, lookup in TRANSACTION_COLUMNS]
+    return queryset.order_by('id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def report_rows(report):
+    for s in report['account_summaries']:
+        yield ('account', s['account'].name, '', s['balance'], s['income'], s['expense'], s['goal_count'],
+               '', '', '', '', '')
+    for s in report['goal_summaries']:
+        yield ('goal', s['goal'].name, s['account'].name, '', '', '', '', s['current_amount'],
+               s['target_amount'], s['deposit'], s['withdraw'], s['progress_percent'])
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def jsonl_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, (_plain(value) for value in row)))) + '\n'
+
+
+def encode(header, rows, format='csv', compress=False, lines_per_chunk=500):
+    """Yield the encoded export as bytes, optionally gzip-compressed on the fly."""
+    lines = csv_lines(header, rows) if format == 'csv' else jsonl_lines(header, rows)
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= lines_per_chunk:
+            chunk = ''.join(buffer).encode()
+            buffer.clear()
+            yield compressor.compress(chunk) if compressor else chunk
+    chunk = ''.join(buffer).encode()
+    if compressor:
+        yield compressor.compress(chunk) + compressor.flush()
+    elif chunk:
+        yield chunk
+
+
+def export_transactions(queryset, format='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE, history=None):
+    """Encode ``queryset``, preceded by the archived rows of ``history`` if given.
+
+    ``history`` is an ``archive.History``, or a list of them.
+    """
+    header = [name for name, _ in TRANSACTION_COLUMNS]
+    rows = transaction_rows(queryset, chunk_size)
+    if history is not None:
+        histories = history if isinstance(history, list) else [history]
+        rows = chain(*(h.export_rows() for h in histories), rows)
+    return encode(header, rows, format, compress)
+
+
+def export_report(report, format='csv', compress=False):
+    return encode(REPORT_COLUMNS, report_rows(report), format, compress)
+
+
+def filename(base, format, compress):
+    return f"{base}.{FORMATS[format][1]}" + ('.gz' if compress else '')
@@ -0,0 +1,143 @@
+import math
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+
+from . import caching
+from .models import Goal, Transaction
+
+DEFAULT_RATE_WINDOW_DAYS = 90
+# Projections further out than this are reported as stalled rather than as a date.
+MAX_HORIZON_DAYS = 100 * 365
+ZERO = Decimal('0')
+
+
+@dataclass
+class Forecast:
+    goal_id: int
+    remaining: Decimal
+    daily_rate: Decimal
+    projected_date: date | None
+    required_per_month: Decimal | None
+    days_left: int
+    transactions: int
+    status: str
+
+    @property
+    def per_month(self):
+        return (self.daily_rate * 30).quantize(Decimal('0.01'))
+
+    @property
+    def on_track(self):
+        return self.status in ('complete', 'on_track')
+
+
+def get_rate_window():
+    return getattr(settings, 'GOAL_FORECAST_WINDOW_DAYS', DEFAULT_RATE_WINDOW_DAYS)
+
+
+def _history_rows(user, since):
+    # Each goal's first transaction date and net saving since ``since``.
+    return (
+        Transaction.objects.filter(goal__account__user=user)
+        .values('goal_id')
+        .order_by()
+        .annotate(
+            first=Min('date'),
+            count=Count('id'),
+            deposited=Sum('amount', filter=Q(type='expense', date__gte=since)),
+            withdrawn=Sum('amount', filter=Q(type='income', date__gte=since)),
+        )
+    )
+
+
+def project(goal_id, target, current, deadline, history, today, window):
+    remaining = max(ZERO, target - current)
+    days_left = (deadline - today).days
+    required = (remaining / days_left * 30).quantize(Decimal('0.01')) if days_left > 0 else None
+    rate, count = ZERO, 0
+    if history is not None:
+        count = history['count']
+        first = timezone.localtime(history['first']).date() if timezone.is_aware(history['first']) else history['first'].date()
+        # Average over the window, or since the first deposit if the goal is younger than that.
+        span = (today - max(first, today - timedelta(days=window - 1))).days + 1
+        net = (history['deposited'] or ZERO) - (history['withdrawn'] or ZERO)
+        rate = max(ZERO, net / max(1, span))
+
+    projected = None
+    if remaining == 0:
+        status, projected = 'complete', today
+    elif rate > 0 and (days := math.ceil(remaining / rate)) <= MAX_HORIZON_DAYS:
+        projected = today + timedelta(days=days)
+        if days_left < 0:
+            status = 'overdue'
+        else:
+            status = 'on_track' if projected <= deadline else 'behind'
+    elif days_left < 0:
+        status = 'overdue'
+    else:
+        status = 'no_history' if count == 0 else 'stalled'
+    return Forecast(goal_id=goal_id, remaining=remaining, daily_rate=rate, projected_date=projected,
+                    required_per_month=required, days_left=days_left, transactions=count, status=status)
+
+
+def _since(today, window):
+    return timezone.make_aware(datetime.combine(today - timedelta(days=window - 1), time.min))
+
+
+def _goal_rows(user, goals):
+    if goals is None:
+        return Goal.objects.filter(account__user=user).values_list('id', 'target_amount', 'current_amount', 'deadline')
+    return [(g.pk, g.target_amount, g.current_amount, g.deadline) for g in goals]
+
+
+def _project_all(goal_rows, history, today, window):
+    return {
+        goal_id: project(goal_id, target, current, deadline, history.get(goal_id), today, window)
+        for goal_id, target, current, deadline in goal_rows
+    }
+
+
+def forecast_goals(user, goals=None, today=None):
+    """Project completion for every goal of ``user`` in one pass.
+
+    Uses one aggregate query over goal transactions, plus one for the goals
+    unless ``goals`` (all of the user's goals) is passed in. Returns
+    ``{goal_id: Forecast}``.
+    """
+    today = today or timezone.localdate()
+    window = get_rate_window()
+    history = {row['goal_id']: row for row in _history_rows(user, _since(today, window))}
+    return _project_all(_goal_rows(user, goals), history, today, window)
+
+
+async def aforecast_goals(user, goals=None, today=None):
+    today = today or timezone.localdate()
+    window = get_rate_window()
+    history = {row['goal_id']: row async for row in _history_rows(user, _since(today, window))}
+    goal_rows = _goal_rows(user, goals)
+    if goals is None:
+        goal_rows = [row async for row in goal_rows]
+    return _project_all(goal_rows, history, today, window)
+
+
+def get_forecasts(user, goals=None):
+    """Cached ``forecast_goals``; invalidated only by goal and goal-transaction changes."""
+    return caching.cached(user, 'goal_forecasts', lambda u: forecast_goals(u, goals), scope='goals')
+
+
+async def aget_forecasts(user, goals=None):
+    async def compute(u):
+        return await aforecast_goals(u, goals)
+    return await caching.acached(user, 'goal_forecasts', compute, scope='goals')
+
+
+def attach(goals, forecasts):
+    """Set ``goal.forecast`` on each goal for the templates and return ``goals``."""
+    for goal in goals:
+        goal.forecast = forecasts.get(goal.pk)
+    return goals
@@ -1,5 +1,10 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
 from django import forms
-from .models import Account, Goal, Transaction
+from django.utils import timezone
+from . import archive, search
+from .models import Account, Goal, RecurringTransaction, Transaction
 
 class AccountForm(forms.ModelForm):
     class Meta:
@@ -41,4 +46,149 @@ class TransactionForm(forms.ModelForm):
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Amount'}),
             'goal': forms.Select(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': 'Description (optional)'}),
-        }
\ No newline at end of file
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Transfers are posted as linked pairs by the transfer view.
+        self.fields['type'].choices = [choice for choice in self.fields['type'].choices if choice[0] != 'transfer']
+
+class RecurringTransactionForm(forms.ModelForm):
+    # The schedule is fixed once a rule has run; pause it or make a new one instead.
+    SCHEDULE_FIELDS = ('interval', 'every', 'starts_at')
+
+    class Meta:
+        model = RecurringTransaction
+        fields = ['account', 'type', 'name', 'amount', 'goal', 'description', 'interval', 'every', 'starts_at', 'ends_at', 'active']
+        labels = {'every': "Every", 'interval': "Repeat", 'starts_at': "First run", 'ends_at': "Last run (optional)"}
+        widgets = {
+            'account': forms.Select(attrs={'class': 'form-control'}),
+            'type': forms.Select(attrs={'class': 'form-control'}),
+            'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. Rent, Salary, School fees'}),
+            'amount': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Amount'}),
+            'goal': forms.Select(attrs={'class': 'form-control'}),
+            'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': 'Description (optional)'}),
+            'interval': forms.Select(attrs={'class': 'form-control'}),
+            'every': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
+            'starts_at': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+            'ends_at': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['account'].queryset = Account.objects.filter(user=user)
+        self.fields['goal'].queryset = Goal.objects.filter(account__user=user)
+        if self.instance.pk:
+            for name in self.SCHEDULE_FIELDS:
+                del self.fields[name]
+        else:
+            del self.fields['active']
+
+    def clean_amount(self):
+        amount = self.cleaned_data['amount']
+        if amount is not None and amount <= 0:
+            raise forms.ValidationError("Amount must be positive.")
+        return amount
+
+    def clean_every(self):
+        every = self.cleaned_data['every']
+        if not every:
+            raise forms.ValidationError("Repeat at least every 1.")
+        return every
+
+    def clean(self):
+        data = super().clean()
+        goal, account = data.get('goal'), data.get('account')
+        if goal and account and goal.account_id != account.pk:
+            self.add_error('goal', "Pick a goal of the same account.")
+        starts_at = data.get('starts_at') or self.instance.starts_at
+        if data.get('ends_at') and starts_at and data['ends_at'] < starts_at:
+            self.add_error('ends_at', "The last run cannot be before the first.")
+        return data
+
+class TransferForm(forms.Form):
+    source = forms.ModelChoiceField(label="From", queryset=Account.objects.none(), widget=forms.Select(attrs={'class': 'form-control'}))
+    description = forms.CharField(label="Description", required=False, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. March payroll'}))
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['source'].queryset = Account.objects.filter(user=user)
+
+class TransferLegForm(forms.Form):
+    destination = forms.ModelChoiceField(label="To", queryset=Account.objects.none(), widget=forms.Select(attrs={'class': 'form-control'}))
+    amount = forms.DecimalField(label="Amount", min_value=Decimal('0.01'), max_digits=12, decimal_places=2, widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Amount'}))
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['destination'].queryset = Account.objects.filter(user=user)
+
+# One source, one or more destinations: a split (payroll-style) transfer settles in one commit.
+TransferLegFormSet = forms.formset_factory(TransferLegForm, extra=2, min_num=1, validate_min=True, max_num=50, validate_max=True)
+
+class TransactionFilterForm(forms.Form):
+    q = forms.CharField(label="Search", required=False, max_length=200, widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g. rent, school fees', 'type': 'search'}))
+    account = forms.ModelChoiceField(queryset=Account.objects.none(), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    goal = forms.ModelChoiceField(queryset=Goal.objects.none(), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    type = forms.ChoiceField(choices=[('', 'All types')] + Transaction.TRANSACTION_TYPES, required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['account'].queryset = Account.objects.filter(user=user)
+        self.fields['goal'].queryset = Goal.objects.filter(account__user=user)
+
+    def date_range(self):
+        """Return the ``(start, end)`` datetimes of the chosen dates; ``end`` is exclusive."""
+        # Datetime bounds rather than __date lookups, so the (account, date) index can be used.
+        data = self.cleaned_data
+        start = timezone.make_aware(datetime.combine(data['date_from'], time.min)) if data.get('date_from') else None
+        end = timezone.make_aware(datetime.combine(data['date_to'] + timedelta(days=1), time.min)) if data.get('date_to') else None
+        return start, end
+
+    def filter(self, queryset):
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data['account']:
+            queryset = queryset.filter(account=data['account'])
+        if data['goal']:
+            queryset = queryset.filter(goal=data['goal'])
+        if data['type']:
+            queryset = queryset.filter(type=data['type'])
+        start, end = self.date_range()
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lt=end)
+        return queryset
+
+    def history(self, user):
+        """The archived transactions within the filters; invalid filters are ignored."""
+        if not self.is_valid():
+            return archive.History(user)
+        data = self.cleaned_data
+        start, end = self.date_range()
+        return archive.History(user, account=data['account'], goal=data['goal'], type=data['type'],
+                               start=start, end=end)
+
+    def search(self, user, query):
+        """Full-text search ``query`` within the filters; invalid filters are ignored."""
+        if not self.is_valid():
+            return search.search(user, query)
+        data = self.cleaned_data
+        start, end = self.date_range()
+        return search.search(user, query, account=data['account'], goal=data['goal'], type=data['type'],
+                             start=start, end=end)
+
+
+class StatementImportForm(forms.Form):
+    FORMAT_CHOICES = [('', 'Detect from file name'), ('csv', 'CSV'), ('ofx', 'OFX')]
+
+    account = forms.ModelChoiceField(queryset=Account.objects.none(), widget=forms.Select(attrs={'class': 'form-control'}))
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['account'].queryset = Account.objects.filter(user=user)
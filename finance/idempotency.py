@@ -0,0 +1,72 @@
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL))
+
+
+def _replay(record, request):
+    if record.path != request.path:
+        return HttpResponse("Idempotency key was already used for a different request.", status=422)
+    if record.status_code is None:
+        # The first request is still running; tell the client to retry later.
+        return HttpResponse("A request with this idempotency key is in progress.", status=409)
+    if record.location:
+        return HttpResponseRedirect(record.location, status=record.status_code)
+    return HttpResponse(status=record.status_code)
+
+
+def idempotent(view):
+    """Replay the first successful response for a repeated POST carrying the same key.
+
+    The key comes from the ``Idempotency-Key`` header or the hidden
+    ``idempotency_key`` form field. A replay costs one read on the unique
+    (user, key) index. Only redirects (the success path of the form views)
+    are stored; error responses roll the claim back so the client can retry.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER) or request.POST.get(FIELD)
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        key = key[:64]
+        now = timezone.now()
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None:
+            if record.expires_at > now:
+                return _replay(record, request)
+            record.delete()
+        try:
+            with db_transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=request.user, key=key, path=request.path, expires_at=now + get_ttl(),
+                )
+                response = view(request, *args, **kwargs)
+                if 300 <= response.status_code < 400:
+                    record.status_code = response.status_code
+                    record.location = response.get('Location', '')
+                    record.save(update_fields=['status_code', 'location'])
+                else:
+                    db_transaction.set_rollback(True)
+                return response
+        except IntegrityError:
+            # A concurrent request claimed the key first.
+            return _replay(IdempotencyKey.objects.get(user=request.user, key=key), request)
+    return wrapper
+
+
+def purge_expired(now=None):
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
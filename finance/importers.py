@@ -0,0 +1,183 @@
+import csv
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import balances, caching, rollups
+from .ledger import balance_effects
+from .models import Account, Transaction
+
+DEFAULT_BATCH_SIZE = 1000
+# Transfers need both legs and a signed amount; ledger.post_transfers makes them.
+VALID_TYPES = {value for value, _ in Transaction.TRANSACTION_TYPES} - {'transfer'}
+
+
+class StatementError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+@dataclass
+class ImportResult:
+    rows: int
+    batches: int
+    seconds: float
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+
+def get_batch_size():
+    return getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def _parse_date(value, line):
+    value = value.strip()
+    try:
+        if re.fullmatch(r'\d{8}(\d{6})?(\.\d+)?(\[.*\])?', value):
+            # OFX: YYYYMMDD[HHMMSS[.XXX]][[offset:TZ]]
+            digits = value[:14] if len(value) >= 14 and value[8:14].isdigit() else value[:8]
+            parsed = datetime.strptime(digits, '%Y%m%d%H%M%S' if len(digits) == 14 else '%Y%m%d')
+        else:
+            parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise StatementError(line, f"invalid date {value!r}")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _parse_amount(value, line):
+    try:
+        amount = Decimal(value.strip().replace(',', ''))
+    except (InvalidOperation, AttributeError):
+        raise StatementError(line, f"invalid amount {value!r}")
+    try:
+        # The column's max_digits and decimal_places: the database would round or reject the rest.
+        return Transaction._meta.get_field('amount').clean(amount, None)
+    except ValidationError as exc:
+        raise StatementError(line, f"invalid amount {value!r}: {' '.join(exc.messages)}")
+
+
+def _row(line, date, name, amount, type='', description=''):
+    amount = _parse_amount(amount, line)
+    type = (type or '').strip().lower() or ('income' if amount >= 0 else 'expense')
+    if type == 'transfer':
+        raise StatementError(line, "transfers cannot be imported")
+    if type not in VALID_TYPES:
+        raise StatementError(line, f"unknown transaction type {type!r}")
+    name = (name or '').strip()
+    if not name:
+        raise StatementError(line, "missing name")
+    return {
+        'line': line,
+        'date': _parse_date(date, line),
+        'name': name[:100],
+        'amount': abs(amount),
+        'type': type,
+        'description': (description or '').strip(),
+    }
+
+
+def parse_csv(lines):
+    """Yield rows from a CSV with ``date, name, amount`` and optional ``type, description`` columns.
+
+    Without a ``type`` column the sign of ``amount`` decides income vs expense.
+    """
+    reader = csv.DictReader(lines)
+    missing = {'date', 'name', 'amount'} - set(reader.fieldnames or ())
+    if missing:
+        raise StatementError(1, f"missing columns: {', '.join(sorted(missing))}")
+    for record in reader:
+        yield _row(reader.line_num, record['date'], record['name'], record['amount'],
+                   record.get('type'), record.get('description'))
+
+
+_OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+
+
+def parse_ofx(lines):
+    """Yield rows from the ``<STMTTRN>`` blocks of an OFX (SGML or XML) statement, one line at a time."""
+    current, start = None, 0
+    for line_no, line in enumerate(lines, 1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield _row(start, current.get('DTPOSTED', ''), current.get('NAME') or current.get('MEMO', ''),
+                               current.get('TRNAMT', ''), description=current.get('MEMO', ''))
+                    current = None
+                elif not closing:
+                    current, start = {}, line_no
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx}
+
+
+def detect_format(filename):
+    return 'ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv'
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _write_batch(account, chunk):
+    Transaction.objects.bulk_create(
+        [
+            Transaction(account=account, type=row['type'], name=row['name'], amount=row['amount'],
+                        date=row['date'], description=row['description'])
+            for row in chunk
+        ],
+        batch_size=len(chunk),
+    )
+    # bulk_create skips signals: apply one balance delta, one rollup delta per key
+    # and one checkpoint delta per month instead.
+    balance_delta = 0
+    rollup_deltas = defaultdict(lambda: [Decimal('0'), 0])
+    checkpoint_deltas = defaultdict(Decimal)
+    for row in chunk:
+        account_delta = balance_effects(row['type'], row['amount'], False)[0]
+        balance_delta += account_delta
+        checkpoint_deltas[balances.month_start(row['date'])] += account_delta
+        delta = rollup_deltas[(row['type'], rollups.rollup_day(row['date']))]
+        delta[0] += row['amount']
+        delta[1] += 1
+    if balance_delta:
+        Account.objects.filter(pk=account.pk).update(balance=F('balance') + balance_delta)
+    for (type, day), (amount, count) in rollup_deltas.items():
+        rollups.apply(account.pk, None, type, day, amount, count)
+    for month, delta in checkpoint_deltas.items():
+        balances.shift(account.pk, month, delta)
+
+
+def import_transactions(account, rows, batch_size=None):
+    """Insert ``rows`` into ``account`` in batches, all or nothing.
+
+    ``rows`` is consumed lazily, so memory is bounded by ``batch_size``.
+    A ``StatementError`` from any row rolls back every earlier batch.
+    """
+    batch_size = batch_size or get_batch_size()
+    started = time.perf_counter()
+    total = batches = 0
+    with db_transaction.atomic():
+        for chunk in _chunks(rows, batch_size):
+            _write_batch(account, chunk)
+            total += len(chunk)
+            batches += 1
+        caching.invalidate_user(account.user_id, ('summary',))
+    account.refresh_from_db(fields=['balance'])
+    return ImportResult(rows=total, batches=batches, seconds=time.perf_counter() - started)
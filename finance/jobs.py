@@ -0,0 +1,169 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKOFF = 30  # seconds before the first retry, doubled for each later one
+DEFAULT_MAX_BACKOFF = 60 * 60
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_LOCK_TIMEOUT = 30 * 60
+CLAIM_CANDIDATES = 10
+
+_tasks = {}
+
+
+class UnknownTask(LookupError):
+    pass
+
+
+class PermanentFailure(Exception):
+    """Raised by a task to fail its job at once instead of retrying."""
+
+
+def task(name, max_attempts=3):
+    """Register the decorated ``func(job)`` as task ``name``; its return value must be JSON-serializable."""
+    def register(func):
+        _tasks[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(name, user=None, payload=None, key='', run_at=None):
+    """Queue task ``name``, or return the already queued job with the same non-empty ``key``."""
+    if name not in _tasks:
+        raise UnknownTask(name)
+    if key:
+        # Not locked: a race leaves two queued jobs, and running both is harmless for keyed tasks.
+        existing = Job.objects.filter(task=name, key=key, status='queued').first()
+        if existing is not None:
+            return existing
+    return Job.objects.create(
+        task=name, key=key, user=user, payload=payload or {},
+        max_attempts=_tasks[name][1], run_at=run_at or timezone.now(),
+    )
+
+
+async def aenqueue(name, user=None, payload=None, key='', run_at=None):
+    # One thread hop for the check and the insert, so concurrent callers in
+    # the same request are serialized and still collapse onto one job.
+    return await sync_to_async(enqueue)(name, user, payload, key, run_at)
+
+
+def backoff(attempts):
+    base = _setting('JOB_RETRY_BACKOFF', DEFAULT_BACKOFF)
+    return timedelta(seconds=min(_setting('JOB_MAX_BACKOFF', DEFAULT_MAX_BACKOFF), base * 2 ** (attempts - 1)))
+
+
+def claim(worker_id):
+    """Atomically take the next due job for ``worker_id``, or return None.
+
+    Each candidate is claimed with a conditional UPDATE, so concurrent
+    workers (threads or processes) never run the same job twice.
+    """
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status='queued', run_at__lte=now)
+        .order_by('run_at', 'pk')
+        .values_list('pk', flat=True)[:CLAIM_CANDIDATES]
+    )
+    for pk in candidates:
+        claimed = Job.objects.filter(pk=pk, status='queued').update(
+            status='running', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def execute(job):
+    """Run a claimed job and record its outcome."""
+    func, _ = _tasks.get(job.task, (None, None))
+    try:
+        if func is None:
+            raise PermanentFailure(f"Unknown task {job.task!r}")
+        result = func(job)
+    except Exception as exc:
+        _failed(job, exc)
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status='succeeded', result=result, error='', locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+    return True
+
+
+def _failed(job, exc):
+    now = timezone.now()
+    error = ''.join(traceback.format_exception(exc)[-5:])
+    if isinstance(exc, PermanentFailure) or job.attempts >= job.max_attempts:
+        logger.error("Job %s failed after %s attempts: %s", job.pk, job.attempts, exc)
+        Job.objects.filter(pk=job.pk).update(status='failed', error=error, locked_by='', locked_at=None, finished_at=now)
+    else:
+        logger.warning("Job %s failed (attempt %s of %s), retrying: %s", job.pk, job.attempts, job.max_attempts, exc)
+        Job.objects.filter(pk=job.pk).update(status='queued', error=error, locked_by='', locked_at=None,
+                                             run_at=now + backoff(job.attempts))
+
+
+def requeue_stale():
+    """Return jobs whose worker died mid-run to the queue, or fail them if out of attempts."""
+    cutoff = timezone.now() - timedelta(seconds=_setting('JOB_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', error='Worker stopped responding.', locked_by='', locked_at=None, finished_at=timezone.now(),
+    )
+    return failed + stale.update(status='queued', locked_by='', locked_at=None)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(worker_id=None, burst=False, poll_interval=None, max_jobs=None, stop=None):
+    """Run jobs until ``stop()`` is true; with ``burst``, return once the queue is empty.
+
+    Returns the number of jobs run.
+    """
+    worker_id = worker_id or worker_name()
+    poll_interval = _setting('JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL) if poll_interval is None else poll_interval
+    done = 0
+    requeue_stale()
+    while not (stop and stop()) and (max_jobs is None or done < max_jobs):
+        job = claim(worker_id)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            requeue_stale()
+            continue
+        execute(job)
+        done += 1
+    return done
+
+
+def as_dict(job):
+    return {
+        'id': job.pk,
+        'task': job.task,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_at': job.run_at.isoformat(),
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+    }
@@ -0,0 +1,216 @@
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, rollups
+from .models import Account, Goal, Transaction
+
+TRANSFER_BATCH_SIZE = 1000
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+@dataclass
+class Transfer:
+    source: Account
+    destination: Account
+    amount: Decimal
+    name: str = ''
+    description: str = ''
+
+
+def balance_effects(type, amount, has_goal):
+    """Return ``(account_delta, goal_delta)`` for a transaction.
+
+    Income credits the account and expense debits it; a transfer leg's
+    amount is already signed. A goal-linked transaction moves the same
+    amount between the account and the goal.
+    """
+    if type in ('income', 'transfer'):
+        account_delta = amount
+    elif type == 'expense':
+        account_delta = -amount
+    else:
+        account_delta = 0
+    goal_delta = -account_delta if has_goal else 0
+    return account_delta, goal_delta
+
+
+def _apply(model, pk, delta, check_funds, field):
+    if not delta:
+        return
+    rows = model.objects.filter(pk=pk)
+    if check_funds and delta < 0:
+        # Conditional UPDATE: the balance check and the debit are one statement.
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    if not rows.update(**{field: F(field) + delta}):
+        raise InsufficientFunds(f"Insufficient {model._meta.verbose_name} funds.")
+
+
+def post(account, type, amount, *, goal=None, name='', description='', check_funds=False):
+    """Insert a Transaction and apply its balance changes in one database transaction.
+
+    With ``check_funds`` a debit that would take the account balance or goal
+    amount below zero raises ``InsufficientFunds`` and nothing is written.
+    Balances are updated with ``F()`` expressions, so concurrent posts never
+    overwrite each other; ``account`` and ``goal`` are refreshed afterwards.
+    """
+    account_delta, goal_delta = balance_effects(type, amount, goal is not None)
+    with db_transaction.atomic():
+        # Always touch the account row before the goal row to keep lock order stable.
+        _apply(Account, account.pk, account_delta, check_funds, 'balance')
+        if goal is not None:
+            _apply(Goal, goal.pk, goal_delta, check_funds, 'current_amount')
+        txn = Transaction.objects.create(
+            account=account,
+            goal=goal,
+            type=type,
+            name=name,
+            amount=amount,
+            description=description,
+        )
+    account.refresh_from_db(fields=['balance'])
+    if goal is not None:
+        goal.refresh_from_db(fields=['current_amount'])
+    return txn
+
+
+def _effects(txn, sign=1):
+    """Return ``{(model, pk): delta}`` for the rows ``txn`` moves, scaled by ``sign``."""
+    account_delta, goal_delta = balance_effects(txn.type, txn.amount, txn.goal_id is not None)
+    effects = {(Account, txn.account_id): sign * account_delta}
+    if txn.goal_id is not None:
+        effects[(Goal, txn.goal_id)] = sign * goal_delta
+    return effects
+
+
+def settle(deltas, check_funds=False):
+    """Apply ``{(Account or Goal, pk): delta}`` with one ``F()`` update per row.
+
+    Accounts go before goals and each in primary-key order, the lock order
+    post() and post_transfers() use.
+    """
+    for model, pk in sorted(deltas, key=lambda key: (key[0] is Goal, key[1])):
+        field = 'balance' if model is Account else 'current_amount'
+        _apply(model, pk, deltas[model, pk], check_funds, field)
+
+
+def settle_many(deltas):
+    """``settle`` without funds checks for large batches: one ``executemany`` per table."""
+    connection = connections[router.db_for_write(Account)]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model, field in ((Account, 'balance'), (Goal, 'current_amount')):
+            params = sorted((pk, delta) for (row_model, pk), delta in deltas.items() if row_model is model and delta)
+            if params:
+                table, column = quote(model._meta.db_table), quote(field)
+                cursor.executemany(f"UPDATE {table} SET {column} = {column} + %s WHERE id = %s",
+                                   [(delta, pk) for pk, delta in params])
+
+
+def amend(txn, *, check_funds=False):
+    """Save the edited ``txn`` and move balances by its difference from the stored row.
+
+    Changes of amount, type, account and goal all reduce to one net delta
+    per affected account or goal, applied with a single ``F()`` update each,
+    so an edit costs the same however long the history is. With
+    ``check_funds`` a debit below zero raises ``InsufficientFunds`` and the
+    edit is not saved.
+    """
+    with db_transaction.atomic():
+        stored = Transaction.objects.select_for_update().only('account_id', 'goal_id', 'type', 'amount').get(pk=txn.pk)
+        deltas = defaultdict(Decimal)
+        for effects in (_effects(stored, -1), _effects(txn)):
+            for key, delta in effects.items():
+                deltas[key] += delta
+        settle(deltas, check_funds)
+        txn.save()
+    return txn
+
+
+def remove(txn, *, check_funds=False):
+    """Delete ``txn`` and reverse its balance changes; a transfer leg takes its counterpart with it."""
+    rows = Transaction.objects.filter(transfer_id=txn.transfer_id) if txn.transfer_id else Transaction.objects.filter(pk=txn.pk)
+    with db_transaction.atomic():
+        removed = list(rows.select_for_update().order_by('pk'))
+        deltas = defaultdict(Decimal)
+        for row in removed:
+            for key, delta in _effects(row, -1).items():
+                deltas[key] += delta
+        settle(deltas, check_funds)
+        for row in removed:
+            row.delete()
+    return removed
+
+
+def _legs(transfer, transfer_id, now):
+    source, destination = transfer.source, transfer.destination
+    common = {'type': 'transfer', 'date': now, 'description': transfer.description, 'transfer_id': transfer_id}
+    return (
+        Transaction(account=source, amount=-transfer.amount,
+                    name=transfer.name or f"Transfer to {destination.name}", **common),
+        Transaction(account=destination, amount=transfer.amount,
+                    name=transfer.name or f"Transfer from {source.name}", **common),
+    )
+
+
+def post_transfers(transfers, *, check_funds=True):
+    """Settle ``transfers`` in one database transaction; return their ``(debit, credit)`` legs.
+
+    Each transfer becomes two 'transfer' transactions sharing a
+    ``transfer_id``: a negative leg on the source and a positive one on the
+    destination. The accounts are locked and updated in primary-key order, so
+    concurrent transfers over the same accounts cannot deadlock, and each
+    account gets one net balance update however many legs it has. With
+    ``check_funds`` an account whose net debit exceeds its balance raises
+    ``InsufficientFunds`` and nothing is written.
+    """
+    transfers = list(transfers)
+    for transfer in transfers:
+        if transfer.amount <= 0:
+            raise ValueError("Transfer amounts must be positive.")
+        if transfer.source.pk == transfer.destination.pk:
+            raise ValueError("Cannot transfer to the same account.")
+    now = timezone.now()
+    legs, deltas, accounts = [], defaultdict(Decimal), {}
+    for transfer in transfers:
+        legs += _legs(transfer, uuid.uuid4(), now)
+        deltas[transfer.source.pk] -= transfer.amount
+        deltas[transfer.destination.pk] += transfer.amount
+        accounts[transfer.source.pk] = transfer.source
+        accounts[transfer.destination.pk] = transfer.destination
+    with db_transaction.atomic():
+        # FOR UPDATE takes every row lock up front (SQLite's write lock already covers it).
+        list(Account.objects.select_for_update().filter(pk__in=deltas).order_by('pk').values_list('pk'))
+        for pk in sorted(deltas):
+            try:
+                _apply(Account, pk, deltas[pk], check_funds, 'balance')
+            except InsufficientFunds:
+                raise InsufficientFunds(f"Insufficient funds in {accounts[pk].name}.") from None
+        Transaction.objects.bulk_create(legs, batch_size=TRANSFER_BATCH_SIZE)
+        # bulk_create skips signals: one rollup delta per account instead.
+        day = rollups.rollup_day(now)
+        counts = defaultdict(int)
+        for leg in legs:
+            counts[leg.account_id] += 1
+        for pk, count in counts.items():
+            rollups.apply(pk, None, 'transfer', day, deltas[pk], count)
+        for user_id in {account.user_id for account in accounts.values()}:
+            caching.invalidate_user(user_id, ('summary',))
+    current = dict(Account.objects.filter(pk__in=deltas).values_list('pk', 'balance'))
+    for transfer in transfers:
+        transfer.source.balance = current[transfer.source.pk]
+        transfer.destination.balance = current[transfer.destination.pk]
+    return [tuple(legs[i:i + 2]) for i in range(0, len(legs), 2)]
+
+
+def transfer(source, destination, amount, *, name='', description='', check_funds=True):
+    """Move ``amount`` from ``source`` to ``destination`` atomically; return the two legs."""
+    return post_transfers([Transfer(source, destination, amount, name, description)], check_funds=check_funds)[0]
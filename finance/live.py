@@ -0,0 +1,354 @@
+import asyncio
+import io
+import json
+import logging
+import threading
+from collections import defaultdict
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.humanize.templatetags.humanize import intcomma
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.template.defaultfilters import floatformat
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from . import api, caching
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'finance.live.LocalBackend'
+DEFAULT_HEARTBEAT = 25.0
+RETRY_MS = 5000
+HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache, no-store'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def get_heartbeat():
+    return getattr(settings, 'LIVE_HEARTBEAT', DEFAULT_HEARTBEAT)
+
+
+class Subscription:
+    """One open stream: an event set whenever its user's data changes."""
+    __slots__ = ('user_id', 'closed', 'loop', 'event')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.closed = False
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def close(self):
+        self.closed = True
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self, timeout):
+        """Wait for a change (or ``close``); return False if ``timeout`` seconds pass first."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class Hub:
+    """The streams open in this process, by user id.
+
+    ``notify`` may be called from any thread. Changes coalesce: a stream
+    that falls behind reads the latest figures once, and the streams of one
+    user share a single read per change (see ``read``).
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._reads = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def _wake(self, targets):
+        by_loop = defaultdict(list)
+        for subscription in targets:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(self._changed, subscriptions)
+            except RuntimeError:  # the loop is gone
+                pass
+
+    def _changed(self, subscriptions):
+        # In the streams' loop. A read started before this change is stale, so
+        # forget it in the same step: the woken streams start a fresh one.
+        for subscription in subscriptions:
+            self._reads.pop(subscription.user_id, None)
+            subscription.event.set()
+
+    def notify(self, user_ids):
+        with self._lock:
+            targets = [s for user_id in set(user_ids) for s in self._subscriptions.get(user_id, ())]
+        self._wake(targets)
+
+    def notify_all(self):
+        with self._lock:
+            targets = [s for subscriptions in self._subscriptions.values() for s in subscriptions]
+        self._wake(targets)
+
+    def close(self):
+        """End every stream, e.g. on shutdown."""
+        with self._lock:
+            targets = [s for subscriptions in self._subscriptions.values() for s in subscriptions]
+        for subscription in targets:
+            subscription.close()
+
+    async def read(self, user, fetch):
+        """Return ``await fetch(user)``, sharing one call among the user's streams woken by the same change."""
+        loop = asyncio.get_running_loop()
+        read = self._reads.get(user.pk)
+        if read is None or read.get_loop() is not loop:
+            read = self._reads[user.pk] = loop.create_task(fetch(user))
+            read.add_done_callback(lambda task: self._reads.pop(user.pk, None) if self._reads.get(user.pk) is task else None)
+        # One stream going away must not cancel the read for the others.
+        return await asyncio.shield(read)
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    """Deliver changes to the streams of this process only: a single worker, or tests."""
+
+    def publish(self, user_ids):
+        hub.notify(user_ids)
+
+    def start(self):
+        pass
+
+
+class PostgresBackend(LocalBackend):
+    """Deliver changes to every worker through PostgreSQL LISTEN/NOTIFY.
+
+    Publishing is one ``pg_notify`` per commit on the writer's connection;
+    each worker with open streams keeps a single extra connection that
+    listens and wakes its own streams. Needs psycopg 3, which Django's
+    PostgreSQL backend already uses.
+    """
+    channel = 'finance_live'
+    # NOTIFY payloads must stay under 8000 bytes.
+    max_payload = 7000
+
+    def __init__(self, using='default'):
+        self.using = using
+        self._task = None
+
+    def publish(self, user_ids):
+        chunks, chunk = [], ''
+        for user_id in sorted(set(user_ids)):
+            if len(chunk) > self.max_payload:
+                chunks.append(chunk)
+                chunk = ''
+            chunk = f'{chunk},{user_id}' if chunk else str(user_id)
+        if chunk:
+            chunks.append(chunk)
+        with connections[self.using].cursor() as cursor:
+            for payload in chunks:
+                cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, payload])
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        import psycopg
+
+        params = connections[self.using].get_connection_params()
+        for name in ('cursor_factory', 'context', 'prepare_threshold'):
+            params.pop(name, None)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(autocommit=True, **params) as conn:
+                    await conn.execute(f"LISTEN {self.channel}")
+                    # Changes made while not listening were missed: have every stream re-read.
+                    hub.notify_all()
+                    async for notify in conn.notifies():
+                        hub.notify(int(user_id) for user_id in notify.payload.split(','))
+            except Exception:
+                logger.exception("Live updates listener failed; reconnecting")
+                await asyncio.sleep(RETRY_MS / 1000)
+
+
+_backend = (None, None)
+
+
+def get_backend():
+    global _backend
+    path = getattr(settings, 'LIVE_UPDATES_BACKEND', DEFAULT_BACKEND)
+    if _backend[0] != path:
+        _backend = (path, import_string(path)())
+    return _backend[1]
+
+
+def publish(user_ids):
+    """Tell the open streams of ``user_ids`` that their data changed; call after commit."""
+    get_backend().publish(user_ids)
+
+
+def _money(value):
+    return intcomma(floatformat(value, 2))
+
+
+def values(summary):
+    """The dashboard figures in ``summary`` (see ``api.build_summary``) as ``{key: text}``.
+
+    Keys match the page's ``data-live`` attributes; texts are formatted as
+    the template formats them.
+    """
+    values = {'total-income': _money(summary['total_income']), 'total-expense': _money(summary['total_expense'])}
+    for account in summary['accounts']:
+        values[f"account-{account['id']}-balance"] = _money(account['balance'])
+    for goal in summary['goals']:
+        values[f"goal-{goal['id']}-saved"] = _money(goal['current_amount'])
+        values[f"goal-{goal['id']}-target"] = _money(goal['target_amount'])
+        values[f"goal-{goal['id']}-progress"] = floatformat(min(100, goal['progress_percent']), 0)
+    return values
+
+
+def _release_connections():
+    # What request_finished does after a view. Streams share one sync thread,
+    # so its connections must not outlive CONN_MAX_AGE either; ones inside a
+    # transaction (tests) are left alone.
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
+
+
+def _authenticate(request):
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    try:
+        return auth.get_user(request)
+    finally:
+        _release_connections()
+
+
+def _current_values(user):
+    # The summary is shared with the API: one computation per change however many workers read it.
+    try:
+        return values(caching.cached(user, 'api-summary', api.build_summary))
+    finally:
+        _release_connections()
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+async def _until_disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _respond(send, status, text):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': text.encode()})
+
+
+class LiveUpdates:
+    """ASGI middleware serving the ``live-updates`` event stream in front of Django.
+
+    On connect a stream sends every dashboard figure, then only the ones
+    that changed whenever its user's data does (``event: patch``), or
+    ``event: reload`` when accounts or goals were added or removed. Idle, a
+    stream is a coroutine waiting on an ``asyncio.Event``, another waiting
+    for the client to disconnect and a heartbeat comment every
+    ``LIVE_HEARTBEAT`` seconds: unlike a Django view it holds no request
+    thread or database connection, so a worker can keep thousands open.
+    Everything else is passed to ``app``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.path = reverse('live-updates')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            path, root = scope['path'], scope.get('root_path', '')
+            if (path[len(root):] if root and path.startswith(root) else path) == self.path:
+                return await self.stream(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Open streams would otherwise keep the worker from exiting.
+                hub.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def stream(self, scope, receive, send):
+        request = ASGIRequest(scope, io.BytesIO())
+        if request.method != 'GET':
+            return await _respond(send, 405, "Method not allowed.")
+        try:
+            request.get_host()
+        except DisallowedHost:
+            return await _respond(send, 400, "Bad request.")
+        user = await sync_to_async(_authenticate)(request)
+        if not user.is_authenticated:
+            # EventSource does not reconnect after an error status.
+            return await _respond(send, 401, "Authentication required.")
+
+        subscription = hub.subscribe(user.pk)
+        get_backend().start()
+        disconnected = asyncio.ensure_future(_until_disconnected(receive))
+        disconnected.add_done_callback(lambda task: subscription.close())
+        heartbeat = get_heartbeat()
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+            await send({'type': 'http.response.body', 'body': f'retry: {RETRY_MS}\n\n'.encode(), 'more_body': True})
+            sent = None
+            while not subscription.closed:
+                current = await hub.read(user, sync_to_async(_current_values))
+                if sent is not None and current.keys() != sent.keys():
+                    await send({'type': 'http.response.body', 'body': _event('reload', {}), 'more_body': True})
+                    break
+                changed = {key: text for key, text in current.items() if sent is None or sent[key] != text}
+                if changed:
+                    await send({'type': 'http.response.body', 'body': _event('patch', changed), 'more_body': True})
+                sent = current
+                while not await subscription.wait(heartbeat):
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+        finally:
+            hub.unsubscribe(subscription)
+            gone = disconnected.done()
+            disconnected.cancel()
+        if not gone:
+            await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,72 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from finance import archive
+from finance.models import Transaction
+
+
+def _median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def _probe(user_id, repeat):
+    # The two per-user reads the archive is meant to speed up: a full count and the first list page.
+    transactions = Transaction.objects.filter(account__user_id=user_id)
+    return (
+        _median_ms(transactions.count, repeat),
+        _median_ms(lambda: list(transactions.order_by('-date', '-id')[:50]), repeat),
+    )
+
+
+def _mib(size):
+    return f"{size / 1024 / 1024:.1f} MiB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transactions older than ARCHIVE_AFTER_DAYS into compressed per-account monthly archive "
+        "batches, then report the space and query time saved. Safe to run repeatedly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Archive after this many days (default: ARCHIVE_AFTER_DAYS).")
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many account-months.")
+        parser.add_argument('--compact', action='store_true', help="VACUUM afterwards so the file actually shrinks.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per latency probe.")
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(days=options['days'])
+        busiest = (
+            Transaction.objects.values('account__user').annotate(count=Count('id'))
+            .order_by('-count').values_list('account__user', flat=True).first()
+        )
+        size_before = archive.database_size()
+        latency_before = _probe(busiest, options['repeat']) if busiest else None
+
+        result = archive.archive(before=before, max_batches=options['max_batches'])
+        if options['compact'] and not archive.compact():
+            self.stderr.write("Skipped compaction: VACUUM cannot run inside a transaction.")
+
+        size_after = archive.database_size()
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result.rows} transactions dated before {before:%Y-%m-%d} "
+            f"in {result.batches} account-months ({result.seconds:.2f}s)."
+        ))
+        self.stdout.write(
+            f"Primary database: {_mib(size_before[0])} used, {_mib(size_before[1])} free -> "
+            f"{_mib(size_after[0])} used, {_mib(size_after[1])} free."
+        )
+        if latency_before:
+            count_after, page_after = _probe(busiest, options['repeat'])
+            self.stdout.write(
+                f"Busiest user ({busiest}): count {latency_before[0]:.1f} -> {count_after:.1f} ms, "
+                f"first page {latency_before[1]:.1f} -> {page_after:.1f} ms."
+            )
@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from finance import ledger
+from finance.models import Account
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent deposit throughput under each SQLite profile in SQLITE_PROFILES. "
+        "Each profile runs in a subprocess against a fresh temporary database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--posts', type=int, default=100, help="Deposits per thread.")
+        parser.add_argument('--profiles', nargs='+', default=['default', 'tuned'])
+        parser.add_argument('--worker', action='store_true', help="Internal: run one profile against the configured database.")
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.work(options['threads'], options['posts'])))
+            return
+        unknown = set(options['profiles']) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+        results = {profile: self.run_profile(profile, options) for profile in options['profiles']}
+        if 'default' in results and 'tuned' in results and results['default']['posts_per_second']:
+            results['speedup'] = round(results['tuned']['posts_per_second'] / results['default']['posts_per_second'], 2)
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run_profile(self, profile, options):
+        manage = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py')]
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, 'AMF_DB_PROFILE': profile, 'AMF_DB_NAME': str(Path(tmp) / 'bench.sqlite3')}
+            subprocess.run(manage + ['migrate', '--verbosity', '0'], env=env, check=True)
+            worker = subprocess.run(
+                manage + ['bench_sqlite_writers', '--worker', '--threads', str(options['threads']), '--posts', str(options['posts'])],
+                env=env, check=True, capture_output=True, text=True,
+            )
+        return json.loads(worker.stdout)
+
+    def work(self, threads, posts):
+        user = User.objects.create_user('bench-writer')
+        account = Account.objects.create(user=user, name='Bench')
+        connection.close()
+        errors = []
+        latencies = []
+        lock = threading.Lock()
+
+        def writer():
+            local = Account.objects.get(pk=account.pk)
+            try:
+                for _ in range(posts):
+                    started = time.perf_counter()
+                    try:
+                        ledger.post(local, 'income', Decimal('1.00'), name='Bench deposit')
+                    except OperationalError as exc:
+                        with lock:
+                            errors.append(str(exc))
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        account.refresh_from_db()
+        return {
+            'journal_mode': connection.cursor().execute('PRAGMA journal_mode').fetchone()[0],
+            'threads': threads,
+            'attempted': threads * posts,
+            'committed': len(latencies),
+            'locked_errors': len(errors),
+            'balance_matches': account.balance == len(latencies),
+            'seconds': round(elapsed, 3),
+            'posts_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3) if latencies else None,
+        }
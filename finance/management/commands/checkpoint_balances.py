@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from finance import balances
+
+
+class Command(BaseCommand):
+    help = "Write month-start balance checkpoints for every account (run monthly, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        written = balances.checkpoint_all()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} balance checkpoints."))
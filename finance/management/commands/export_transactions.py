@@ -0,0 +1,69 @@
+import sys
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from finance import archive, exports
+from finance.models import Account, Transaction, TransactionArchive
+
+
+def _day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Stream transactions as CSV or JSONL, optionally gzip-compressed, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--user', help="Only export this username's transactions.")
+        parser.add_argument('--account', type=int, action='append', help="Account id; may be repeated.")
+        parser.add_argument('--date-from', type=_day)
+        parser.add_argument('--date-to', type=_day)
+        parser.add_argument('--chunk-size', type=int, default=exports.EXPORT_CHUNK_SIZE)
+        parser.add_argument('--output', '-o', help="Write to this file instead of stdout.")
+
+    def _histories(self, options, start, end):
+        # One archive.History per user, or per account when accounts are given.
+        if options['account']:
+            accounts = Account.objects.filter(pk__in=options['account']).select_related('user').order_by('pk')
+            if options['user']:
+                accounts = accounts.filter(user__username=options['user'])
+            return [archive.History(account.user, account=account, start=start, end=end) for account in accounts]
+        users = User.objects.filter(pk__in=TransactionArchive.objects.values('user_id')).order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+        return [archive.History(user, start=start, end=end) for user in users]
+
+    def handle(self, *args, **options):
+        start = end = None
+        transactions = Transaction.objects.all()
+        if options['user']:
+            transactions = transactions.filter(account__user__username=options['user'])
+        if options['account']:
+            transactions = transactions.filter(account__in=options['account'])
+        if options['date_from']:
+            start = timezone.make_aware(datetime.combine(options['date_from'], time.min))
+            transactions = transactions.filter(date__gte=start)
+        if options['date_to']:
+            end = timezone.make_aware(datetime.combine(options['date_to'] + timedelta(days=1), time.min))
+            transactions = transactions.filter(date__lt=end)
+
+        history = self._histories(options, start, end)
+        chunks = exports.export_transactions(transactions, options['format'], options['gzip'], options['chunk_size'], history=history)
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        elif options['gzip']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.importers import PARSERS, StatementError, detect_format, get_batch_size, import_transactions
+from finance.models import Account
+
+
+class Command(BaseCommand):
+    help = "Import a CSV or OFX bank statement into an account in batches, all or nothing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--account', type=int, required=True, help="Account id to import into.")
+        parser.add_argument('--format', choices=sorted(PARSERS), help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(pk=options['account'])
+        except Account.DoesNotExist:
+            raise CommandError(f"Account {options['account']} does not exist.")
+        parser = PARSERS[options['format'] or detect_format(options['path'])]
+        batch_size = options['batch_size'] or get_batch_size()
+        with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            try:
+                result = import_transactions(account, parser(lines), batch_size=batch_size)
+            except StatementError as exc:
+                raise CommandError(f"Import rolled back. {exc}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.rows} rows in {result.batches} batches of {batch_size} "
+            f"in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/s). "
+            f"New balance: {account.balance}"
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily/monthly transaction rollups from scratch and verify them against Transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check-only', action='store_true', help="Only verify the existing rollups.")
+        parser.add_argument('--batch-size', type=int, default=rollups.REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not options['check_only']:
+            rollups.rebuild(batch_size=options['batch_size'])
+            self.stdout.write("Rollups rebuilt.")
+        mismatches = rollups.verify()
+        for level, key, expected, actual in mismatches[:20]:
+            self.stderr.write(f"{level} {key}: expected {expected}, found {actual}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} rollup rows disagree with Transaction.")
+        self.stdout.write(self.style.SUCCESS("Rollups match Transaction."))
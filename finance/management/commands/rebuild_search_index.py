@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from finance.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Repopulate the SQLite full-text search index from the transaction table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        rows = rebuild_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {rows} transactions."))
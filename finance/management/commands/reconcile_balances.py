@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from finance import balances
+
+
+class Command(BaseCommand):
+    help = "Check each account balance against its latest checkpoint plus the transactions since."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Also check every checkpoint against the full ledger (reads all transactions).")
+
+    def handle(self, *args, **options):
+        problems = [
+            f"account {account.pk}: expected {expected}, found {actual}"
+            for account, expected, actual in balances.reconcile()
+        ]
+        if options['full']:
+            problems += [
+                f"account {account_id} checkpoint {as_of:%Y-%m-%d}: expected {expected}, found {actual}"
+                for account_id, as_of, expected, actual in balances.verify_checkpoints()
+            ]
+        for problem in problems[:20]:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f"{len(problems)} balances disagree with the ledger.")
+        self.stdout.write(self.style.SUCCESS("Account balances match the ledger."))
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from finance import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic finance data and measure p50/p95/p99 latency, throughput and "
+        "queries per request for the main views. Prints machine-readable JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--accounts', type=int, default=3, help="Accounts per user.")
+        parser.add_argument('--goals', type=int, default=2, help="Goals per account.")
+        parser.add_argument('--transactions', type=int, default=10000, help="Transactions per user.")
+        parser.add_argument('--requests', type=int, default=50, help="Measured requests per view per user.")
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--cold-cache', action='store_true', help="Clear the summary cache before every request.")
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help="Also compare the WSGI and ASGI paths with this many read requests in flight.")
+        parser.add_argument('--transfers', type=int, default=0,
+                            help="Also measure transfer throughput with this many transfers per mode per user.")
+        parser.add_argument('--live-streams', type=int, default=0,
+                            help="Also measure the cost of this many idle live-update streams.")
+        parser.add_argument('--output', '-o', help="Write the JSON report to this file.")
+        parser.add_argument('--use-current-db', action='store_true',
+                            help="Write the synthetic data to the configured database instead of a throwaway test database.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = None
+        if not options['use_current_db']:
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(output + '\n')
+        self.stdout.write(output)
+
+    def run(self, options):
+        users = benchmarks.generate(
+            users=options['users'],
+            accounts_per_user=options['accounts'],
+            goals_per_account=options['goals'],
+            transactions_per_user=options['transactions'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        report = {
+            'environment': benchmarks.environment(),
+            'parameters': {key: options[key] for key in (
+                'users', 'accounts', 'goals', 'transactions', 'requests', 'warmup', 'seed', 'cold_cache', 'concurrency', 'transfers', 'live_streams')},
+            'scenarios': benchmarks.run(users, options['requests'], options['warmup'], options['cold_cache']),
+            'analytics': benchmarks.run_analytics(users),
+        }
+        if options['concurrency']:
+            report['interfaces'] = benchmarks.run_concurrent(users, options['requests'], options['concurrency'])
+        if options['transfers']:
+            report['transfers'] = benchmarks.run_transfers(users, options['transfers'], min(100, options['transfers']))
+        if options['live_streams']:
+            report['live'] = benchmarks.run_live(users, options['live_streams'])
+        return report
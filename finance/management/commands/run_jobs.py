@@ -0,0 +1,51 @@
+import multiprocessing
+import signal
+import threading
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from finance import jobs
+
+
+def _worker_main(index, burst, poll_interval, max_jobs):
+    django.setup()  # no-op after fork; required with the spawn start method
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    jobs.work(f"{jobs.worker_name()}/{index}", burst=burst, poll_interval=poll_interval,
+              max_jobs=max_jobs, stop=stop.is_set)
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (report refreshes, large statement imports) in worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Worker processes (default: JOB_WORKER_PROCESSES).")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=None)
+        parser.add_argument('--max-jobs', type=int, default=None, help="Jobs per process before it exits.")
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or getattr(settings, 'JOB_WORKER_PROCESSES', 1)
+        worker_args = (options['burst'], options['poll_interval'], options['max_jobs'])
+        if processes == 1:
+            done = jobs.work(burst=options['burst'], poll_interval=options['poll_interval'], max_jobs=options['max_jobs'])
+            self.stdout.write(self.style.SUCCESS(f"Ran {done} jobs."))
+            return
+        # Children must open their own database connections.
+        connections.close_all()
+        workers = [multiprocessing.Process(target=_worker_main, args=(i, *worker_args)) for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+        self.stdout.write(self.style.SUCCESS(f"{processes} workers stopped."))
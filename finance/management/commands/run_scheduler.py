@@ -0,0 +1,38 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from finance import recurring
+
+
+class Command(BaseCommand):
+    help = (
+        "Post due recurring transactions, catching up on any missed while the scheduler was down. "
+        "Runs until stopped, or once with --once (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single tick and exit.")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Seconds between ticks (default: RECURRING_POLL_INTERVAL).")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Rules per database transaction (default: RECURRING_BATCH_SIZE).")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if not options['once']:
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+            signal.signal(signal.SIGINT, lambda *args: stop.set())
+        interval = options['interval'] or recurring.get_poll_interval()
+        while not stop.is_set():
+            result = recurring.tick(batch_size=options['batch_size'])
+            if result.rules or options['once']:
+                rate = result.rules / result.seconds if result.seconds else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f"Posted {result.transactions} transactions from {result.rules} rules "
+                    f"in {result.batches} batches ({result.seconds:.2f}s, {rate:,.0f} rules/s)."
+                ))
+            if options['once']:
+                break
+            stop.wait(interval)
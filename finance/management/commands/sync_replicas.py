@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from finance.routers import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Stand-in replication for local development: copy the primary SQLite database "
+        "to every replica with SQLite's online backup API. Use --interval to repeat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="Seconds between syncs; 0 syncs once.")
+        parser.add_argument('--target', action='append', help="Copy to this file instead of the configured replicas.")
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replicas only handles SQLite; use the database's own replication elsewhere.")
+        targets = options['target'] or [settings.DATABASES[alias]['NAME'] for alias in replicas()]
+        if not targets:
+            raise CommandError("No replicas configured. Set AMF_DB_REPLICAS or pass --target.")
+        while True:
+            started = time.perf_counter()
+            primary.ensure_connection()
+            for target in targets:
+                with sqlite3.connect(str(target)) as replica:
+                    primary.connection.backup(replica)
+                replica.close()
+            self.stdout.write(f"Synced {len(targets)} replica(s) in {time.perf_counter() - started:.3f}s.")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_SIZE = 1000
+METRICS = ('queries', 'sql_ms', 'template_ms', 'total_ms')
+
+_current = ContextVar('finance_request_timings', default=None)
+_samples = defaultdict(lambda: {metric: deque(maxlen=_sample_size()) for metric in METRICS})
+_samples_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _sample_size():
+    return getattr(settings, 'PERF_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE)
+
+
+class _Timings:
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(); counts every statement, DEBUG or not.
+        if _current.get() is not self:
+            # Another request sharing this thread's connections.
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+
+_original_render = DjangoTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    timings = _current.get()
+    if timings is None:
+        return _original_render(self, context, request)
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        timings.template += time.perf_counter() - started
+
+
+DjangoTemplate.render = _timed_render
+
+
+def record(name, sample):
+    with _samples_lock:
+        series = _samples[name]
+        for metric in METRICS:
+            series[metric].append(sample[metric])
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def snapshot():
+    """Return ``{url_name: {metric: {count, p50, p95, p99, max}}}`` over the rolling window."""
+    with _samples_lock:
+        copied = {name: {metric: sorted(values) for metric, values in series.items()} for name, series in _samples.items()}
+    return {
+        name: {
+            metric: {
+                'count': len(values),
+                'p50': _percentile(values, 0.50),
+                'p95': _percentile(values, 0.95),
+                'p99': _percentile(values, 0.99),
+                'max': values[-1],
+            }
+            for metric, values in series.items() if values
+        }
+        for name, series in copied.items()
+    }
+
+
+def reset():
+    with _samples_lock:
+        _samples.clear()
+
+
+def _wrap_connections(timings):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timings))
+    return stack
+
+
+class PerformanceMiddleware:
+    """Record query count, SQL time, template time and wall time per URL name.
+
+    The numbers go into a ``Server-Timing`` header and a rolling in-process
+    window read by the staff-only ``performance-stats`` view. With
+    ``PERF_STRICT`` a view that runs more queries than its entry in
+    ``PERF_QUERY_BUDGETS`` raises ``QueryBudgetExceeded``; otherwise it is logged.
+    Works under both WSGI and ASGI without forcing async views onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = _Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with _wrap_connections(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings = _Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            # Connections belong to the thread that uses them, and async ORM
+            # calls run in the request's thread-sensitive executor: install the
+            # wrappers there, not on the event loop's own connections.
+            stack = await sync_to_async(_wrap_connections)(timings)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, started)
+
+    def _finish(self, request, response, timings, started):
+        total = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else None
+        if name is None:
+            return response
+        sample = {
+            'queries': timings.queries,
+            'sql_ms': round(timings.sql * 1000, 3),
+            'template_ms': round(timings.template * 1000, 3),
+            'total_ms': round(total * 1000, 3),
+        }
+        record(name, sample)
+        response['Server-Timing'] = (
+            f'db;dur={sample["sql_ms"]};desc="{timings.queries} queries", '
+            f'tpl;dur={sample["template_ms"]}, total;dur={sample["total_ms"]}'
+        )
+        self._check_budget(name, timings.queries)
+        return response
+
+    def _check_budget(self, name, queries):
+        budget = getattr(settings, 'PERF_QUERY_BUDGETS', {}).get(name)
+        if budget is None or queries <= budget:
+            return
+        message = f"View {name!r} ran {queries} queries, over its budget of {budget}."
+        if getattr(settings, 'PERF_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
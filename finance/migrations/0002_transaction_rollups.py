@@ -0,0 +1,71 @@
+# Generated by Django 5.1.15 on 2026-10-18 08:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+
+
+def populate_rollups(apps, schema_editor):
+    Transaction = apps.get_model('finance', 'Transaction')
+    DailyRollup = apps.get_model('finance', 'DailyRollup')
+    MonthlyRollup = apps.get_model('finance', 'MonthlyRollup')
+    daily = (
+        Transaction.objects.values('account', 'goal', 'type', day=TruncDate('date'))
+        .order_by()
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(account_id=r['account'], goal_id=r['goal'], type=r['type'], day=r['day'], total=r['total'], count=r['count']) for r in daily],
+        batch_size=1000,
+    )
+    monthly = (
+        DailyRollup.objects.values('account', 'goal', 'type', month=TruncMonth('day'))
+        .order_by()
+        .annotate(total=Sum('total'), count=Sum('count'))
+    )
+    MonthlyRollup.objects.bulk_create(
+        [MonthlyRollup(account_id=r['account'], goal_id=r['goal'], type=r['type'], month=r['month'], total=r['total'], count=r['count']) for r in monthly],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense'), ('transfer', 'Transfer'), ('goal_deposit', 'Goal Deposit'), ('goal_withdrawal', 'Goal Withdrawal')], max_length=15)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='finance.account')),
+                ('goal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='finance.goal')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('goal__isnull', False)), fields=('account', 'goal', 'type', 'day'), name='daily_rollup_goal_key'), models.UniqueConstraint(condition=models.Q(('goal__isnull', True)), fields=('account', 'type', 'day'), name='daily_rollup_account_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('income', 'Income'), ('expense', 'Expense'), ('transfer', 'Transfer'), ('goal_deposit', 'Goal Deposit'), ('goal_withdrawal', 'Goal Withdrawal')], max_length=15)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('month', models.DateField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='finance.account')),
+                ('goal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to='finance.goal')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('goal__isnull', False)), fields=('account', 'goal', 'type', 'month'), name='monthly_rollup_goal_key'), models.UniqueConstraint(condition=models.Q(('goal__isnull', True)), fields=('account', 'type', 'month'), name='monthly_rollup_account_key')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
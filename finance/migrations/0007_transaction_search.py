@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# SQLite: a standalone FTS5 table keyed by transaction id. Besides name and
+# description it indexes owner, account and type as tokens ("u5 a42 texpense")
+# so per-user and per-account filters are answered by the full-text index.
+SQLITE_TAGS = "'u' || a.user_id || ' a' || {t}.account_id || ' t' || {t}.type"
+SQLITE_INSERT = (
+    "INSERT INTO finance_transaction_search(rowid, name, description, tags) "
+    "SELECT {t}.id, {t}.name, {t}.description, " + SQLITE_TAGS + " "
+    "FROM finance_account a WHERE a.id = {t}.account_id"
+)
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE finance_transaction_search USING fts5("
+    "name, description, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE TRIGGER finance_transaction_search_ai AFTER INSERT ON finance_transaction BEGIN "
+    + SQLITE_INSERT.format(t='new') + "; END",
+    "CREATE TRIGGER finance_transaction_search_ad AFTER DELETE ON finance_transaction BEGIN "
+    "DELETE FROM finance_transaction_search WHERE rowid = old.id; END",
+    "CREATE TRIGGER finance_transaction_search_au AFTER UPDATE OF name, description, account_id, type "
+    "ON finance_transaction BEGIN "
+    "DELETE FROM finance_transaction_search WHERE rowid = old.id; "
+    + SQLITE_INSERT.format(t='new') + "; END",
+    "INSERT INTO finance_transaction_search(rowid, name, description, tags) "
+    "SELECT t.id, t.name, t.description, " + SQLITE_TAGS.format(t='t') + " "
+    "FROM finance_transaction t JOIN finance_account a ON a.id = t.account_id",
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS finance_transaction_search_ai",
+    "DROP TRIGGER IF EXISTS finance_transaction_search_ad",
+    "DROP TRIGGER IF EXISTS finance_transaction_search_au",
+    "DROP TABLE IF EXISTS finance_transaction_search",
+]
+
+# PostgreSQL: a generated tsvector column with a GIN index, name weighted above description.
+POSTGRESQL_FORWARD = [
+    "ALTER TABLE finance_transaction ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX finance_transaction_search_idx ON finance_transaction USING GIN (search_vector)",
+]
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS finance_transaction_search_idx",
+    "ALTER TABLE finance_transaction DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-18 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0008_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField()),
+                ('month', models.DateField()),
+                ('count', models.IntegerField()),
+                ('net', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('min_id', models.BigIntegerField()),
+                ('max_id', models.BigIntegerField()),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'month'], name='txn_archive_user_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('account_id', 'month'), name='transaction_archive_key')],
+            },
+        ),
+    ]
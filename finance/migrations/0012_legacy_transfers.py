@@ -0,0 +1,74 @@
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connections, migrations, router
+from django.db.models import F
+from django.utils import timezone
+
+ZERO = Decimal('0')
+# Position of each field in an archived row (see finance.archive).
+GOAL, TYPE, AMOUNT, DATE, DESCRIPTION, TRANSFER = 1, 2, 4, 5, 6, 7
+SIGN = {'income': 1, 'transfer': 1, 'expense': -1}
+
+
+def _note(description, amount):
+    note = f"Recorded as a {amount} transfer before transfers moved money; it never changed the balance."
+    return f"{description}\n{note}" if description else note
+
+
+def _unlinked(row):
+    # Rows archived before 0010 have no transfer_id field.
+    return len(row) <= TRANSFER or row[TRANSFER] is None
+
+
+def _unrollup(apps, using, account_id, goal_id, day, amount):
+    key = {'account_id': account_id, 'goal_id': goal_id, 'type': 'transfer'}
+    apps.get_model('finance', 'DailyRollup').objects.using(using).filter(**key, day=day).update(total=F('total') - amount)
+    apps.get_model('finance', 'MonthlyRollup').objects.using(using).filter(**key, month=day.replace(day=1)).update(total=F('total') - amount)
+
+
+def zero_legacy_transfers(apps, schema_editor):
+    # Before 0010 a 'transfer' was one unsigned row that left the balance
+    # alone. Transfer amounts are signed balance changes now, so those rows
+    # would count as credits in rollups, checkpoints and the archive: keep
+    # them, with the old amount noted, as zero-amount transfers.
+    using = schema_editor.connection.alias
+    Transaction = apps.get_model('finance', 'Transaction')
+    legacy = Transaction.objects.using(using).filter(type='transfer', transfer_id__isnull=True).exclude(amount=0)
+    for txn in legacy.iterator():
+        _unrollup(apps, using, txn.account_id, txn.goal_id, timezone.localdate(txn.date), txn.amount)
+        txn.description = _note(txn.description, txn.amount)
+        txn.amount = ZERO
+        txn.save(update_fields=['amount', 'description'])
+
+    # Archived rows are still counted in the rollups.
+    TransactionArchive = apps.get_model('finance', 'TransactionArchive')
+    archive = router.db_for_write(TransactionArchive)
+    if using != router.db_for_write(Transaction) or TransactionArchive._meta.db_table not in connections[archive].introspection.table_names():
+        return
+    for batch in TransactionArchive.objects.using(archive).iterator():
+        rows = json.loads(zlib.decompress(bytes(batch.data)))
+        legacy = [row for row in rows if row[TYPE] == 'transfer' and _unlinked(row) and Decimal(row[AMOUNT])]
+        if not legacy:
+            continue
+        for row in legacy:
+            amount = Decimal(row[AMOUNT])
+            _unrollup(apps, using, batch.account_id, row[GOAL], timezone.localdate(datetime.fromisoformat(row[DATE])), amount)
+            row[DESCRIPTION] = _note(row[DESCRIPTION], amount)
+            row[AMOUNT] = '0.00'
+        batch.net = sum((SIGN.get(row[TYPE], 0) * Decimal(row[AMOUNT]) for row in rows), ZERO)
+        batch.data = zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 6)
+        batch.save(update_fields=['net', 'data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_recurring_transactions'),
+    ]
+
+    operations = [
+        migrations.RunPython(zero_legacy_transfers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_legacy_transfers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['type', 'goal', 'name', 'account', 'amount'], name='txn_spend_name_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Account(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='accounts')
@@ -39,9 +40,189 @@ class Transaction(models.Model):
     type = models.CharField(max_length=15, choices=TRANSACTION_TYPES)
     name = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(default=timezone.now)
     description = models.TextField(blank=True)
     goal = models.ForeignKey('Goal', null=True, blank=True, on_delete=models.SET_NULL, related_name='transactions')
+    # Shared by the two legs of a transfer; the debit leg's amount is negative.
+    transfer_id = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'date'], name='txn_account_date_idx'),
+            models.Index(fields=['goal', 'date'], name='txn_goal_date_idx'),
+            models.Index(fields=['transfer_id'], name='txn_transfer_idx'),
+            # Covers the per-name spending totals in analytics.
+            models.Index(fields=['type', 'goal', 'name', 'account', 'amount'], name='txn_spend_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_type_display()}: {self.amount} on {self.date})"
+
+class RollupBase(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='%(class)ss')
+    goal = models.ForeignKey(Goal, null=True, blank=True, on_delete=models.CASCADE, related_name='%(class)ss')
+    type = models.CharField(max_length=15, choices=Transaction.TRANSACTION_TYPES)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyRollup(RollupBase):
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'goal', 'type', 'day'], condition=models.Q(goal__isnull=False), name='daily_rollup_goal_key'),
+            models.UniqueConstraint(fields=['account', 'type', 'day'], condition=models.Q(goal__isnull=True), name='daily_rollup_account_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.account_id}/{self.goal_id} {self.type} {self.day}: {self.total}"
+
+
+class MonthlyRollup(RollupBase):
+    month = models.DateField()  # first day of the month
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'goal', 'type', 'month'], condition=models.Q(goal__isnull=False), name='monthly_rollup_goal_key'),
+            models.UniqueConstraint(fields=['account', 'type', 'month'], condition=models.Q(goal__isnull=True), name='monthly_rollup_account_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.account_id}/{self.goal_id} {self.type} {self.month:%Y-%m}: {self.total}"
+
+
+class BalanceCheckpoint(models.Model):
+    """``account``'s balance counting every transaction dated before ``as_of`` (a month start)."""
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'as_of'], name='balance_checkpoint_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.account_id} @ {self.as_of:%Y-%m-%d}: {self.balance}"
+
+class TransactionArchive(models.Model):
+    """One account's transactions for one month, moved out of the hot table.
+
+    ``data`` is zlib-compressed JSON. Ids are plain integers rather than
+    foreign keys because the archive may live in its own database.
+    """
+    account_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    month = models.DateField()  # first day of the month
+    count = models.IntegerField()
+    net = models.DecimalField(max_digits=14, decimal_places=2)  # income minus expense
+    min_id = models.BigIntegerField()
+    max_id = models.BigIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account_id', 'month'], name='transaction_archive_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user_id', 'month'], name='txn_archive_user_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account_id} {self.month:%Y-%m}: {self.count} transactions"
+
+class RecurringTransaction(models.Model):
+    """Posts the same transaction every ``every`` ``interval`` from ``starts_at``.
+
+    ``runs`` counts the occurrences posted so far and ``next_run`` is the
+    time of the next one; the scheduler advances both in the same database
+    transaction that posts the occurrences.
+    """
+    TYPES = [
+        ('income', 'Income'),
+        ('expense', 'Expense'),
+    ]
+    INTERVALS = [
+        ('daily', 'Day'),
+        ('weekly', 'Week'),
+        ('monthly', 'Month'),
+        ('yearly', 'Year'),
+    ]
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='recurring_transactions')
+    goal = models.ForeignKey(Goal, null=True, blank=True, on_delete=models.SET_NULL, related_name='recurring_transactions')
+    type = models.CharField(max_length=15, choices=TYPES)
+    name = models.CharField(max_length=100)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.TextField(blank=True)
+    interval = models.CharField(max_length=10, choices=INTERVALS, default='monthly')
+    every = models.PositiveSmallIntegerField(default=1)
+    starts_at = models.DateTimeField(default=timezone.now)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    runs = models.PositiveIntegerField(default=0)
+    next_run = models.DateTimeField()
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Only rules that can still run: the due query is a range scan of this index.
+            models.Index(fields=['next_run'], name='recurring_due_idx', condition=models.Q(active=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_type_display()}: {self.amount} every {self.every} {self.get_interval_display().lower()})"
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    location = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.path})"
+
+
+class Job(models.Model):
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    task = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, blank=True)  # collapses duplicate queued jobs
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            models.Index(fields=['task', 'key', 'status'], name='job_task_key_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.name} ({self.get_type_display()}: {self.amount} on {self.date})"
\ No newline at end of file
+        return f"{self.task} #{self.pk} ({self.status})"
@@ -0,0 +1,121 @@
+import asyncio
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+
+from . import forecasting, rollups
+from .models import Account, Goal, Transaction
+
+
+def _report_querysets(user):
+    accounts = Account.objects.filter(user=user).annotate(goal_count=Count('goals'))
+    goals = Goal.objects.filter(account__user=user).select_related('account')
+    return accounts, goals
+
+
+def _report(accounts, goals, account_totals, goal_totals):
+    empty = {'income': None, 'expense': None, 'count': 0}
+
+    # Account summaries
+    account_summaries = []
+    for account in accounts:
+        totals = account_totals.get(account.pk, empty)
+        account_summaries.append({
+            'account': account,
+            'income': totals['income'] or 0,
+            'expense': totals['expense'] or 0,
+            'goal_count': account.goal_count,
+            'balance': account.balance,
+        })
+    # Goal summaries
+    goal_summaries = []
+    for goal in goals:
+        totals = goal_totals.get(goal.pk, empty)
+        percent = round(goal.current_amount / goal.target_amount * 100, 2) if goal.target_amount and goal.target_amount > 0 else 0
+        goal_summaries.append({
+            'goal': goal,
+            'account': goal.account,
+            'current_amount': goal.current_amount,
+            'target_amount': goal.target_amount,
+            'deposit': totals['expense'] or 0,
+            'withdraw': totals['income'] or 0,
+            'progress_percent': percent,
+        })
+    total_transactions = sum(t['count'] for t in account_totals.values())
+    total_income = sum((t['income'] or Decimal('0') for t in account_totals.values()), Decimal('0')) or 0
+    total_expense = sum((t['expense'] or Decimal('0') for t in account_totals.values()), Decimal('0')) or 0
+    return {
+        'account_summaries': account_summaries,
+        'goal_summaries': goal_summaries,
+        'total_transactions': total_transactions,
+        'total_income': total_income,
+        'total_expense': total_expense,
+    }
+
+
+def build_report(user):
+    """Return the context for the reports page using a fixed number of queries."""
+    accounts, goals = _report_querysets(user)
+    return _report(accounts, goals, rollups.totals_by(user, 'account'), rollups.totals_by(user, 'goal'))
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def abuild_report(user):
+    """Async ``build_report``; its four queries are awaited together."""
+    accounts, goals = _report_querysets(user)
+    return _report(*await asyncio.gather(
+        alist(accounts), alist(goals), rollups.atotals_by(user, 'account'), rollups.atotals_by(user, 'goal'),
+    ))
+
+
+def _dashboard_querysets(user):
+    accounts = Account.objects.filter(user=user).annotate(goal_count=Count('goals')).prefetch_related('goals')
+    goals = Goal.objects.filter(account__user=user)
+    transactions = Transaction.objects.filter(account__user=user).select_related('account', 'goal').order_by('-date')
+    return accounts, goals, transactions[:5]  # latest 5
+
+
+def _dashboard(accounts, goals, transactions, total_income, total_expense, total_goal_saved):
+    return {
+        "accounts": accounts,
+        "goals": goals,
+        "transactions": transactions,
+        "total_income": total_income or 0,
+        "total_expense": total_expense or 0,
+        "total_goal_saved": total_goal_saved or 0,
+    }
+
+
+def build_dashboard(user):
+    """Return the computed part of the dashboard context as plain, picklable values."""
+    accounts, goals, transactions = _dashboard_querysets(user)
+    goals = list(goals)
+    forecasting.attach(goals, forecasting.get_forecasts(user, goals))
+    totals = rollups.totals_by_type(user)
+    return _dashboard(
+        list(accounts), goals, list(transactions),
+        totals.get('income', {}).get('total'),
+        totals.get('expense', {}).get('total'),
+        sum((goal.current_amount for goal in goals), Decimal('0')),
+    )
+
+
+async def abuild_dashboard(user):
+    """Async ``build_dashboard``: the lists and the income, expense and goal totals are awaited together.
+
+    Django runs each ORM call on the request's single database thread, so the
+    queries themselves are serialized; gathering them still removes the
+    per-await scheduling gaps and lets other requests use the event loop.
+    """
+    accounts, goals, transactions = _dashboard_querysets(user)
+    accounts, goals, transactions, income, expense, saved = await asyncio.gather(
+        alist(accounts), alist(goals), alist(transactions),
+        rollups.atotal(user, 'income'),
+        rollups.atotal(user, 'expense'),
+        Goal.objects.filter(account__user=user).aaggregate(total=Sum('current_amount')),
+    )
+    forecasting.attach(goals, await forecasting.aget_forecasts(user, goals))
+    return _dashboard(accounts, goals, transactions, income, expense, saved['total'])
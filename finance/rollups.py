@@ -0,0 +1,202 @@
+from decimal import Decimal
+from itertools import chain
+
+from django.db import IntegrityError, connections, router, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from . import archive
+from .models import DailyRollup, MonthlyRollup, Transaction
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _bump(model, key, amount, count):
+    updated = model.objects.filter(**key).update(total=F('total') + amount, count=F('count') + count)
+    if updated:
+        return
+    try:
+        with db_transaction.atomic():
+            model.objects.create(total=amount, count=count, **key)
+    except IntegrityError:
+        # Another writer created the row between our UPDATE and INSERT.
+        model.objects.filter(**key).update(total=F('total') + amount, count=F('count') + count)
+
+
+def rollup_day(when):
+    return timezone.localdate(when) if timezone.is_aware(when) else when.date()
+
+
+def apply(account_id, goal_id, type, day, amount, count=1):
+    """Add ``amount``/``count`` to the daily and monthly rollups for one key."""
+    key = {'account_id': account_id, 'goal_id': goal_id, 'type': type}
+    _bump(DailyRollup, {**key, 'day': day}, amount, count)
+    _bump(MonthlyRollup, {**key, 'month': day.replace(day=1)}, amount, count)
+
+
+_UPSERT = (
+    "INSERT INTO {table} (account_id, goal_id, type, {period}, total, count) VALUES (%s, %s, %s, %s, %s, %s) "
+    "ON CONFLICT (account_id, {goal}type, {period}) WHERE goal_id IS {null}NULL "
+    "DO UPDATE SET total = {table}.total + excluded.total, count = {table}.count + excluded.count"
+)
+
+
+def apply_many(deltas):
+    """``apply`` for every ``{(account_id, goal_id, type, day): (amount, count)}``.
+
+    On SQLite and PostgreSQL each level is one batched upsert against the
+    partial unique keys; other databases fall back to one ``apply`` per key.
+    """
+    connection = connections[router.db_for_write(DailyRollup)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for (account_id, goal_id, type, day), (amount, count) in deltas.items():
+            apply(account_id, goal_id, type, day, amount, count)
+        return
+    monthly = {}
+    for (account_id, goal_id, type, day), (amount, count) in deltas.items():
+        key = (account_id, goal_id, type, day.replace(day=1))
+        total, n = monthly.get(key, (Decimal('0'), 0))
+        monthly[key] = (total + amount, n + count)
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        for model, period, rows in ((DailyRollup, 'day', deltas), (MonthlyRollup, 'month', monthly)):
+            table = ops.quote_name(model._meta.db_table)
+            for with_goal in (False, True):
+                # Key order, so concurrent writers take the row locks in the same order.
+                params = [
+                    (account_id, goal_id, type, ops.adapt_datefield_value(day), amount, count)
+                    for (account_id, goal_id, type, day), (amount, count) in sorted(
+                        item for item in rows.items() if (item[0][1] is not None) == with_goal)
+                ]
+                if params:
+                    sql = _UPSERT.format(table=table, period=period, goal='goal_id, ' if with_goal else '',
+                                         null='NOT ' if with_goal else '')
+                    cursor.executemany(sql, params)
+
+
+def record(txn, sign=1):
+    apply(txn.account_id, txn.goal_id, txn.type, rollup_day(txn.date), sign * txn.amount, sign)
+
+
+def detach_goal(goal):
+    """Fold a goal's rollups into the account-level rows before the goal is deleted."""
+    for model in (DailyRollup, MonthlyRollup):
+        period = 'day' if model is DailyRollup else 'month'
+        for row in model.objects.filter(goal=goal):
+            key = {'account_id': row.account_id, 'goal_id': None, 'type': row.type, period: getattr(row, period)}
+            _bump(model, key, row.total, row.count)
+        model.objects.filter(goal=goal).delete()
+
+
+def totals_by_type(user):
+    rows = (
+        MonthlyRollup.objects.filter(account__user=user)
+        .values('type')
+        .order_by()
+        .annotate(total=Sum('total'), count=Sum('count'))
+    )
+    return {row['type']: row for row in rows}
+
+
+def _totals_by_rows(user, field):
+    # Per-account or per-goal income/expense/count, read from the monthly level.
+    return (
+        MonthlyRollup.objects.filter(account__user=user, **{f'{field}__isnull': False})
+        .values(field)
+        .order_by()
+        .annotate(
+            income=Sum('total', filter=Q(type='income')),
+            expense=Sum('total', filter=Q(type='expense')),
+            count=Sum('count'),
+        )
+    )
+
+
+def totals_by(user, field):
+    return {row[field]: row for row in _totals_by_rows(user, field)}
+
+
+async def atotals_by(user, field):
+    return {row[field]: row async for row in _totals_by_rows(user, field)}
+
+
+async def atotal(user, type):
+    """Sum of ``type`` transactions for ``user`` from the monthly rollups."""
+    result = await MonthlyRollup.objects.filter(account__user=user, type=type).aaggregate(total=Sum('total'))
+    return result['total']
+
+
+def _expected_daily(chunk_size=REBUILD_BATCH_SIZE):
+    rows = (
+        Transaction.objects.values('account', 'goal', 'type', day=TruncDate('date'))
+        .order_by()
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    if archive.archived_until() is None:
+        return rows.iterator(chunk_size=chunk_size)
+    # Archived transactions still count; a day may be split between both tables.
+    merged = {}
+    for row in chain(rows.iterator(chunk_size=chunk_size), archive.daily_totals()):
+        key = (row['account'], row['goal'], row['type'], row['day'])
+        total, count = merged.get(key, (Decimal('0'), 0))
+        merged[key] = (total + row['total'], count + row['count'])
+    return (
+        {'account': account, 'goal': goal, 'type': type, 'day': day, 'total': total, 'count': count}
+        for (account, goal, type, day), (total, count) in merged.items()
+    )
+
+
+@db_transaction.atomic
+def rebuild(batch_size=REBUILD_BATCH_SIZE):
+    DailyRollup.objects.all().delete()
+    MonthlyRollup.objects.all().delete()
+    DailyRollup.objects.bulk_create(
+        (
+            DailyRollup(account_id=row['account'], goal_id=row['goal'], type=row['type'],
+                        day=row['day'], total=row['total'], count=row['count'])
+            for row in _expected_daily(batch_size)
+        ),
+        batch_size=batch_size,
+    )
+    monthly = (
+        DailyRollup.objects.values('account', 'goal', 'type', month=TruncMonth('day'))
+        .order_by()
+        .annotate(total=Sum('total'), count=Sum('count'))
+    )
+    MonthlyRollup.objects.bulk_create(
+        (
+            MonthlyRollup(account_id=row['account'], goal_id=row['goal'], type=row['type'],
+                          month=row['month'], total=row['total'], count=row['count'])
+            for row in monthly.iterator(chunk_size=batch_size)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def _index(rows, period):
+    return {
+        (row['account'], row['goal'], row['type'], row[period]): (Decimal(row['total']), row['count'])
+        for row in rows if row['count']
+    }
+
+
+def verify():
+    """Return a list of (level, key, expected, actual) for every rollup that disagrees with Transaction."""
+    expected_daily = _index(_expected_daily(), 'day')
+    expected_monthly = {}
+    for (account, goal, type, day), (total, count) in expected_daily.items():
+        key = (account, goal, type, day.replace(day=1))
+        t, c = expected_monthly.get(key, (Decimal('0'), 0))
+        expected_monthly[key] = (t + total, c + count)
+
+    mismatches = []
+    for level, model, period, expected in (
+        ('daily', DailyRollup, 'day', expected_daily),
+        ('monthly', MonthlyRollup, 'month', expected_monthly),
+    ):
+        actual = _index(model.objects.values('account', 'goal', 'type', period, 'total', 'count'), period)
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                mismatches.append((level, key, expected.get(key), actual.get(key)))
+    return mismatches
@@ -0,0 +1,147 @@
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http.request import HttpRequest
+
+from . import caching
+
+_replica_allowed = ContextVar('finance_replica_allowed', default=False)
+_sticky_user = ContextVar('finance_sticky_user', default=False)
+
+DEFAULT_STICKY_SECONDS = 5
+ARCHIVE_ALIAS = 'archive'
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def archive_alias():
+    """Database holding TransactionArchive: its own file when configured, else the primary."""
+    return ARCHIVE_ALIAS if ARCHIVE_ALIAS in settings.DATABASES else 'default'
+
+
+def _is_archive(model):
+    return model is not None and model._meta.label == 'finance.TransactionArchive'
+
+
+def _sticky_key(user_id):
+    return f'finance:primary-until:{user_id}'
+
+
+def mark_sticky(user_id):
+    """Pin ``user_id``'s reads to the primary for a short window after they write."""
+    seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+    caching.get_cache().set(_sticky_key(user_id), time.time() + seconds, seconds)
+
+
+async def amark_sticky(user_id):
+    seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+    await caching.get_cache().aset(_sticky_key(user_id), time.time() + seconds, seconds)
+
+
+def is_sticky(user_id):
+    until = caching.get_cache().get(_sticky_key(user_id))
+    return until is not None and until > time.time()
+
+
+async def ais_sticky(user_id):
+    until = await caching.get_cache().aget(_sticky_key(user_id))
+    return until is not None and until > time.time()
+
+
+def read_from_replica(view):
+    """Let ORM reads made by ``view`` go to a replica unless the user just wrote."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica_allowed.set(bool(replicas()))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica_allowed.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_allowed.set(bool(replicas()))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_allowed.reset(token)
+    return wrapper
+
+
+def read_alias():
+    """Return the alias reads would use right now, for querysets evaluated after the view returns."""
+    return PrimaryReplicaRouter().db_for_read(None)
+
+
+class ReplicaStickinessMiddleware:
+    """Load the user's read-your-writes flag once per request and set it after unsafe requests."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replicas() or not request.user.is_authenticated:
+            return self.get_response(request)
+        token = _sticky_user.set(is_sticky(request.user.pk))
+        try:
+            response = self.get_response(request)
+        finally:
+            _sticky_user.reset(token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            mark_sticky(request.user.pk)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        if not replicas():
+            return await self.get_response(request)
+        user = await request.auser()
+        if not user.is_authenticated:
+            return await self.get_response(request)
+        token = _sticky_user.set(await ais_sticky(user.pk))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _sticky_user.reset(token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            await amark_sticky(user.pk)
+        return response
+
+
+class PrimaryReplicaRouter:
+    """Send writes to ``default`` and replica-eligible reads to one of ``DATABASE_REPLICAS``."""
+
+    def db_for_read(self, model, **hints):
+        if _is_archive(model) and archive_alias() != 'default':
+            return archive_alias()
+        if _replica_allowed.get() and not _sticky_user.get():
+            aliases = replicas()
+            if aliases:
+                return random.choice(aliases)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return archive_alias() if _is_archive(model) else 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data, so relations across them are fine.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'finance' and model_name == 'transactionarchive':
+            return db == archive_alias() or (archive_alias() == 'default' and db in replicas())
+        # A separate archive database holds nothing else.
+        return db != ARCHIVE_ALIAS
@@ -0,0 +1,107 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Transaction
+
+DEFAULT_LIMIT = 50
+MAX_TERMS = 8
+# bm25 column weights for the SQLite index: name, description, tags.
+SQLITE_WEIGHTS = (10.0, 4.0, 0.0)
+
+
+class SearchUnavailable(RuntimeError):
+    pass
+
+
+def get_limit():
+    return getattr(settings, 'SEARCH_RESULT_LIMIT', DEFAULT_LIMIT)
+
+
+def terms(query):
+    """Split ``query`` into lower-cased word terms; punctuation never reaches the match syntax."""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _sqlite_ids(cursor, ops, user, words, account, goal, type, start, end, limit):
+    text = ' '.join(f'"{word}"*' for word in words)
+    tags = [f'"u{user.pk}"'] + ([f'"a{account.pk}"'] if account else []) + ([f'"t{type}"'] if type else [])
+    match = f"{{name description}} : ({text}) AND tags : ({' '.join(tags)})"
+    sql = ["SELECT finance_transaction_search.rowid FROM finance_transaction_search"]
+    where, params = ["finance_transaction_search MATCH %s"], [match]
+    if goal or start or end:
+        sql.append("JOIN finance_transaction t ON t.id = finance_transaction_search.rowid")
+        if goal:
+            where.append("t.goal_id = %s")
+            params.append(goal.pk)
+        if start:
+            where.append("t.date >= %s")
+            params.append(ops.adapt_datetimefield_value(start))
+        if end:
+            where.append("t.date < %s")
+            params.append(ops.adapt_datetimefield_value(end))
+    weights = ', '.join(str(w) for w in SQLITE_WEIGHTS)
+    sql.append(f"WHERE {' AND '.join(where)} ORDER BY bm25(finance_transaction_search, {weights}) LIMIT %s")
+    cursor.execute(' '.join(sql), params + [limit])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _postgresql_ids(cursor, ops, user, words, account, goal, type, start, end, limit):
+    where = ["t.search_vector @@ q", "a.user_id = %s"]
+    params = [' & '.join(f'{word}:*' for word in words), user.pk]
+    for column, value in (('t.account_id', account and account.pk), ('t.goal_id', goal and goal.pk), ('t.type', type)):
+        if value:
+            where.append(f"{column} = %s")
+            params.append(value)
+    if start:
+        where.append("t.date >= %s")
+        params.append(start)
+    if end:
+        where.append("t.date < %s")
+        params.append(end)
+    cursor.execute(
+        "SELECT t.id FROM finance_transaction t JOIN finance_account a ON a.id = t.account_id, "
+        "to_tsquery('simple', %s) q "
+        f"WHERE {' AND '.join(where)} ORDER BY ts_rank(t.search_vector, q) DESC, t.date DESC LIMIT %s",
+        params + [limit],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {'sqlite': _sqlite_ids, 'postgresql': _postgresql_ids}
+
+
+def search(user, query, account=None, goal=None, type=None, start=None, end=None, limit=None):
+    """Return ``user``'s transactions matching every word of ``query`` as a prefix, best match first.
+
+    ``start``/``end`` are datetimes (end exclusive). Ranking and filtering run in
+    the full-text index; the matching rows are then loaded with one more query.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    alias = router.db_for_read(Transaction)
+    connection = connections[alias]
+    backend = BACKENDS.get(connection.vendor)
+    if backend is None:
+        raise SearchUnavailable(f"Full-text search is not set up for {connection.vendor}.")
+    with connection.cursor() as cursor:
+        ids = backend(cursor, connection.ops, user, words, account, goal, type, start, end, limit or get_limit())
+    rows = Transaction.objects.using(alias).select_related('account', 'goal').in_bulk(ids)
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def rebuild_index(using='default'):
+    """Repopulate the SQLite index from the transaction table (PostgreSQL's column is generated)."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM finance_transaction_search")
+        cursor.execute(
+            "INSERT INTO finance_transaction_search(rowid, name, description, tags) "
+            "SELECT t.id, t.name, t.description, 'u' || a.user_id || ' a' || t.account_id || ' t' || t.type "
+            "FROM finance_transaction t JOIN finance_account a ON a.id = t.account_id"
+        )
+        return cursor.rowcount
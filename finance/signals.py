@@ -0,0 +1,91 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.db.models.query import QuerySet
+from django.dispatch import receiver
+
+from . import archive, balances, caching, rollups
+from .models import Account, Goal, Transaction
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_transaction(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._rollup_previous = None
+        instance._previous_goal_id = None
+        return
+    instance._rollup_previous = (
+        Transaction.objects.filter(pk=instance.pk)
+        .only('account_id', 'goal_id', 'type', 'amount', 'date')
+        .first()
+    )
+    instance._previous_goal_id = instance._rollup_previous and instance._rollup_previous.goal_id
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        rollups.record(previous, sign=-1)
+        balances.record(previous, sign=-1)
+    rollups.record(instance)
+    balances.record(instance)
+    instance._rollup_previous = None
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollups_on_delete(sender, instance, origin=None, **kwargs):
+    # Rollups of a deleted account (or user) are removed by the same cascade.
+    if origin is not None and _origin_model(origin) is not Transaction:
+        return
+    rollups.record(instance, sign=-1)
+    balances.record(instance, sign=-1)
+
+
+@receiver(pre_delete, sender=Goal)
+def detach_goal_rollups(sender, instance, origin=None, **kwargs):
+    # Deleting a goal only unlinks its transactions, so keep their totals on the account.
+    if origin is not None and _origin_model(origin) is not Goal:
+        return
+    rollups.detach_goal(instance)
+
+
+@receiver(post_delete, sender=Account)
+def drop_account_archive(sender, instance, **kwargs):
+    # The archive may live in another database, so it is not part of the cascade.
+    archive.forget(instance.pk)
+
+
+def _owner_id(instance):
+    if isinstance(instance, Account):
+        return instance.user_id
+    if type(instance).account.is_cached(instance):
+        return instance.account.user_id
+    return Account.objects.filter(pk=instance.account_id).values_list('user_id', flat=True).first()
+
+
+def _scopes(instance):
+    # Transactions that never touched a goal leave goal forecasts valid.
+    if isinstance(instance, Account):
+        return ('summary',)
+    if isinstance(instance, Transaction) and not (instance.goal_id or getattr(instance, '_previous_goal_id', None)):
+        return ('summary',)
+    return caching.SCOPES
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def invalidate_cached_summaries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id = _owner_id(instance)
+    if user_id is not None:
+        caching.invalidate_user(user_id, _scopes(instance))
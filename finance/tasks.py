@@ -0,0 +1,80 @@
+import io
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from . import caching, jobs
+from .analytics import build_analytics
+from .importers import PARSERS, StatementError, import_transactions
+from .models import Account
+from .reporting import build_report
+
+DEFAULT_BACKGROUND_BYTES = 1024 * 1024
+DEFAULT_REFRESH_GRACE = 60
+
+
+def upload_storage():
+    return FileSystemStorage(location=getattr(settings, 'JOB_UPLOAD_ROOT', settings.BASE_DIR / 'job_uploads'))
+
+
+@jobs.task('refresh_reports')
+def refresh_reports(job):
+    user = User.objects.get(pk=job.user_id)
+    caching.refresh(user, 'reports', build_report)
+    caching.refresh(user, 'analytics', build_analytics)
+    return {'refreshed': ['reports', 'analytics']}
+
+
+def get_refresh_grace():
+    return getattr(settings, 'REPORT_REFRESH_GRACE', DEFAULT_REFRESH_GRACE)
+
+
+def _refresh_pending(job):
+    # A refresh still queued this long after it was due means no worker is
+    # running: the caller should rebuild inline rather than serve stale data.
+    return job.run_at > timezone.now() - timedelta(seconds=get_refresh_grace())
+
+
+def schedule_report_refresh(user):
+    """Queue a refresh of ``user``'s reports; False if the queued one is overdue (see ``cached_stale``)."""
+    return _refresh_pending(jobs.enqueue('refresh_reports', user=user, key=f'user:{user.pk}'))
+
+
+async def aschedule_report_refresh(user):
+    return _refresh_pending(await jobs.aenqueue('refresh_reports', user=user, key=f'user:{user.pk}'))
+
+
+@jobs.task('import_statement')
+def import_statement(job):
+    storage = upload_storage()
+    path = job.payload['path']
+    terminal = True
+    try:
+        account = Account.objects.get(pk=job.payload['account_id'], user_id=job.user_id)
+        with storage.open(path, 'rb') as handle:
+            lines = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='')
+            result = import_transactions(account, PARSERS[job.payload['format']](lines))
+    except StatementError as exc:
+        raise jobs.PermanentFailure(f"Import failed, nothing was saved. {exc}")
+    except Exception:
+        # Keep the upload for the retry, if there is one.
+        terminal = job.attempts >= job.max_attempts
+        raise
+    finally:
+        if terminal:
+            storage.delete(path)
+    return {'rows': result.rows, 'batches': result.batches, 'seconds': round(result.seconds, 3)}
+
+
+def get_background_bytes():
+    return getattr(settings, 'IMPORT_BACKGROUND_BYTES', DEFAULT_BACKGROUND_BYTES)
+
+
+def queue_import(user, account, upload, format):
+    """Save ``upload`` for a worker and queue its import into ``account``."""
+    path = upload_storage().save(f'{user.pk}/{uuid.uuid4().hex}.{format}', upload)
+    return jobs.enqueue('import_statement', user=user, payload={'account_id': account.pk, 'path': path, 'format': format})
@@ -0,0 +1,13 @@
+import uuid
+
+from django import template
+from django.utils.html import format_html
+
+from finance.idempotency import FIELD
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_field():
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD, uuid.uuid4().hex)
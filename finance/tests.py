@@ -1,3 +1,1611 @@
-from django.test import TestCase
+import asyncio
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import gzip
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, api, archive, balances, benchmarks, caching, forecasting, jobs, ledger, live, middleware, recurring, reporting, rollups, routers, search, tasks
+from .idempotency import purge_expired
+from .importers import StatementError, import_transactions, parse_csv, parse_ofx
+from .models import (Account, BalanceCheckpoint, DailyRollup, Goal, IdempotencyKey, Job, MonthlyRollup, RecurringTransaction,
+                     Transaction, TransactionArchive)
+from .pagination import keyset_page
+from .reporting import build_report
+
+
+class FinanceTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        # Primary keys are reused between tests, so cached per-user summaries must not leak.
+        caching.get_cache().clear()
+
+
+def make_account(user, name='Main', balance=0):
+    return Account.objects.create(user=user, name=name, balance=balance)
+
+
+def make_goal(account, name='Goal', target=1000, current=0):
+    return Goal.objects.create(
+        account=account, name=name, target_amount=target,
+        current_amount=current, deadline=date(2030, 1, 1),
+    )
+
+
+class ReportingTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+
+    def populate(self, n_accounts, n_goals):
+        for i in range(n_accounts):
+            account = make_account(self.user, f'Account {i}', balance=100)
+            Transaction.objects.create(account=account, type='income', name='Pay', amount=Decimal('50.00'))
+            Transaction.objects.create(account=account, type='expense', name='Rent', amount=Decimal('20.00'))
+            for j in range(n_goals):
+                goal = make_goal(account, f'Goal {i}-{j}', current=10)
+                Transaction.objects.create(account=account, goal=goal, type='expense', name='Save', amount=Decimal('10.00'))
+
+    def test_summaries_match_per_row_aggregates(self):
+        self.populate(2, 2)
+        other = User.objects.create_user('bob', password='pw')
+        Transaction.objects.create(account=make_account(other), type='income', name='x', amount=5)
+        report = build_report(self.user)
+        self.assertEqual(report['total_transactions'], 2 * (2 + 2))
+        self.assertEqual(report['total_income'], Decimal('100.00'))
+        self.assertEqual(report['total_expense'], Decimal('80.00'))
+        for summary in report['account_summaries']:
+            self.assertEqual(summary['income'], Decimal('50.00'))
+            self.assertEqual(summary['expense'], Decimal('40.00'))
+            self.assertEqual(summary['goal_count'], 2)
+        for summary in report['goal_summaries']:
+            self.assertEqual(summary['deposit'], Decimal('10.00'))
+            self.assertEqual(summary['withdraw'], 0)
+            self.assertEqual(summary['progress_percent'], Decimal('1.00'))
+
+    def test_query_count_is_bounded(self):
+        self.populate(1, 1)
+        with CaptureQueriesContext(connection) as small:
+            build_report(self.user)
+        self.populate(10, 5)
+        with CaptureQueriesContext(connection) as large:
+            build_report(self.user)
+        self.assertLessEqual(len(large), 4)
+        self.assertEqual(len(small), len(large))
+
+    def test_reports_view_renders(self):
+        self.populate(1, 1)
+        response = self.client.get(reverse('reports'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Account 0')
+
+
+class RollupTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.account = make_account(self.user)
+        self.goal = make_goal(self.account)
+
+    def test_rollups_follow_create_update_delete(self):
+        income = Transaction.objects.create(account=self.account, type='income', name='Pay', amount=Decimal('100.00'))
+        saved = Transaction.objects.create(account=self.account, goal=self.goal, type='expense', name='Save', amount=Decimal('30.00'))
+        self.assertEqual(rollups.totals_by_type(self.user)['income']['total'], Decimal('100.00'))
+
+        income.amount = Decimal('120.00')
+        income.type = 'expense'
+        income.save()
+        totals = rollups.totals_by_type(self.user)
+        self.assertEqual(totals['income']['total'], 0)
+        self.assertEqual(totals['expense']['total'], Decimal('150.00'))
+
+        saved.delete()
+        self.assertEqual(rollups.totals_by_type(self.user)['expense']['total'], Decimal('120.00'))
+        self.assertEqual(rollups.verify(), [])
+
+    def test_goal_and_account_delete_keep_rollups_consistent(self):
+        Transaction.objects.create(account=self.account, goal=self.goal, type='expense', name='Save', amount=Decimal('30.00'))
+        self.goal.delete()
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(rollups.totals_by(self.user, 'account')[self.account.pk]['expense'], Decimal('30.00'))
+        self.account.delete()
+        self.assertEqual(rollups.verify(), [])
+        self.assertFalse(DailyRollup.objects.exists())
+
+    def test_rebuild_command_restores_rollups(self):
+        Transaction.objects.create(account=self.account, type='income', name='Pay', amount=Decimal('10.00'))
+        MonthlyRollup.objects.update(total=0)
+        self.assertNotEqual(rollups.verify(), [])
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(rollups.verify(), [])
+
+
+class TransactionListTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user)
+        self.goal = make_goal(self.account)
+        for i in range(25):
+            Transaction.objects.create(account=self.account, goal=self.goal if i % 2 else None,
+                                       type='income' if i % 3 else 'expense', name=f'T{i}', amount=i + 1)
+
+    def test_keyset_pages_cover_all_rows_once(self):
+        # Identical dates force the id tie-breaker to do the work.
+        Transaction.objects.update(date=Transaction.objects.first().date)
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(Transaction.objects.all(), cursor, page_size=7)
+            seen.extend(row.pk for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(Transaction.objects.order_by('-date', '-id').values_list('pk', flat=True)))
+
+    @override_settings(TRANSACTION_PAGE_SIZE=10)
+    def test_list_filters_and_constant_queries(self):
+        url = reverse('transaction-list')
+        response = self.client.get(url, {'type': 'expense', 'goal': self.goal.pk})
+        expected = Transaction.objects.filter(type='expense', goal=self.goal).count()
+        self.assertEqual(len(response.context['transactions']), expected)
+
+        first = self.client.get(url)
+        cursor = first.context['next_cursor']
+        self.assertIsNotNone(cursor)
+        with CaptureQueriesContext(connection) as page_one:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as page_two:
+            self.client.get(url, {'after': cursor})
+        self.assertEqual(len(page_one), len(page_two))
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('transaction-list'), {'after': '!!!'})
+        self.assertEqual(response.status_code, 200)
+
+
+class LedgerTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        self.goal = make_goal(self.account)
+
+    def test_goal_round_trip_moves_money(self):
+        ledger.post(self.account, 'expense', Decimal('40'), goal=self.goal)
+        self.assertEqual((self.account.balance, self.goal.current_amount), (60, 40))
+        ledger.post(self.account, 'income', Decimal('15'), goal=self.goal, check_funds=True)
+        self.assertEqual((self.account.balance, self.goal.current_amount), (75, 25))
+
+    def test_insufficient_funds_writes_nothing(self):
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.post(self.account, 'expense', Decimal('100.01'), check_funds=True)
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.post(self.account, 'income', Decimal('1'), goal=self.goal, check_funds=True)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 100)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_views_route_through_ledger(self):
+        self.client.post(reverse('account_withdraw', args=[self.account.pk]), {'amount': '500'})
+        self.client.post(reverse('account_deposit', args=[self.account.pk]), {'amount': '50'})
+        self.client.post(reverse('goal_deposit', args=[self.goal.pk]), {'amount': '30'})
+        self.client.post(reverse('goal_withdraw', args=[self.goal.pk]), {'amount': '10'})
+        self.client.post(reverse('transaction-create'), {
+            'account': self.account.pk, 'type': 'expense', 'name': 'Rent', 'amount': '20',
+        })
+        self.account.refresh_from_db()
+        self.goal.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('110.00'))
+        self.assertEqual(self.goal.current_amount, Decimal('20.00'))
+        self.assertEqual(Transaction.objects.count(), 4)
+
+
+class LedgerEditTests(FinanceTestCase):
+    sequences = 25
+    steps = 30
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.accounts = [make_account(self.user, 'Checking', balance=500), make_account(self.user, 'Savings', balance=200)]
+        self.goals = [make_goal(self.accounts[0], 'Car'), make_goal(self.accounts[1], 'House', current=50)]
+        self.opening = {('account', a.pk): a.balance for a in self.accounts}
+        self.opening.update({('goal', g.pk): g.current_amount for g in self.goals})
+
+    def recomputed(self):
+        # Balances from the full history, independent of the ledger's own bookkeeping.
+        sign = {'income': 1, 'expense': -1, 'transfer': 1}
+        expected = dict(self.opening)
+        for txn in Transaction.objects.all():
+            expected['account', txn.account_id] += sign[txn.type] * txn.amount
+            if txn.goal_id:
+                expected['goal', txn.goal_id] -= sign[txn.type] * txn.amount
+        return expected
+
+    def stored(self):
+        actual = {('account', pk): balance for pk, balance in Account.objects.values_list('pk', 'balance')}
+        actual.update({('goal', pk): amount for pk, amount in Goal.objects.values_list('pk', 'current_amount')})
+        return actual
+
+    def test_edit_moves_only_the_difference(self):
+        checking, savings = self.accounts
+        txn = ledger.post(checking, 'expense', Decimal('40'), goal=self.goals[0], name='Deposit')
+        txn.account, txn.goal, txn.type, txn.amount = savings, self.goals[1], 'income', Decimal('15')
+        with CaptureQueriesContext(connection) as queries:
+            ledger.amend(txn)
+        # One UPDATE per affected account or goal, no history scan.
+        balance_updates = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE "finance_account"', 'UPDATE "finance_goal"'))]
+        self.assertEqual(len(balance_updates), 4)
+        self.assertFalse([q for q in queries if 'SUM(' in q['sql']])
+        self.assertEqual(self.stored(), self.recomputed())
+        self.assertEqual(self.stored()['account', checking.pk], 500)
+        self.assertEqual(self.stored()['goal', self.goals[1].pk], 35)
+        txn.amount = Decimal('100')
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.amend(txn, check_funds=True)
+        self.assertEqual(Transaction.objects.get().amount, 15)
+        self.assertEqual(self.stored(), self.recomputed())
+
+    def test_random_edit_sequences_match_full_recompute(self):
+        for seed in range(self.sequences):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                for step in range(self.steps):
+                    existing = list(Transaction.objects.all())
+                    action = rng.choice(['post', 'transfer', 'amend', 'amend', 'remove'] if existing else ['post'])
+                    account = rng.choice(self.accounts)
+                    goal = rng.choice(self.goals + [None])
+                    amount = Decimal(rng.randint(1, 20000)) / 100
+                    if action == 'post':
+                        ledger.post(account, rng.choice(['income', 'expense']), amount, goal=goal)
+                    elif action == 'transfer':
+                        ledger.transfer(*rng.sample(self.accounts, 2), amount, check_funds=False)
+                    elif action == 'remove':
+                        ledger.remove(rng.choice(existing))
+                    else:
+                        txn = rng.choice([t for t in existing if not t.transfer_id] or existing)
+                        if txn.transfer_id:
+                            continue
+                        for field, value in (('account', account), ('goal', goal), ('amount', amount),
+                                             ('type', rng.choice(['income', 'expense']))):
+                            if rng.random() < 0.5:
+                                setattr(txn, field, value)
+                        ledger.amend(txn)
+                    self.assertEqual(self.stored(), self.recomputed(), f"after step {step} ({action})")
+                self.assertEqual(rollups.verify(), [])
+                Transaction.objects.all().delete()
+                for model, field in ((Account, 'balance'), (Goal, 'current_amount')):
+                    for row in model.objects.all():
+                        model.objects.filter(pk=row.pk).update(**{field: self.opening[model.__name__.lower(), row.pk]})
+
+    def test_views_reconcile_edits_and_deletes(self):
+        checking, savings = self.accounts
+        txn = ledger.post(checking, 'expense', Decimal('40'), name='Rent')
+        self.client.post(reverse('transaction-update', args=[txn.pk]), {
+            'account': savings.pk, 'type': 'expense', 'name': 'Rent', 'amount': '60', 'goal': self.goals[0].pk,
+        })
+        self.assertEqual(self.stored(), self.recomputed())
+        self.client.post(reverse('transaction-delete', args=[txn.pk]))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.stored(), self.opening)
+
+        debit, credit = ledger.transfer(checking, savings, Decimal('25'))
+        response = self.client.post(reverse('transaction-update', args=[credit.pk]), {'account': savings.pk, 'type': 'income', 'name': 'x', 'amount': '1'})
+        self.assertRedirects(response, reverse('transaction-detail', args=[credit.pk]))
+        self.client.post(reverse('transaction-delete', args=[credit.pk]))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.stored(), self.opening)
+        self.assertEqual(rollups.verify(), [])
+
+
+class LedgerConcurrencyTests(TransactionTestCase):
+    workers = 8
+    posts_per_worker = 40
+
+    def test_parallel_posts_keep_balances_exact(self):
+        user = User.objects.create_user('alice', password='pw')
+        account = make_account(user, balance=0)
+        goal = make_goal(account)
+
+        def worker(n):
+            try:
+                local_account = Account.objects.get(pk=account.pk)
+                local_goal = Goal.objects.get(pk=goal.pk)
+                for i in range(self.posts_per_worker):
+                    ledger.post(local_account, 'income', Decimal('3.00'))
+                    ledger.post(local_account, 'expense', Decimal('1.00'), goal=local_goal)
+                    try:
+                        ledger.post(local_account, 'expense', Decimal('1.50'), check_funds=True)
+                    except ledger.InsufficientFunds:
+                        pass
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            list(pool.map(worker, range(self.workers)))
+
+        account.refresh_from_db()
+        goal.refresh_from_db()
+        posts = self.workers * self.posts_per_worker
+        withdrawals = Transaction.objects.filter(amount=Decimal('1.50')).count()
+        self.assertEqual(goal.current_amount, posts * Decimal('1.00'))
+        self.assertEqual(account.balance, posts * Decimal('2.00') - withdrawals * Decimal('1.50'))
+        self.assertGreaterEqual(account.balance, 0)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_opposite_transfers_do_not_deadlock(self):
+        user = User.objects.create_user('alice', password='pw')
+        first, second = make_account(user, 'First', balance=100), make_account(user, 'Second', balance=100)
+
+        def worker(n):
+            try:
+                source, destination = (first, second) if n % 2 else (second, first)
+                source, destination = Account.objects.get(pk=source.pk), Account.objects.get(pk=destination.pk)
+                for i in range(self.posts_per_worker):
+                    try:
+                        ledger.transfer(source, destination, Decimal('7.00'))
+                    except ledger.InsufficientFunds:
+                        pass
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            list(pool.map(worker, range(self.workers)))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.balance + second.balance, 200)
+        self.assertEqual(Transaction.objects.filter(amount__lt=0).count(), Transaction.objects.filter(amount__gt=0).count())
+        self.assertEqual(rollups.verify(), [])
+
+
+class TransferTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.checking = make_account(self.user, 'Checking', balance=100)
+        self.savings = make_account(self.user, 'Savings', balance=10)
+        self.wallet = make_account(self.user, 'Wallet')
+
+    def balances(self):
+        return [a.balance for a in Account.objects.filter(user=self.user).order_by('pk')]
+
+    def test_transfer_posts_linked_legs(self):
+        balances.checkpoint(self.checking)
+        debit, credit = ledger.transfer(self.checking, self.savings, Decimal('30'), description='Rainy day')
+        self.assertEqual((debit.amount, credit.amount), (Decimal('-30'), Decimal('30')))
+        self.assertEqual(debit.transfer_id, credit.transfer_id)
+        self.assertEqual((credit.name, credit.description), ('Transfer from Checking', 'Rainy day'))
+        self.assertEqual((self.checking.balance, self.savings.balance), (70, 40))
+        self.assertEqual(self.balances(), [70, 40, 0])
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(balances.reconcile(), [])
+        self.assertEqual(balances.balance_at(self.savings, timezone.now() + timedelta(seconds=1)), Decimal('40'))
+        page = self.client.get(reverse('transaction-detail', args=[debit.pk]))
+        self.assertEqual(list(page.context['transfer_legs']), [credit])
+        with self.assertRaises(ValueError):
+            ledger.transfer(self.checking, self.checking, Decimal('1'))
+
+    def test_batch_settles_all_or_nothing(self):
+        with self.assertRaisesMessage(ledger.InsufficientFunds, 'Savings'):
+            ledger.post_transfers([
+                ledger.Transfer(self.checking, self.savings, Decimal('60')),
+                ledger.Transfer(self.savings, self.wallet, Decimal('80')),
+            ])
+        self.assertEqual(self.balances(), [100, 10, 0])
+        self.assertFalse(Transaction.objects.exists())
+        # Netted per account, the same batch succeeds once Savings can cover it.
+        legs = ledger.post_transfers([
+            ledger.Transfer(self.checking, self.savings, Decimal('60')),
+            ledger.Transfer(self.savings, self.wallet, Decimal('70')),
+        ])
+        self.assertEqual(len(legs), 2)
+        self.assertEqual(self.balances(), [40, 0, 70])
+        self.assertEqual(rollups.verify(), [])
+
+    def test_split_transfer_view(self):
+        url = reverse('transfer-create')
+        self.assertEqual(self.client.get(url, {'source': self.checking.pk}).context['form'].initial['source'], str(self.checking.pk))
+        data = {
+            'source': self.checking.pk, 'description': 'Payroll',
+            'legs-TOTAL_FORMS': '3', 'legs-INITIAL_FORMS': '0', 'legs-MIN_NUM_FORMS': '1', 'legs-MAX_NUM_FORMS': '50',
+            'legs-0-destination': self.savings.pk, 'legs-0-amount': '25',
+            'legs-1-destination': self.wallet.pk, 'legs-1-amount': '15',
+        }
+        response = self.client.post(url, data)
+        self.assertRedirects(response, reverse('account-detail', args=[self.checking.pk]))
+        self.assertEqual(self.balances(), [60, 35, 15])
+        self.assertEqual(Transaction.objects.filter(type='transfer').count(), 4)
+
+        data.update({'legs-0-destination': self.checking.pk, 'legs-1-amount': '500'})
+        self.assertContains(self.client.post(url, data), 'Transfer to accounts other than the source.')
+        data['legs-0-destination'] = self.savings.pk
+        self.assertContains(self.client.post(url, data), 'Insufficient funds in Checking.')
+        self.assertEqual(self.balances(), [60, 35, 15])
+        form = self.client.get(reverse('transaction-create')).context['form']
+        self.assertNotIn('transfer', dict(form.fields['type'].choices))
+
+    def test_migration_zeroes_legacy_transfers(self):
+        # Before transfer legs, a 'transfer' was one unsigned row that left the balance alone.
+        old = Transaction.objects.create(account=self.checking, type='transfer', name='Old', amount=50,
+                                         date=timezone.make_aware(datetime(2025, 1, 10)))
+        Transaction.objects.create(account=self.savings, type='transfer', name='Newer', amount=20)
+        archive.archive_month(self.checking.pk, self.user.pk, date(2025, 1, 1))
+        ledger.transfer(self.checking, self.savings, Decimal('30'))
+        migration = import_module('finance.migrations.0012_legacy_transfers')
+        state = MigrationExecutor(connection).loader.project_state(('finance', '0012_legacy_transfers'))
+        migration.zero_legacy_transfers(state.apps, SimpleNamespace(connection=connection))
+
+        newer = Transaction.objects.get(name='Newer')
+        self.assertEqual(newer.amount, 0)
+        self.assertIn('20.00 transfer', newer.description)
+        self.assertEqual(TransactionArchive.objects.get().net, 0)
+        self.assertEqual(archive.History(self.user).get(old.pk).amount, 0)
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(balances.reconcile(), [])
+
+
+class IdempotencyTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        self.url = reverse('account_deposit', args=[self.account.pk])
+
+    def test_replayed_deposit_is_applied_once(self):
+        data = {'amount': '25', 'idempotency_key': 'abc123'}
+        first = self.client.post(self.url, data)
+        with CaptureQueriesContext(connection) as replay_queries:
+            second = self.client.post(self.url, data)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertFalse([q for q in replay_queries if 'finance_transaction' in q['sql']])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('125.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_header_key_and_failed_requests_can_retry(self):
+        withdraw = reverse('account_withdraw', args=[self.account.pk])
+        response = self.client.post(withdraw, {'amount': '500'}, headers={'Idempotency-Key': 'k1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.client.post(withdraw, {'amount': '50'}, headers={'Idempotency-Key': 'k1'})
+        self.client.post(withdraw, {'amount': '50'}, headers={'Idempotency-Key': 'k1'})
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('50.00'))
+
+    def test_key_reused_on_other_endpoint_is_rejected(self):
+        self.client.post(self.url, {'amount': '5', 'idempotency_key': 'same'})
+        other = reverse('account_withdraw', args=[self.account.pk])
+        self.assertEqual(self.client.post(other, {'amount': '5', 'idempotency_key': 'same'}).status_code, 422)
+
+    def test_expired_keys_are_purged(self):
+        self.client.post(self.url, {'amount': '5', 'idempotency_key': 'old'})
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(purge_expired(), 1)
+        self.client.post(self.url, {'amount': '5', 'idempotency_key': 'old'})
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_forms_carry_a_fresh_key(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="idempotency_key"')
+
+
+STATEMENT_CSV = """date,name,amount,description
+2025-01-03,Salary,1000.00,January pay
+2025-01-05,Rent,-400.00,
+2025-02-01T09:30:00,Groceries,-50.50,
+"""
+
+STATEMENT_OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20250110120000[0:GMT]
+<TRNAMT>200.00
+<NAME>Refund
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20250111
+<TRNAMT>-20.00
+<NAME>Fuel
+<MEMO>Shell
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+class StatementImportTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+
+    def test_csv_import_in_batches_updates_balance_and_rollups(self):
+        result = import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)), batch_size=2)
+        self.assertEqual((result.rows, result.batches), (3, 2))
+        self.assertEqual(self.account.balance, Decimal('649.50'))
+        rent = Transaction.objects.get(name='Rent')
+        self.assertEqual((rent.type, rent.amount, rent.date.date()), ('expense', Decimal('400.00'), date(2025, 1, 5)))
+        self.assertEqual(rollups.verify(), [])
+
+    def test_bad_row_rolls_back_everything(self):
+        bad = STATEMENT_CSV + "2025-02-02,Broken,abc,\n"
+        with self.assertRaises(StatementError) as ctx:
+            import_transactions(self.account, parse_csv(StringIO(bad)), batch_size=2)
+        self.assertEqual(ctx.exception.line, 5)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 100)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(DailyRollup.objects.exists())
+
+    def test_amounts_must_fit_the_column(self):
+        for amount, message in (('12.345', 'no more than 2 decimal places'), ('-12345678901', 'no more than 10 digits before the decimal point')):
+            with self.assertRaisesMessage(StatementError, message):
+                import_transactions(self.account, parse_csv(StringIO(f"date,name,amount\n2025-01-03,Odd,{amount}\n")))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_transfers_are_not_imported(self):
+        with self.assertRaisesMessage(StatementError, 'Line 2: transfers cannot be imported'):
+            import_transactions(self.account, parse_csv(StringIO("date,name,amount,type\n2025-01-03,Move,-50,transfer\n")))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, 100)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_ofx_parser(self):
+        rows = list(parse_ofx(StringIO(STATEMENT_OFX)))
+        self.assertEqual([(r['name'], r['type'], r['amount']) for r in rows],
+                         [('Refund', 'income', Decimal('200.00')), ('Fuel', 'expense', Decimal('20.00'))])
+        self.assertEqual(rows[1]['description'], 'Shell')
+
+    def test_upload_view(self):
+        upload = SimpleUploadedFile('statement.ofx', STATEMENT_OFX.encode())
+        response = self.client.post(reverse('transaction-import'), {'account': self.account.pk, 'file': upload})
+        self.assertRedirects(response, reverse('transaction-list'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('280.00'))
+
+
+class ExportTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, 'Main')
+        other = make_account(self.user, 'Other')
+        for i in range(5):
+            Transaction.objects.create(account=self.account, type='income', name=f'Pay {i}', amount=10 + i)
+        Transaction.objects.create(account=other, type='expense', name='Elsewhere', amount=1)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_streams_filtered_rows(self):
+        response = self.client.get(reverse('transaction-export'), {'account': self.account.pk})
+        self.assertTrue(response.streaming)
+        lines = self.content(response).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,account,goal,type,name,amount,description')
+        self.assertEqual(len(lines), 6)
+        self.assertNotIn('Elsewhere', ''.join(lines))
+
+    def test_gzip_jsonl_export(self):
+        response = self.client.get(reverse('transaction-export'), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(self.content(response)).splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['amount'], '10.00')
+
+    def test_report_export(self):
+        response = self.client.get(reverse('report-export'))
+        body = self.content(response).decode()
+        self.assertIn('account,Main', body)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_transactions', '--user', 'alice', '--format', 'jsonl', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+    def test_export_command_includes_archived_rows(self):
+        when = timezone.make_aware(datetime(2024, 3, 10, 12))
+        Transaction.objects.create(account=self.account, type='expense', name='Old', amount=7, date=when)
+        archive.archive_month(self.account.pk, self.user.pk, date(2024, 3, 1))
+        for args, expected in [
+            (['--user', 'alice'], 7),
+            (['--account', str(self.account.pk), '--date-from', '2024-03-01', '--date-to', '2024-03-31'], 1),
+            (['--date-from', '2024-04-01'], 6),
+        ]:
+            out = StringIO()
+            call_command('export_transactions', '--format', 'jsonl', *args, stdout=out)
+            names = [json.loads(line)['name'] for line in out.getvalue().splitlines()]
+            self.assertEqual(len(names), expected, args)
+            self.assertEqual('Old' in names, expected != 6, args)
+
+
+class SummaryCacheTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        caching.reset_stats()
+
+    def test_dashboard_is_cached_until_data_changes(self):
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as cached:
+            response = self.client.get(reverse('dashboard'))
+        self.assertFalse([q for q in cached if 'finance_monthlyrollup' in q['sql']])
+        self.assertEqual(caching.stats()['dashboard'], {'hit': 1, 'miss': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('account_deposit', args=[self.account.pk]), {'amount': '25'})
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_income'], Decimal('25.00'))
+        self.assertEqual(caching.stats()['dashboard'], {'hit': 1, 'miss': 2})
+
+    def test_goal_change_refreshes_reports_in_background(self):
+        self.assertEqual(self.client.get(reverse('reports')).context['goal_summaries'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            make_goal(self.account, 'Holiday')
+        # The stale report is served at once and one refresh job is queued.
+        self.assertEqual(self.client.get(reverse('reports')).context['goal_summaries'], [])
+        self.client.get(reverse('reports'))
+        self.assertEqual(Job.objects.filter(task='refresh_reports', status='queued').count(), 1)
+        self.assertEqual(jobs.work(burst=True), 1)
+        response = self.client.get(reverse('reports'))
+        self.assertEqual(len(response.context['goal_summaries']), 1)
+        self.assertEqual(caching.stats()['reports'], {'hit': 1, 'miss': 1, 'stale': 2})
+
+    def test_reports_rebuild_inline_without_a_worker(self):
+        self.client.get(reverse('reports'))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_goal(self.account, 'Holiday')
+        self.assertEqual(self.client.get(reverse('reports')).context['goal_summaries'], [])
+        # Nothing picked the refresh up within REPORT_REFRESH_GRACE.
+        Job.objects.filter(task='refresh_reports').update(run_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(len(self.client.get(reverse('reports')).context['goal_summaries']), 1)
+        self.assertEqual(caching.stats()['reports'], {'hit': 0, 'miss': 2, 'stale': 1})
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                           'LOCATION': '/tmp/amf-finance-test-cache'}})
+    def test_file_backend(self):
+        caching.get_cache().clear()
+        first = self.client.get(reverse('reports')).context['account_summaries']
+        second = self.client.get(reverse('reports')).context['account_summaries']
+        self.assertEqual(first[0]['account'].pk, second[0]['account'].pk)
+        self.assertEqual(caching.stats()['reports'], {'hit': 1, 'miss': 1})
+
+
+class QueryCountRegressionTests(FinanceTestCase):
+    """Page query counts must not grow with the number of accounts and goals."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.accounts = 0
+
+    def grow(self, accounts, goals_per_account):
+        for _ in range(accounts):
+            self.accounts += 1
+            account = make_account(self.user, f'Account {self.accounts}')
+            for j in range(goals_per_account):
+                goal = make_goal(account, f'Goal {self.accounts}-{j}')
+                Transaction.objects.create(account=account, goal=goal, type='expense', name='Save', amount=1)
+
+    def count_queries(self, url):
+        caching.get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url_factory):
+        self.grow(1, 1)
+        small = self.count_queries(url_factory())
+        self.grow(8, 4)
+        self.assertEqual(self.count_queries(url_factory()), small)
+
+    def test_dashboard(self):
+        self.assertConstantQueries(lambda: reverse('dashboard'))
+
+    def test_account_list(self):
+        self.assertConstantQueries(lambda: reverse('account-list'))
+
+    def test_reports(self):
+        self.assertConstantQueries(lambda: reverse('reports'))
+
+    def test_goal_list(self):
+        self.assertConstantQueries(lambda: reverse('goal-list'))
+
+    def test_account_detail(self):
+        self.grow(1, 6)
+        account = Account.objects.get(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('account-detail', args=[account.pk]))
+        self.assertContains(response, '6')
+        self.assertLessEqual(len(queries), 3)
+
+
+class PerformanceMiddlewareTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        middleware.reset()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+
+    def test_server_timing_and_stats(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+')
+        self.assertEqual(self.client.get(reverse('performance-stats')).status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get(reverse('performance-stats')).json()
+        self.assertEqual(stats['views']['dashboard']['queries']['count'], 1)
+        self.assertGreater(stats['views']['dashboard']['template_ms']['p50'], 0)
+
+    @override_settings(PERF_STRICT=True)
+    def test_main_views_fit_their_budgets(self):
+        goal = make_goal(self.account)
+        for name, args in [('dashboard', []), ('reports', []), ('transaction-list', []),
+                           ('account-detail', [self.account.pk]), ('goal-detail', [goal.pk])]:
+            self.client.get(reverse(name, args=args))
+        self.client.post(reverse('account_deposit', args=[self.account.pk]), {'amount': '5'})
+        self.client.post(reverse('goal_deposit', args=[goal.pk]), {'amount': '5'})
+
+    @override_settings(PERF_STRICT=True, PERF_QUERY_BUDGETS={'dashboard': 1})
+    def test_strict_mode_fails_over_budget(self):
+        with self.assertRaises(middleware.QueryBudgetExceeded):
+            self.client.get(reverse('dashboard'))
+
+
+class BenchmarkTests(FinanceTestCase):
+    def test_generator_is_deterministic_and_consistent(self):
+        users = benchmarks.generate(users=2, accounts_per_user=2, goals_per_account=1, transactions_per_user=300, seed=7, batch_size=100)
+        self.assertEqual(Transaction.objects.filter(account__user__in=users).count(), 600)
+        self.assertEqual(rollups.verify(), [])
+        first = list(Transaction.objects.order_by('id').values_list('amount', 'type', 'name'))
+        User.objects.filter(pk__in=[u.pk for u in users]).delete()
+        benchmarks.generate(users=2, accounts_per_user=2, goals_per_account=1, transactions_per_user=300, seed=7, batch_size=100)
+        self.assertEqual(first, list(Transaction.objects.order_by('id').values_list('amount', 'type', 'name')))
+
+    def test_driver_reports_percentiles(self):
+        users = benchmarks.generate(transactions_per_user=50)
+        report = benchmarks.run(users, requests=3, warmup=1)
+        self.assertIn('dashboard', report)
+        self.assertEqual(report['account_deposit']['requests'], 3)
+        self.assertLessEqual(report['dashboard']['p50_ms'], report['dashboard']['p99_ms'])
+        self.assertGreater(report['reports']['queries_per_request'], 0)
+        timed = benchmarks.run_analytics(users, repeat=1)
+        self.assertEqual(timed['transactions'], Transaction.objects.filter(account__user__in=users).count())
+        self.assertGreater(timed['total_s'], 0)
+        transfers = benchmarks.run_transfers(users, transfers=20, batch_size=10)
+        self.assertEqual([transfers[mode]['transfers'] for mode in ('pair', 'single', 'batch')], [20, 20, 20])
+        self.assertEqual(rollups.verify(), [])
+
+
+class SQLiteProfileTests(FinanceTestCase):
+    def test_tuned_profile_pragmas(self):
+        if settings.DATABASE_PROFILE != 'tuned':
+            self.skipTest("AMF_DB_PROFILE is not 'tuned'")
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.router = routers.PrimaryReplicaRouter()
+        self.user = User.objects.create_user('alice', password='pw')
+
+    def read_alias_in_view(self, user_sticky=False):
+        token = routers._sticky_user.set(user_sticky)
+        try:
+            return routers.read_from_replica(lambda request: self.router.db_for_read(Transaction))(None)
+        finally:
+            routers._sticky_user.reset(token)
+
+    def test_only_marked_views_read_from_replica(self):
+        self.assertEqual(self.router.db_for_read(Transaction), 'default')
+        self.assertEqual(self.read_alias_in_view(), 'replica1')
+        self.assertEqual(self.router.db_for_write(Transaction), 'default')
+
+    def test_recent_writer_sticks_to_primary(self):
+        self.assertFalse(routers.is_sticky(self.user.pk))
+        routers.mark_sticky(self.user.pk)
+        self.assertTrue(routers.is_sticky(self.user.pk))
+        self.assertEqual(self.read_alias_in_view(user_sticky=True), 'default')
+
+    def test_post_marks_user_sticky(self):
+        self.client.force_login(self.user)
+        account = make_account(self.user)
+        self.client.post(reverse('account_deposit', args=[account.pk]), {'amount': '5'})
+        self.assertTrue(routers.is_sticky(self.user.pk))
+
+    def test_cached_pages_are_built_on_the_primary(self):
+        # replica1 is not a configured database, so any read routed to it would fail.
+        self.client.force_login(self.user)
+        make_account(self.user)
+        for name in ('dashboard', 'reports'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+    async def test_async_requests_read_stickiness_from_the_cache(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertFalse(await routers.ais_sticky(self.user.pk))
+        await routers.amark_sticky(self.user.pk)
+        self.assertTrue(await routers.ais_sticky(self.user.pk))
+        self.assertEqual((await self.async_client.get(reverse('transaction-list'))).status_code, 200)
+
+
+class ReplicaSyncTests(TransactionTestCase):
+    # The backup API cannot copy a database while this connection holds a write transaction.
+    def test_sync_copies_primary(self):
+        make_account(User.objects.create_user('alice', password='pw'), 'Synced')
+        with tempfile.TemporaryDirectory() as tmp:
+            target = os.path.join(tmp, 'replica.sqlite3')
+            call_command('sync_replicas', '--target', target, stdout=StringIO())
+            with sqlite3.connect(target) as replica:
+                names = replica.execute('SELECT name FROM finance_account').fetchall()
+            replica.close()
+        self.assertTrue(names)
+
+
+class AnalyticsTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        account = make_account(self.user)
+        self.goal = make_goal(account, 'School')
+        now = timezone.now()
+        rows = [
+            ('income', 'Salary', 3000, None, 40),
+            ('expense', 'Rent', 1000, None, 40),
+            ('expense', 'Rent', 1000, None, 10),
+            ('expense', 'Food', 300, None, 5),
+            ('expense', 'Save', 500, self.goal, 20),
+            ('income', 'Take back', 100, self.goal, 2),
+        ]
+        for type, name, amount, goal, days_ago in rows:
+            Transaction.objects.create(account=account, goal=goal, type=type, name=name, amount=amount,
+                                       date=now - timedelta(days=days_ago))
+
+    def test_results(self):
+        result = analytics.build_analytics(self.user)
+        self.assertEqual(result['transactions'], 6)
+        self.assertEqual(sum(m['income'] for m in result['monthly']), 3100)
+        self.assertEqual(sum(m['expense'] for m in result['monthly']), 2800)
+        self.assertEqual(result['top_expenses'][0], {'name': 'Rent', 'total': 2000, 'count': 2})
+        self.assertEqual([e['name'] for e in result['top_expenses']], ['Rent', 'Food'])
+        self.assertEqual(result['rolling']['current30'], round(1300 / 30, 2))
+        self.assertEqual(result['rolling']['current90'], round(2300 / 90, 2))
+        velocity = result['goal_velocity'][0]
+        self.assertEqual((velocity['goal'], velocity['deposited'], velocity['withdrawn']), ('School', 500, 100))
+        self.assertEqual(velocity['per_30_days'], round(400 / 21 * 30, 2))
+
+    def test_numpy_and_python_backends_agree(self):
+        if analytics.np is None:
+            self.skipTest("NumPy is not installed")
+        cols = analytics.load_columns(self.user)
+        fast = analytics.compute(cols, use_numpy=True)
+        slow = analytics.compute(cols, use_numpy=False)
+        self.assertEqual((fast.pop('backend'), slow.pop('backend')), ('numpy', 'python'))
+        self.assertEqual(fast, slow)
+
+    def test_archived_rows_still_counted(self):
+        account = Account.objects.get(user=self.user)
+        when = timezone.now() - timedelta(days=400)
+        Transaction.objects.create(account=account, type='expense', name='Food', amount=Decimal('12.34'), date=when)
+        archive.archive_month(account.pk, self.user.pk, timezone.localdate(when).replace(day=1))
+        result = analytics.build_analytics(self.user)
+        self.assertEqual(result['transactions'], 7)
+        self.assertEqual(round(sum(m['expense'] for m in result['monthly']), 2), 2812.34)
+        self.assertEqual(result['top_expenses'][1], {'name': 'Food', 'total': 312.34, 'count': 2})
+        if analytics.np is not None:
+            slow = analytics.compute(analytics.load_columns(self.user), use_numpy=False)
+            self.assertEqual({**result, 'backend': 'python'}, {**slow, 'goal_velocity': result['goal_velocity']})
+
+    def test_reports_page_includes_charts(self):
+        response = self.client.get(reverse('reports'))
+        self.assertContains(response, 'id="cash-flow-data"')
+        self.assertContains(response, 'Goal Deposit Velocity')
+        self.assertContains(response, '<script src="https://cdn.jsdelivr.net/npm/chart.js"></script>', html=False)
+        self.assertContains(response, "getElementById('cashFlowChart')", count=1)
+
+    def test_no_transactions(self):
+        other = User.objects.create_user('bob', password='pw')
+        self.assertIsNone(analytics.build_analytics(other))
+
+
+class GoalForecastTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=1000)
+        self.today = date(2026, 1, 31)
+
+    def save(self, goal, amount, day, type='expense'):
+        when = timezone.make_aware(timezone.datetime(day.year, day.month, day.day, 12))
+        return Transaction.objects.create(account=self.account, goal=goal, type=type, name='Save',
+                                          amount=Decimal(amount), date=when)
+
+    def test_projection_from_saving_rate(self):
+        goal = make_goal(self.account, 'Car', target=1000, current=300)
+        goal.deadline = date(2026, 12, 31)
+        goal.save()
+        self.save(goal, '200', date(2026, 1, 2))
+        self.save(goal, '150', date(2026, 1, 31))
+        self.save(goal, '50', date(2026, 1, 20), type='income')
+        with self.assertNumQueries(2):
+            forecast = forecasting.forecast_goals(self.user, today=self.today)[goal.pk]
+        # 300 saved over the 30 days since the first deposit: 10 a day, 700 to go.
+        self.assertEqual(forecast.daily_rate, Decimal('10'))
+        self.assertEqual(forecast.per_month, Decimal('300.00'))
+        self.assertEqual(forecast.projected_date, self.today + timedelta(days=70))
+        self.assertEqual(forecast.required_per_month, (Decimal('700') / 334 * 30).quantize(Decimal('0.01')))
+        self.assertEqual(forecast.status, 'on_track')
+
+    def test_statuses(self):
+        done = make_goal(self.account, 'Done', target=100, current=100)
+        idle = make_goal(self.account, 'Idle')
+        slow = make_goal(self.account, 'Slow', target=100000)
+        self.save(slow, '10', self.today)
+        late = make_goal(self.account, 'Late')
+        late.deadline = date(2025, 12, 31)
+        late.save()
+        forecasts = forecasting.forecast_goals(self.user, today=self.today)
+        self.assertEqual(forecasts[done.pk].status, 'complete')
+        self.assertEqual(forecasts[idle.pk].status, 'no_history')
+        self.assertIsNone(forecasts[idle.pk].projected_date)
+        self.assertEqual(forecasts[slow.pk].status, 'behind')
+        self.assertEqual(forecasts[late.pk].status, 'overdue')
+        self.assertIsNone(forecasts[late.pk].required_per_month)
+
+    def test_cached_until_goal_transaction(self):
+        goal = make_goal(self.account, 'Car')
+        caching.reset_stats()
+        response = self.client.get(reverse('goal-list'))
+        self.assertEqual(response.context['goals'][0].forecast.status, 'no_history')
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.post(self.account, 'income', Decimal('50'), name='Pay')
+        self.client.get(reverse('goal-detail', args=[goal.pk]))
+        self.assertEqual(caching.stats()['goal_forecasts'], {'hit': 1, 'miss': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('goal_deposit', args=[goal.pk]), {'amount': '25'})
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['goals'][0].forecast.transactions, 1)
+        self.assertContains(response, 'class="forecast')
+        self.assertEqual(caching.stats()['goal_forecasts'], {'hit': 1, 'miss': 2})
+
+
+@jobs.task('test_flaky', max_attempts=2)
+def flaky_task(job):
+    if job.attempts < job.payload.get('succeed_on', 1):
+        raise RuntimeError('try again')
+    return {'attempts': job.attempts}
+
+
+class JobQueueTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+
+    def test_retry_with_backoff_then_succeed(self):
+        job = jobs.enqueue('test_flaky', user=self.user, payload={'succeed_on': 2})
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('try again', job.error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=20))
+        # Not due yet: a burst worker leaves it alone.
+        self.assertEqual(jobs.work(burst=True), 0)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {'attempts': 2}))
+        self.assertEqual(jobs.backoff(3), timedelta(seconds=120))
+
+    def test_failure_after_max_attempts_and_stale_requeue(self):
+        job = jobs.enqueue('test_flaky', payload={'succeed_on': 5})
+        Job.objects.filter(pk=job.pk).update(status='running', attempts=1, locked_at=timezone.now() - timedelta(days=1))
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claim_is_exclusive(self):
+        jobs.enqueue('test_flaky')
+        first, second = jobs.claim('a'), jobs.claim('b')
+        self.assertEqual(first.locked_by, 'a')
+        self.assertIsNone(second)
+
+    @override_settings(IMPORT_BACKGROUND_BYTES=0)
+    def test_large_import_runs_as_job(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(JOB_UPLOAD_ROOT=tmp):
+            upload = SimpleUploadedFile('statement.ofx', STATEMENT_OFX.encode())
+            response = self.client.post(reverse('transaction-import'), {'account': self.account.pk, 'file': upload})
+            self.assertRedirects(response, reverse('transaction-list'))
+            job = Job.objects.get(task='import_statement')
+            self.assertEqual(self.client.get(reverse('job-status', args=[job.pk])).json()['status'], 'queued')
+            jobs.work(burst=True)
+            status = self.client.get(reverse('job-status', args=[job.pk])).json()
+            self.assertEqual((status['status'], status['result']['rows']), ('succeeded', 2))
+            self.assertEqual(os.listdir(os.path.join(tmp, str(self.user.pk))), [])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('280.00'))
+        self.assertEqual([j['id'] for j in self.client.get(reverse('job-list')).json()['jobs']], [job.pk])
+
+    def test_upload_is_kept_for_retries_and_deleted_after_the_last(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(JOB_UPLOAD_ROOT=tmp):
+            upload = SimpleUploadedFile('statement.csv', STATEMENT_CSV.encode())
+            job = tasks.queue_import(self.user, self.account, upload, 'csv')
+            Job.objects.filter(pk=job.pk).update(payload={**job.payload, 'account_id': 0})
+            uploads = os.path.join(tmp, str(self.user.pk))
+            jobs.work(burst=True)
+            self.assertEqual(len(os.listdir(uploads)), 1)
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now(), attempts=job.max_attempts - 1)
+            jobs.work(burst=True)
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'failed')
+            self.assertEqual(os.listdir(uploads), [])
+
+    def test_status_is_private(self):
+        job = jobs.enqueue('test_flaky', user=User.objects.create_user('bob'))
+        self.assertEqual(self.client.get(reverse('job-status', args=[job.pk])).status_code, 404)
+
+    def test_run_jobs_command(self):
+        jobs.enqueue('test_flaky', payload={'succeed_on': 1})
+        out = StringIO()
+        call_command('run_jobs', processes=1, burst=True, stdout=out)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+
+
+class AsyncViewTests(FinanceTestCase):
+    """The read-heavy views run natively under ASGI, with no sync-only ORM access."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.account = make_account(self.user, balance=100)
+        self.goal = make_goal(self.account, 'Car', current=25)
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.post(self.account, 'income', Decimal('50'), name='Pay')
+            self.saving = ledger.post(self.account, 'expense', Decimal('25'), goal=self.goal, name='Save')
+
+    async def test_views_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        urls = [reverse('dashboard'), reverse('reports'), reverse('transaction-list') + '?type=expense',
+                reverse('account-detail', args=[self.account.pk]), reverse('goal-detail', args=[self.goal.pk]),
+                reverse('transaction-detail', args=[self.saving.pk])]
+        for url in urls:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertGreater(self.queries(response), 0, url)
+        # Queries made through sync_to_async count the same as under WSGI.
+        detail = reverse('transaction-detail', args=[self.saving.pk])
+        await sync_to_async(self.client.force_login)(self.user)
+        sync_response = await sync_to_async(self.client.get)(detail)
+        self.assertEqual(self.queries(await self.async_client.get(detail)), self.queries(sync_response))
+        dashboard = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(dashboard.context['total_income'], Decimal('50.00'))
+        self.assertEqual(dashboard.context['total_goal_saved'], Decimal('50.00'))
+        self.assertEqual(dashboard.context['goals'][0].forecast.transactions, 1)
+        goal = await self.async_client.get(reverse('goal-detail', args=[self.goal.pk]))
+        self.assertEqual([t.pk for t in goal.context['recent_transactions']], [self.saving.pk])
+
+    def queries(self, response):
+        return int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+
+    @override_settings(PERF_STRICT=True, PERF_QUERY_BUDGETS={'transaction-detail': 1})
+    async def test_query_budget_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        with self.assertRaises(middleware.QueryBudgetExceeded):
+            await self.async_client.get(reverse('transaction-detail', args=[self.saving.pk]))
+
+    async def test_login_and_ownership(self):
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 302)
+        other = await User.objects.acreate(username='bob')
+        await self.async_client.aforce_login(other)
+        response = await self.async_client.get(reverse('account-detail', args=[self.account.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_sync_and_async_builders_agree(self):
+        sync_report = await sync_to_async(build_report)(self.user)
+        async_report = await reporting.abuild_report(self.user)
+        self.assertEqual(
+            [(s['account'].pk, s['income'], s['expense']) for s in sync_report['account_summaries']],
+            [(s['account'].pk, s['income'], s['expense']) for s in async_report['account_summaries']],
+        )
+        sync_dashboard = await sync_to_async(reporting.build_dashboard)(self.user)
+        async_dashboard = await reporting.abuild_dashboard(self.user)
+        for key in ('total_income', 'total_expense', 'total_goal_saved'):
+            self.assertEqual(sync_dashboard[key], async_dashboard[key], key)
+
+
+class SearchTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user)
+        self.other_account = make_account(self.user, 'Savings')
+        self.rent = self.add('Rent', 'January rent', days_ago=40)
+        self.fees = self.add('School fees', 'Term 1')
+        self.mention = self.add('Transfer', 'money for rent', account=self.other_account)
+        self.salary = self.add('Salary', '', type='income')
+        stranger = make_account(User.objects.create_user('bob'))
+        Transaction.objects.create(account=stranger, type='expense', name='Rent', amount=1)
+
+    def add(self, name, description, account=None, type='expense', days_ago=0):
+        return Transaction.objects.create(account=account or self.account, type=type, name=name, description=description,
+                                          amount=10, date=timezone.now() - timedelta(days=days_ago))
+
+    def test_ranked_prefix_and_owner_scoped(self):
+        self.assertEqual(search.search(self.user, 'rent'), [self.rent, self.mention])
+        self.assertEqual(search.search(self.user, 'sch FE'), [self.fees])
+        self.assertEqual(search.search(self.user, 'rent "OR* ('), [])
+        self.assertEqual(search.search(self.user, '  '), [])
+
+    def test_filters(self):
+        self.assertEqual(search.search(self.user, 'rent', account=self.other_account), [self.mention])
+        self.assertEqual(search.search(self.user, 'sal', type='expense'), [])
+        self.assertEqual(search.search(self.user, 'rent', start=timezone.now() - timedelta(days=7)), [self.mention])
+
+    def test_index_follows_updates_deletes_and_bulk_inserts(self):
+        self.fees.name = 'Tuition'
+        self.fees.save()
+        self.assertEqual(search.search(self.user, 'tuition'), [self.fees])
+        self.assertEqual(search.search(self.user, 'school'), [])
+        self.rent.delete()
+        self.assertEqual(search.search(self.user, 'rent'), [self.mention])
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+        self.assertEqual([t.name for t in search.search(self.user, 'groc')], ['Groceries'])
+        self.assertEqual(search.rebuild_index(), Transaction.objects.count())
+        self.assertEqual([t.name for t in search.search(self.user, 'groc')], ['Groceries'])
+
+    def test_transaction_list_search(self):
+        response = self.client.get(reverse('transaction-list'), {'q': 'rent', 'account': self.account.pk})
+        self.assertEqual(list(response.context['transactions']), [self.rent])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertContains(response, 'Best matches')
+
+
+class BalanceCheckpointTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        # +1000 on Jan 3, -400 on Jan 5 and -50.50 on Feb 1 2025, ending at 649.50.
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+
+    def at(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def test_point_in_time_balances(self):
+        self.assertEqual(balances.balance_at(self.account, self.at(2025, 1, 4)), Decimal('1100.00'))
+        written = balances.checkpoint(self.account)
+        self.assertEqual(written, BalanceCheckpoint.objects.count())
+        self.assertEqual(balances.checkpoint(self.account), 0)
+        checkpoints = self.account.checkpoints.order_by('as_of')
+        self.assertEqual([c.balance for c in checkpoints[:3]], [Decimal('100.00'), Decimal('700.00'), Decimal('649.50')])
+        self.assertEqual(checkpoints[0].as_of, self.at(2025, 1, 1))
+        with self.assertNumQueries(3):
+            self.assertEqual(balances.balance_at(self.account, self.at(2025, 1, 4)), Decimal('1100.00'))
+        self.assertEqual(balances.balance_at(self.account, self.at(2025, 2, 1, 10)), Decimal('649.50'))
+        self.assertEqual(balances.balance_at(self.account, self.at(2024, 6, 1)), Decimal('100.00'))
+        series = balances.daily_balances(self.account, date(2025, 1, 2), date(2025, 1, 5))
+        self.assertEqual([b for _, b in series], [Decimal('100.00'), Decimal('1100.00'), Decimal('1100.00'), Decimal('700.00')])
+        self.assertEqual(balances.reconcile(), [])
+
+    def test_back_dated_changes_move_later_checkpoints(self):
+        balances.checkpoint(self.account)
+        late = Transaction.objects.create(account=self.account, type='income', name='Late', amount=50, date=self.at(2025, 1, 10))
+        self.assertEqual(balances.verify_checkpoints(), [])
+        self.assertEqual(balances.balance_at(self.account, self.at(2025, 3, 1)), Decimal('699.50'))
+        # The raw insert skipped the ledger, so the live balance is now behind.
+        [(account, expected, actual)] = balances.reconcile()
+        self.assertEqual((expected, actual), (Decimal('699.50'), Decimal('649.50')))
+        late.delete()
+        self.assertEqual(balances.reconcile(), [])
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+        self.assertEqual(balances.reconcile(), [])
+        self.assertEqual(balances.verify_checkpoints(), [])
+        self.assertEqual(balances.balance_at(self.account, self.at(2025, 2, 1)), Decimal('1300.00'))
+
+    def test_editing_the_balance_moves_the_opening_balance(self):
+        balances.checkpoint(self.account)
+        self.client.post(reverse('account-update', args=[self.account.pk]), {'name': 'Main', 'balance': '700.00'})
+        self.assertEqual(balances.reconcile(), [])
+        self.assertEqual(balances.balance_at(self.account, self.at(2025, 1, 2)), Decimal('150.50'))
+
+    def test_reconcile_command(self):
+        call_command('checkpoint_balances', stdout=StringIO())
+        call_command('reconcile_balances', '--full', stdout=StringIO())
+        Account.objects.filter(pk=self.account.pk).update(balance=1)
+        with self.assertRaisesMessage(CommandError, '1 balances disagree'):
+            call_command('reconcile_balances', stdout=StringIO(), stderr=StringIO())
+        Account.objects.filter(pk=self.account.pk).update(balance=Decimal('649.50'))
+        self.account.checkpoints.filter(as_of=self.at(2025, 2, 1)).update(balance=0)
+        call_command('reconcile_balances', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, '2 balances disagree'):
+            call_command('reconcile_balances', '--full', stdout=StringIO(), stderr=StringIO())
+
+    def test_balance_view(self):
+        balances.checkpoint(self.account)
+        url = reverse('account-balance', args=[self.account.pk])
+        self.assertEqual(self.client.get(url, {'at': '2025-01-04'}).json()['balance'], '1100.00')
+        response = self.client.get(url, {'start': '2025-01-31', 'end': '2025-02-01'})
+        self.assertEqual(response.json()['balances'], [{'date': '2025-01-31', 'balance': '700.00'},
+                                                       {'date': '2025-02-01', 'balance': '649.50'}])
+        self.assertEqual(self.client.get(url, {'at': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2025-02-01', 'end': '2025-01-01'}).status_code, 400)
+
+
+class ArchiveTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        # Salary and Rent in January 2025, Groceries in February: all past the archive horizon.
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+        self.recent = ledger.post(self.account, 'expense', Decimal('9.50'), name='Coffee')
+
+    def test_archive_moves_old_months_and_keeps_totals(self):
+        totals = rollups.totals_by_type(self.user)
+        balances.checkpoint(self.account)
+        result = archive.archive()
+        self.assertEqual((result.batches, result.rows), (2, 3))
+        self.assertEqual(list(Transaction.objects.all()), [self.recent])
+        self.assertEqual(TransactionArchive.objects.get(month=date(2025, 1, 1)).net, Decimal('600.00'))
+        self.assertEqual(archive.archive().batches, 0)
+
+        self.assertEqual(rollups.totals_by_type(self.user), totals)
+        self.assertEqual(rollups.verify(), [])
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(rollups.totals_by_type(self.user), totals)
+        self.assertEqual(balances.verify_checkpoints(), [])
+        self.assertEqual(balances.reconcile(), [])
+        self.assertEqual(balances.balance_at(self.account, timezone.make_aware(datetime(2025, 1, 4))), Decimal('1100.00'))
+        self.assertEqual(len(analytics.load_columns(self.user)['day']), 4)
+
+    @override_settings(TRANSACTION_PAGE_SIZE=2)
+    def test_views_read_the_archive(self):
+        archive.archive()
+        url = reverse('transaction-list')
+        first = self.client.get(url)
+        self.assertEqual([t.name for t in first.context['transactions']], ['Coffee', 'Groceries'])
+        self.assertContains(first, 'Archived')
+        second = self.client.get(url, {'after': first.context['next_cursor']})
+        self.assertEqual([t.name for t in second.context['transactions']], ['Rent', 'Salary'])
+        self.assertIsNone(second.context['next_cursor'])
+        expenses = self.client.get(url, {'type': 'expense', 'date_to': '2025-01-31'})
+        self.assertEqual([t.name for t in expenses.context['transactions']], ['Rent'])
+
+        rent = expenses.context['transactions'][0]
+        self.assertContains(self.client.get(reverse('transaction-detail', args=[rent.pk])), 'Archived (read-only)')
+        self.assertEqual(self.client.get(reverse('transaction-detail', args=[rent.pk + 100])).status_code, 404)
+        export = b''.join(self.client.get(reverse('transaction-export')).streaming_content).decode()
+        self.assertEqual([line.split(',')[5] for line in export.splitlines()[1:]], ['Salary', 'Rent', 'Groceries', 'Coffee'])
+
+    def test_back_dated_rows_join_their_batch_and_account_delete_drops_it(self):
+        archive.archive()
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+        self.assertEqual(archive.archive().rows, 3)
+        self.assertEqual(TransactionArchive.objects.get(month=date(2025, 1, 1)).count, 4)
+        self.assertEqual(rollups.verify(), [])
+        self.account.delete()
+        self.assertFalse(TransactionArchive.objects.exists())
+        self.assertIsNone(archive.archived_until())
+
+    def test_command_reports_savings(self):
+        out = StringIO()
+        call_command('archive_transactions', '--compact', '--repeat', '1', stdout=out, stderr=StringIO())
+        self.assertIn('Archived 3 transactions', out.getvalue())
+        self.assertIn('Busiest user', out.getvalue())
+
+
+class APITests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        self.goal = make_goal(self.account)
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+
+    def test_sparse_fields_and_errors(self):
+        response = self.client.get(reverse('api-accounts'), {'fields': 'id,balance'})
+        self.assertEqual(response.json(), {'results': [{'id': self.account.pk, 'balance': '649.50'}]})
+        self.assertEqual(self.client.get(reverse('api-goals')).json()['results'][0]['account'], self.account.pk)
+        response = self.client.get(reverse('api-goals'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown fields: secret', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('api-transactions'), {'type': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-transactions'), {'after': '!'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('api-accounts')).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api-accounts')).status_code, 401)
+
+    @override_settings(TRANSACTION_PAGE_SIZE=2)
+    def test_transactions_are_keyset_paginated_across_the_archive(self):
+        ledger.post(self.account, 'expense', Decimal('9.50'), name='Coffee')
+        archive.archive()
+        url = reverse('api-transactions')
+        first = self.client.get(url, {'fields': 'name,amount,account_name'}).json()
+        self.assertEqual(first['results'], [
+            {'name': 'Coffee', 'amount': '9.50', 'account_name': 'Main'},
+            {'name': 'Groceries', 'amount': '50.50', 'account_name': 'Main'},
+        ])
+        second = self.client.get(url, {'fields': 'name', 'after': first['next']}).json()
+        self.assertEqual(second, {'results': [{'name': 'Rent'}, {'name': 'Salary'}], 'next': None})
+        expenses = self.client.get(url, {'fields': 'name', 'type': 'expense', 'date_to': '2025-01-31'}).json()
+        self.assertEqual(expenses['results'], [{'name': 'Rent'}])
+
+    def test_conditional_get_skips_the_queries(self):
+        for name in ('api-accounts', 'api-goals', 'api-transactions', 'api-summary'):
+            with self.subTest(name):
+                response = self.client.get(reverse(name))
+                etag = response['ETag']
+                self.assertTrue(etag.startswith('W/"'))
+                self.assertIn('no-cache', response['Cache-Control'])
+                # Session and user lookups only.
+                with self.assertNumQueries(2):
+                    self.assertEqual(self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertNotEqual(self.client.get(reverse(name), {'fields': 'id'})['ETag'], etag)
+        etag = self.client.get(reverse('api-summary'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.post(self.account, 'income', Decimal('5'))
+        response = self.client.get(reverse('api-summary'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_income'], '1005.00')
+        self.assertEqual(response.json()['accounts'][0]['balance'], '654.50')
+
+
+class RecurringTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.account = make_account(self.user, balance=100)
+        self.goal = make_goal(self.account)
+
+    def at(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def rule(self, **kwargs):
+        kwargs.setdefault('starts_at', self.at(2025, 1, 1, 9))
+        kwargs.setdefault('next_run', kwargs['starts_at'])
+        return RecurringTransaction.objects.create(account=self.account, **kwargs)
+
+    def test_monthly_runs_clamp_to_the_end_of_shorter_months(self):
+        rule = RecurringTransaction(interval='monthly', every=1, starts_at=self.at(2025, 1, 31, 9))
+        runs = [recurring.occurrence(rule, n) for n in range(4)]
+        self.assertEqual(runs, [self.at(2025, 1, 31, 9), self.at(2025, 2, 28, 9), self.at(2025, 3, 31, 9), self.at(2025, 4, 30, 9)])
+        rule.interval, rule.every = 'weekly', 2
+        self.assertEqual(recurring.occurrence(rule, 3), self.at(2025, 3, 14, 9))
+        rule.interval, rule.every, rule.starts_at = 'yearly', 1, self.at(2024, 2, 29)
+        self.assertEqual(recurring.occurrence(rule, 1), self.at(2025, 2, 28))
+
+    def test_tick_catches_up_each_missed_run_exactly_once(self):
+        # Jan and Feb 2025 history, checkpointed, so catching up has to move the checkpoints.
+        import_transactions(self.account, parse_csv(StringIO(STATEMENT_CSV)))
+        balances.checkpoint(self.account)
+        salary = self.rule(type='income', name='Salary', amount=1000, ends_at=self.at(2025, 3, 15))
+        savings = self.rule(type='expense', name='Savings', amount=50, goal=self.goal, interval='weekly', every=2)
+        version = caching.get_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = recurring.tick(now=self.at(2025, 3, 20), batch_size=1)
+        self.assertEqual((result.rules, result.transactions, result.batches), (2, 9, 2))
+        self.assertNotEqual(caching.get_version(self.user.pk), version)
+        self.assertEqual(recurring.tick(now=self.at(2025, 3, 20)).transactions, 0)
+        salary.refresh_from_db()
+        savings.refresh_from_db()
+        self.assertEqual((salary.runs, salary.active), (3, False))
+        self.assertEqual((savings.runs, savings.next_run), (6, self.at(2025, 3, 26, 9)))
+        self.assertEqual(self.account.transactions.filter(name='Savings').latest('date').date, self.at(2025, 3, 12, 9))
+        self.account.refresh_from_db()
+        self.goal.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('3349.50'))
+        self.assertEqual(self.goal.current_amount, Decimal('300.00'))
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(balances.reconcile(), [])
+        self.assertEqual(balances.verify_checkpoints(), [])
+        self.assertEqual(recurring.tick(now=self.at(2025, 4, 1)).transactions, 1)
+
+    def test_a_rule_far_behind_continues_in_the_next_batch(self):
+        self.rule(type='expense', name='Coffee', amount=3, interval='daily')
+        result = recurring.tick(now=self.at(2025, 1, 10, 12), max_catch_up=3)
+        self.assertEqual((result.rules, result.transactions, result.batches), (1, 10, 4))
+        self.assertEqual(self.account.transactions.count(), 10)
+        self.assertEqual(self.account.transactions.dates('date', 'day').count(), 10)
+
+    def test_views_create_pause_and_resume(self):
+        response = self.client.post(reverse('recurring-create'), {
+            'account': self.account.pk, 'type': 'expense', 'name': 'Rent', 'amount': '400',
+            'interval': 'monthly', 'every': 1, 'starts_at': '2025-01-05T08:00',
+        })
+        self.assertRedirects(response, reverse('recurring-list'))
+        rule = RecurringTransaction.objects.get()
+        self.assertEqual(rule.next_run, self.at(2025, 1, 5, 8))
+        recurring.tick(now=self.at(2025, 2, 10))
+        self.assertContains(self.client.get(reverse('recurring-list')), 'Rent')
+        url = reverse('recurring-update', args=[rule.pk])
+        fields = {'account': self.account.pk, 'type': 'expense', 'name': 'Rent', 'amount': '400'}
+        self.client.post(url, fields)
+        rule.refresh_from_db()
+        self.assertEqual((rule.active, rule.runs), (False, 2))
+        self.assertEqual(recurring.tick().transactions, 0)
+        # Resuming skips the runs due while paused.
+        self.client.post(url, {**fields, 'active': 'on'})
+        rule.refresh_from_db()
+        self.assertTrue(rule.active)
+        self.assertGreater(rule.next_run, timezone.now())
+        self.assertEqual(recurring.tick().transactions, 0)
+        self.assertEqual(self.account.transactions.count(), 2)
+        other = make_goal(make_account(self.user, name='Other'))
+        response = self.client.post(url, {**fields, 'goal': other.pk, 'active': 'on'})
+        self.assertContains(response, 'Pick a goal of the same account.')
+        self.client.post(reverse('recurring-delete', args=[rule.pk]))
+        self.assertFalse(RecurringTransaction.objects.exists())
+        self.assertEqual(self.account.transactions.count(), 2)
+
+    def test_scheduler_command_runs_once(self):
+        self.rule(type='income', name='Salary', amount=1000, starts_at=timezone.now() - timedelta(days=1), ends_at=timezone.now())
+        out = StringIO()
+        call_command('run_scheduler', '--once', stdout=out)
+        self.assertIn('Posted 1 transactions from 1 rules in 1 batches', out.getvalue())
+        self.assertFalse(RecurringTransaction.objects.get().active)
+
+
+class _Stream:
+    """Drive one request through an ASGI app by hand, as a server would."""
+
+    def __init__(self, app, session_key=None, method='GET'):
+        self.received = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        headers = [(b'host', b'testserver')]
+        if session_key:
+            headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode()))
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': reverse('live-updates'), 'query_string': b'', 'root_path': '',
+                 'headers': headers, 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80)}
+        self.task = asyncio.ensure_future(app(scope, self.received.get, self.sent.put))
+
+    async def message(self):
+        return await asyncio.wait_for(self.sent.get(), 5)
+
+    async def body(self):
+        return (await self.message())['body'].decode()
+
+    async def event(self):
+        name, data = (await self.body()).strip().split('\n')
+        return name.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+
+async def _django(scope, receive, send):
+    raise AssertionError("Live update streams must not reach Django.")
+
+
+class LiveUpdateTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.account = make_account(self.user, balance=100)
+        self.goal = make_goal(self.account, 'Car', target=200, current=50)
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+        self.app = live.LiveUpdates(_django)
+
+    def committed(self, func, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    async def test_stream_sends_only_what_changed(self):
+        stream = _Stream(self.app, self.session_key)
+        start = await stream.message()
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual(await stream.body(), 'retry: 5000\n\n')
+        account, goal = self.account.pk, self.goal.pk
+        name, first = await stream.event()
+        self.assertEqual((name, first), ('patch', {
+            'total-income': '0.00', 'total-expense': '0.00', f'account-{account}-balance': '100.00',
+            f'goal-{goal}-saved': '50.00', f'goal-{goal}-target': '200.00', f'goal-{goal}-progress': '25',
+        }))
+        # The same figures the JSON API reports.
+        self.assertEqual(first, live.values(await sync_to_async(api.build_summary)(self.user)))
+        await sync_to_async(self.committed)(ledger.post, self.account, 'income', Decimal('1250'), name='Pay')
+        self.assertEqual(await stream.event(), ('patch', {'total-income': '1,250.00', f'account-{account}-balance': '1,350.00'}))
+        await sync_to_async(self.committed)(ledger.post, self.account, 'expense', Decimal('50'), goal=self.goal, name='Save')
+        self.assertEqual(await stream.event(), ('patch', {
+            'total-expense': '50.00', f'account-{account}-balance': '1,300.00', f'goal-{goal}-saved': '100.00',
+            f'goal-{goal}-progress': '50',
+        }))
+        await sync_to_async(self.committed)(make_goal, self.account, 'House')
+        self.assertEqual(await stream.event(), ('reload', {}))
+        self.assertEqual(await stream.message(), {'type': 'http.response.body', 'body': b''})
+        await stream.task
+        self.assertEqual(len(live.hub), 0)
+
+    @override_settings(LIVE_HEARTBEAT=0.01)
+    async def test_idle_streams_heartbeat_until_the_client_leaves(self):
+        streams = [_Stream(self.app, self.session_key) for _ in range(3)]
+        for stream in streams:
+            for _ in range(3):
+                await stream.message()
+            self.assertEqual(await stream.body(), ': ping\n\n')
+        self.assertEqual(len(live.hub), 3)
+        # One read of the new figures serves every stream of the user.
+        caching.reset_stats()
+        await sync_to_async(self.committed)(ledger.post, self.account, 'income', Decimal('5'), name='Pay')
+        for stream in streams:
+            while (body := await stream.body()) == ': ping\n\n':
+                pass
+            self.assertIn('"total-income":"5.00"', body)
+        self.assertEqual(caching.stats(), {'api-summary': {'hit': 0, 'miss': 1}})
+        await streams[0].received.put({'type': 'http.disconnect'})
+        await streams[0].task
+        self.assertEqual(len(live.hub), 2)
+        # Shutting the server down ends the rest.
+        lifespan = asyncio.Queue()
+        sent = []
+        for message in ('lifespan.startup', 'lifespan.shutdown'):
+            await lifespan.put({'type': message})
+        await self.app({'type': 'lifespan'}, lifespan.get, lambda message: asyncio.sleep(0, sent.append(message['type'])))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        await asyncio.wait_for(asyncio.gather(*(stream.task for stream in streams[1:])), 5)
+        self.assertEqual(len(live.hub), 0)
+
+    async def test_requires_a_session(self):
+        for stream, status in ((_Stream(self.app), 401), (_Stream(self.app, self.session_key, method='POST'), 405)):
+            self.assertEqual((await stream.message())['status'], status)
+            await stream.message()
+            await stream.task
+        self.assertEqual(len(live.hub), 0)
+
+    def test_dashboard_patches_in_place(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, f'data-live="account-{self.account.pk}-balance">100.00<')
+        self.assertContains(response, f'data-live-width="goal-{self.goal.pk}-progress"')
+        self.assertContains(response, 'new EventSource("/live/")')
+        # Without the ASGI middleware there is no stream.
+        self.assertEqual(self.client.get(reverse('live-updates')).status_code, 204)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
@@ -8,6 +8,7 @@ urlpatterns = [
     path('accounts/<int:pk>/', views.account_detail, name='account-detail'),
     path('accounts/<int:pk>/update/', views.account_update, name='account-update'),
     path('accounts/<int:pk>/delete/', views.account_delete, name='account-delete'),
+    path('accounts/<int:pk>/balance/', views.account_balance, name='account-balance'),
 
     # Add these two for deposit and withdraw!
     path('accounts/<int:pk>/deposit/', views.account_deposit, name='account_deposit'),
@@ -25,9 +26,30 @@ urlpatterns = [
 
     path('transactions/', views.transaction_list, name='transaction-list'),
     path('transactions/create/', views.transaction_create, name='transaction-create'),
+    path('transactions/import/', views.transaction_import, name='transaction-import'),
+    path('transactions/export/', views.transaction_export, name='transaction-export'),
+    path('transfers/create/', views.transfer_create, name='transfer-create'),
     path('transactions/<int:pk>/', views.transaction_detail, name='transaction-detail'),
     path('transactions/<int:pk>/update/', views.transaction_update, name='transaction-update'),
     path('transactions/<int:pk>/delete/', views.transaction_delete, name='transaction-delete'),
 
+    path('recurring/', views.recurring_list, name='recurring-list'),
+    path('recurring/create/', views.recurring_create, name='recurring-create'),
+    path('recurring/<int:pk>/update/', views.recurring_update, name='recurring-update'),
+    path('recurring/<int:pk>/delete/', views.recurring_delete, name='recurring-delete'),
+
     path('reports/', views.reports, name='reports'),
+    path('reports/export/', views.report_export, name='report-export'),
+
+    path('jobs/', views.job_list, name='job-list'),
+    path('jobs/<int:pk>/', views.job_status, name='job-status'),
+
+    path('performance/', views.performance_stats, name='performance-stats'),
+
+    # Read-only JSON for the mobile client.
+    path('api/accounts/', api.accounts, name='api-accounts'),
+    path('api/goals/', api.goals, name='api-goals'),
+    path('api/transactions/', api.transactions, name='api-transactions'),
+    path('api/summary/', api.summary, name='api-summary'),
+    path('live/', views.live_updates, name='live-updates'),
 ]
\ No newline at end of file
@@ -1,46 +1,64 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
+import asyncio
+import io
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db.models import Count
 from django.contrib import messages
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django import forms
-from .models import Account, Goal, Transaction
-from .forms import AccountForm, GoalForm, TransactionForm, GoalTransactionForm
+from .models import Account, Goal, Job, RecurringTransaction, Transaction
+from .idempotency import idempotent
+from .forms import AccountForm, GoalForm, TransactionForm, GoalTransactionForm, TransactionFilterForm, StatementImportForm, TransferForm, TransferLegFormSet, RecurringTransactionForm
+from .importers import PARSERS, StatementError, detect_format, import_transactions
+from .pagination import InvalidCursor, akeyset_page
+from . import archive, balances, caching, exports, forecasting, jobs, ledger, middleware, recurring, tasks
+from .analytics import build_analytics
+from .reporting import abuild_dashboard, abuild_report, alist, build_report
+from .routers import read_alias, read_from_replica
 
 # Deposit/Withdraw Forms
 class AccountTransactionForm(forms.Form):
     amount = forms.DecimalField(label="Amount", min_value=0.01)
     description = forms.CharField(label="Description", required=False)
 
+async def _auser(request):
+    # Templates read request.user; resolve it here so rendering makes no sync query.
+    request.user = await request.auser()
+    return request.user
+
+# Not read_from_replica: the dashboard is cached under the current data
+# version, and a lagging replica would pin stale figures there until the next
+# change. Cache misses read the primary, like the jobs that refresh reports.
 @login_required
-def dashboard(request):
-    accounts = Account.objects.filter(user=request.user)
-    goals = Goal.objects.filter(account__user=request.user)
-    transactions = Transaction.objects.filter(account__user=request.user).order_by('-date')
-    total_income = transactions.filter(type='income').aggregate(total=Sum('amount'))['total'] or 0
-    total_expense = transactions.filter(type='expense').aggregate(total=Sum('amount'))['total'] or 0
-    total_goal_saved = goals.aggregate(total=Sum('current_amount'))['total'] or 0
+async def dashboard(request):
+    user = await _auser(request)
+    context = await caching.acached(user, 'dashboard', abuild_dashboard)
 
     messages.info(request, "Welcome to your finance dashboard!")
 
-    context = {
-        "accounts": accounts,
-        "goals": goals,
-        "transactions": transactions[:5],  # latest 5
-        "total_income": total_income,
-        "total_expense": total_expense,
-        "total_goal_saved": total_goal_saved,
-    }
     return render(request, "dashboard.html", context)
 
+def live_updates(request):
+    # The stream is served by finance.live.LiveUpdates in front of the ASGI
+    # application. Without it (WSGI, runserver) answer 204, which tells
+    # EventSource to stop reconnecting, so the dashboard simply stays static.
+    return HttpResponse(status=204)
+
 # Account Views
 @login_required
 def account_list(request):
-    accounts = Account.objects.filter(user=request.user)
+    accounts = Account.objects.filter(user=request.user).annotate(goal_count=Count('goals'))
     return render(request, 'account/account_list.html', {'accounts': accounts})
 
 @login_required
-def account_detail(request, pk):
-    account = get_object_or_404(Account, pk=pk, user=request.user)
+async def account_detail(request, pk):
+    user = await _auser(request)
+    account = await aget_object_or_404(Account.objects.annotate(goal_count=Count('goals')), pk=pk, user=user)
     return render(request, 'account/account_detail.html', {'account': account})
 
 @login_required
@@ -60,14 +78,48 @@ def account_create(request):
 def account_update(request, pk):
     account = get_object_or_404(Account, pk=pk, user=request.user)
     if request.method == 'POST':
+        opening = account.balance
         form = AccountForm(request.POST, instance=account)
         if form.is_valid():
-            form.save()
+            account = form.save()
+            # A hand-edited balance corrects the opening balance, so move every checkpoint with it.
+            balances.shift(account.pk, None, account.balance - opening)
             return redirect('account-list')
     else:
         form = AccountForm(instance=account)
     return render(request, 'account/account_form.html', {'form': form})
 
+def _parse_when(value):
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        when = day and datetime.combine(day, time.min)
+    if when is not None and timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+@login_required
+def account_balance(request, pk):
+    account = get_object_or_404(Account, pk=pk, user=request.user)
+    try:
+        if 'at' in request.GET:
+            when = _parse_when(request.GET['at'])
+            if when is None:
+                raise ValueError("'at' must be an ISO date or datetime.")
+            return JsonResponse({'account': account.pk, 'at': when.isoformat(),
+                                 'balance': str(balances.balance_at(account, when))})
+        end = parse_date(request.GET.get('end', '')) or timezone.localdate()
+        start = parse_date(request.GET.get('start', '')) or end - timedelta(days=29)
+        if not 0 <= (end - start).days < balances.MAX_SERIES_DAYS:
+            raise ValueError(f"'start' must be on or before 'end' and at most {balances.MAX_SERIES_DAYS} days earlier.")
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    series = balances.daily_balances(account, start, end)
+    return JsonResponse({
+        'account': account.pk,
+        'balances': [{'date': day.isoformat(), 'balance': str(balance)} for day, balance in series],
+    })
+
 @login_required
 def account_delete(request, pk):
     account = get_object_or_404(Account, pk=pk, user=request.user)
@@ -78,6 +130,7 @@ def account_delete(request, pk):
 
 # Deposit/Withdraw Views
 @login_required
+@idempotent
 def account_deposit(request, pk):
     account = get_object_or_404(Account, pk=pk, user=request.user)
     if request.method == 'POST':
@@ -85,14 +138,7 @@ def account_deposit(request, pk):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             description = form.cleaned_data['description']
-            Transaction.objects.create(
-                account=account,
-                type='income',
-                amount=amount,
-                description=description
-            )
-            account.balance += amount
-            account.save()
+            ledger.post(account, 'income', amount, description=description)
             messages.success(request, f"Deposited {amount} KES to {account.name}")
             return redirect('account-detail', pk=pk)
     else:
@@ -100,6 +146,7 @@ def account_deposit(request, pk):
     return render(request, 'account/account_deposit_form.html', {'form': form, 'account': account})
 
 @login_required
+@idempotent
 def account_withdraw(request, pk):
     account = get_object_or_404(Account, pk=pk, user=request.user)
     if request.method == 'POST':
@@ -107,17 +154,11 @@ def account_withdraw(request, pk):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             description = form.cleaned_data['description']
-            if amount > account.balance:
+            try:
+                ledger.post(account, 'expense', amount, description=description, check_funds=True)
+            except ledger.InsufficientFunds:
                 messages.error(request, "Insufficient balance.")
             else:
-                Transaction.objects.create(
-                    account=account,
-                    type='expense',
-                    amount=amount,
-                    description=description
-                )
-                account.balance -= amount
-                account.save()
                 messages.success(request, f"Withdrew {amount} KES from {account.name}")
                 return redirect('account-detail', pk=pk)
     else:
@@ -127,13 +168,19 @@ def account_withdraw(request, pk):
 # Goal Views
 @login_required
 def goal_list(request):
-    goals = Goal.objects.filter(account__user=request.user)
+    goals = list(Goal.objects.filter(account__user=request.user))
+    forecasting.attach(goals, forecasting.get_forecasts(request.user, goals))
     return render(request, 'goal/goal_list.html', {'goals': goals})
 
 @login_required
-def goal_detail(request, pk):
-    goal = get_object_or_404(Goal, pk=pk, account__user=request.user)
-    return render(request, 'goal/goal_detail.html', {'goal': goal})
+async def goal_detail(request, pk):
+    user = await _auser(request)
+    goal = await aget_object_or_404(Goal.objects.select_related('account'), pk=pk, account__user=user)
+    recent, forecasts = await asyncio.gather(
+        alist(goal.transactions.order_by('-date', '-id')[:5]), forecasting.aget_forecasts(user),
+    )
+    goal.forecast = forecasts.get(goal.pk)
+    return render(request, 'goal/goal_detail.html', {'goal': goal, 'recent_transactions': recent})
 
 @login_required
 def goal_create(request):
@@ -170,6 +217,7 @@ def goal_delete(request, pk):
 
 
 @login_required
+@idempotent
 def goal_deposit(request, pk):
     goal = get_object_or_404(Goal, pk=pk, account__user=request.user)
     account = goal.account
@@ -178,18 +226,8 @@ def goal_deposit(request, pk):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             description = form.cleaned_data['description']
-            # Update goal and account
-            goal.current_amount += amount
-            goal.save()
-            account.balance -= amount  # Money moves from account to goal
-            account.save()
-            Transaction.objects.create(
-                account=account,
-                goal=goal,
-                type='expense',  # From account's perspective
-                amount=amount,
-                description=description
-            )
+            # Money moves from account to goal; 'expense' from the account's perspective
+            ledger.post(account, 'expense', amount, goal=goal, description=description)
             messages.success(request, f"Deposited {amount} KES to goal '{goal.name}' from account '{account.name}'.")
             return redirect('goal-detail', pk=pk)
     else:
@@ -197,6 +235,7 @@ def goal_deposit(request, pk):
     return render(request, 'goal/goal_deposit_form.html', {'form': form, 'goal': goal})
 
 @login_required
+@idempotent
 def goal_withdraw(request, pk):
     goal = get_object_or_404(Goal, pk=pk, account__user=request.user)
     account = goal.account
@@ -205,20 +244,12 @@ def goal_withdraw(request, pk):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             description = form.cleaned_data['description']
-            if amount > goal.current_amount:
+            # Money moves from goal back to account; 'income' from the account's perspective
+            try:
+                ledger.post(account, 'income', amount, goal=goal, description=description, check_funds=True)
+            except ledger.InsufficientFunds:
                 messages.error(request, "Insufficient goal funds.")
             else:
-                goal.current_amount -= amount
-                goal.save()
-                account.balance += amount  # Money moves from goal back to account
-                account.save()
-                Transaction.objects.create(
-                    account=account,
-                    goal=goal,
-                    type='income',  # From account's perspective
-                    amount=amount,
-                    description=description
-                )
                 messages.success(request, f"Withdrew {amount} KES from goal '{goal.name}' to account '{account.name}'.")
                 return redirect('goal-detail', pk=pk)
     else:
@@ -227,29 +258,62 @@ def goal_withdraw(request, pk):
 # Transaction Views
 
 @login_required
-def transaction_list(request):
-    transactions = Transaction.objects.filter(account__user=request.user).order_by('-date')
-    return render(request, 'transaction/transaction_list.html', {'transactions': transactions})
+@read_from_replica
+async def transaction_list(request):
+    user = await _auser(request)
+    filter_form = TransactionFilterForm(request.GET, user=user)
+    # Form validation looks up the chosen account and goal; forms are sync-only.
+    await sync_to_async(filter_form.is_valid)()
+    transactions = filter_form.filter(
+        Transaction.objects.filter(account__user=user).select_related('account', 'goal')
+    )
+    text = request.GET.get('q', '').strip()
+    if text:
+        # Ranked full-text matches: one page, best first.
+        page, next_cursor = await sync_to_async(filter_form.search)(user, text), None
+    else:
+        history = filter_form.history(user)
+        try:
+            page, next_cursor = await akeyset_page(transactions, request.GET.get('after'), history=history)
+        except InvalidCursor:
+            page, next_cursor = await akeyset_page(transactions, history=history)
+    query = request.GET.copy()
+    query.pop('after', None)
+    context = {
+        'transactions': page,
+        'filter_form': filter_form,
+        'next_cursor': next_cursor,
+        'filter_query': query.urlencode(),
+    }
+    # The filter form's account and goal choices are queried while rendering.
+    return await sync_to_async(render)(request, 'transaction/transaction_list.html', context)
 
 @login_required
-def transaction_detail(request, pk):
-    transaction = get_object_or_404(Transaction, pk=pk, account__user=request.user)
-    return render(request, 'transaction/transaction_detail.html', {'transaction': transaction})
+async def transaction_detail(request, pk):
+    user = await _auser(request)
+    transaction = await Transaction.objects.select_related('account', 'goal').filter(pk=pk, account__user=user).afirst()
+    if transaction is None:
+        transaction = await sync_to_async(archive.History(user).get)(pk)
+    if transaction is None:
+        raise Http404("No transaction matches the given query.")
+    legs = []
+    if transaction.transfer_id and not getattr(transaction, 'archived', False):
+        legs = await alist(Transaction.objects.select_related('account').filter(transfer_id=transaction.transfer_id).exclude(pk=pk))
+    return render(request, 'transaction/transaction_detail.html', {'transaction': transaction, 'transfer_legs': legs})
 
 @login_required
+@idempotent
 def transaction_create(request):
     if request.method == 'POST':
         form = TransactionForm(request.POST)
         form.fields['account'].queryset = Account.objects.filter(user=request.user)
         form.fields['goal'].queryset = Goal.objects.filter(account__user=request.user)
         if form.is_valid():
-            transaction = form.save()
-            if transaction.type == 'income':
-                transaction.account.balance += transaction.amount
-            elif transaction.type == 'expense':
-                transaction.account.balance -= transaction.amount
-            transaction.account.save()
-            update_goal_amount(transaction)
+            data = form.cleaned_data
+            ledger.post(
+                data['account'], data['type'], data['amount'], goal=data['goal'],
+                name=data['name'], description=data['description'],
+            )
             return redirect('transaction-list')
     else:
         form = TransactionForm()
@@ -257,16 +321,122 @@ def transaction_create(request):
         form.fields['goal'].queryset = Goal.objects.filter(account__user=request.user)
     return render(request, 'transaction/transaction_form.html', {'form': form})
 
+@login_required
+@idempotent
+def transfer_create(request):
+    if request.method == 'POST':
+        form = TransferForm(request.POST, user=request.user)
+        legs = TransferLegFormSet(request.POST, form_kwargs={'user': request.user}, prefix='legs')
+        if form.is_valid() and legs.is_valid():
+            source = form.cleaned_data['source']
+            transfers = [
+                ledger.Transfer(source, leg['destination'], leg['amount'], description=form.cleaned_data['description'])
+                for leg in legs.cleaned_data if leg
+            ]
+            if any(transfer.destination == source for transfer in transfers):
+                form.add_error('source', "Transfer to accounts other than the source.")
+            else:
+                try:
+                    ledger.post_transfers(transfers)
+                except ledger.InsufficientFunds as exc:
+                    messages.error(request, str(exc))
+                else:
+                    total = sum(transfer.amount for transfer in transfers)
+                    messages.success(request, f"Transferred {total} KES from {source.name} to {len(transfers)} account(s).")
+                    return redirect('account-detail', pk=source.pk)
+    else:
+        form = TransferForm(user=request.user, initial={'source': request.GET.get('source')})
+        legs = TransferLegFormSet(form_kwargs={'user': request.user}, prefix='legs')
+    return render(request, 'transaction/transfer_form.html', {'form': form, 'legs': legs})
+
+@login_required
+def recurring_list(request):
+    rules = (
+        RecurringTransaction.objects.filter(account__user=request.user)
+        .select_related('account', 'goal').order_by('-active', 'next_run')
+    )
+    return render(request, 'recurring/recurring_list.html', {'rules': rules})
+
+@login_required
+def recurring_create(request):
+    if request.method == 'POST':
+        form = RecurringTransactionForm(request.POST, user=request.user)
+        if form.is_valid():
+            rule = form.save(commit=False)
+            rule.next_run = rule.starts_at
+            rule.save()
+            return redirect('recurring-list')
+    else:
+        form = RecurringTransactionForm(user=request.user)
+    return render(request, 'recurring/recurring_form.html', {'form': form})
+
+@login_required
+def recurring_update(request, pk):
+    rule = get_object_or_404(RecurringTransaction, pk=pk, account__user=request.user)
+    was_active = rule.active
+    if request.method == 'POST':
+        form = RecurringTransactionForm(request.POST, instance=rule, user=request.user)
+        if form.is_valid():
+            rule = form.save(commit=False)
+            # The scheduler owns runs and next_run while a rule is active; only
+            # write them when resuming a paused rule.
+            fields = list(form.fields)
+            if rule.active and not was_active:
+                recurring.resume(rule)
+                fields += ['runs', 'next_run']
+            elif rule.active and rule.ends_at is not None and rule.next_run > rule.ends_at:
+                rule.active = False
+            rule.save(update_fields=fields)
+            return redirect('recurring-list')
+    else:
+        form = RecurringTransactionForm(instance=rule, user=request.user)
+    return render(request, 'recurring/recurring_form.html', {'form': form, 'object': rule})
+
+@login_required
+def recurring_delete(request, pk):
+    rule = get_object_or_404(RecurringTransaction.objects.select_related('account'), pk=pk, account__user=request.user)
+    if request.method == 'POST':
+        rule.delete()
+        return redirect('recurring-list')
+    return render(request, 'recurring/recurring_confirm_delete.html', {'rule': rule})
+
+@login_required
+@idempotent
+def transaction_import(request):
+    if request.method == 'POST':
+        form = StatementImportForm(request.POST, request.FILES, user=request.user)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            format = form.cleaned_data['format'] or detect_format(upload.name)
+            if upload.size >= tasks.get_background_bytes():
+                job = tasks.queue_import(request.user, form.cleaned_data['account'], upload, format)
+                messages.info(request, f"Large statement queued for import as job #{job.pk}.")
+                return redirect('transaction-list')
+            parser = PARSERS[format]
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_transactions(form.cleaned_data['account'], parser(lines))
+            except StatementError as exc:
+                messages.error(request, f"Import failed, nothing was saved. {exc}")
+            else:
+                messages.success(request, f"Imported {result.rows} transactions ({result.rows_per_second:,.0f} rows/s).")
+                return redirect('transaction-list')
+    else:
+        form = StatementImportForm(user=request.user)
+    return render(request, 'transaction/transaction_import_form.html', {'form': form})
+
 @login_required
 def transaction_update(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk, account__user=request.user)
+    if transaction.transfer_id:
+        messages.error(request, "Transfers cannot be edited; delete the transfer and make a new one.")
+        return redirect('transaction-detail', pk=pk)
     if request.method == 'POST':
         form = TransactionForm(request.POST, instance=transaction)
         form.fields['account'].queryset = Account.objects.filter(user=request.user)
         form.fields['goal'].queryset = Goal.objects.filter(account__user=request.user)
         if form.is_valid():
-            transaction = form.save()
-            update_goal_amount(transaction)
+            ledger.amend(form.instance)
             return redirect('transaction-list')
     else:
         form = TransactionForm(instance=transaction)
@@ -276,56 +446,68 @@ def transaction_update(request, pk):
 
 @login_required
 def transaction_delete(request, pk):
-    transaction = get_object_or_404(Transaction, pk=pk, account__user=request.user)
+    transaction = get_object_or_404(Transaction.objects.select_related('account', 'goal'), pk=pk, account__user=request.user)
     if request.method == 'POST':
-        transaction.delete()
+        ledger.remove(transaction)
         return redirect('transaction-list')
     return render(request, 'transaction/transaction_confirm_delete.html', {'transaction': transaction})
 
+# Cached like the dashboard, so not read_from_replica either.
 @login_required
-def reports(request):
-    accounts = Account.objects.filter(user=request.user)
-    goals = Goal.objects.filter(account__user=request.user)
-    transactions = Transaction.objects.filter(account__user=request.user)
-
-    # Account summaries
-    account_summaries = []
-    for account in accounts:
-        acc_transactions = transactions.filter(account=account)
-        acc_income = acc_transactions.filter(type='income').aggregate(total=Sum('amount'))['total'] or 0
-        acc_expense = acc_transactions.filter(type='expense').aggregate(total=Sum('amount'))['total'] or 0
-        acc_goal_count = account.goals.count()
-        account_summaries.append({
-            'account': account,
-            'income': acc_income,
-            'expense': acc_expense,
-            'goal_count': acc_goal_count,
-            'balance': account.balance,
-        })
-    # Goal summaries
-    goal_summaries = []
-    for goal in goals:
-        goal_transactions = transactions.filter(goal=goal)
-        goal_in = goal_transactions.filter(type='income').aggregate(total=Sum('amount'))['total'] or 0
-        goal_out = goal_transactions.filter(type='expense').aggregate(total=Sum('amount'))['total'] or 0
-        percent = round(goal.current_amount / goal.target_amount * 100, 2) if goal.target_amount and goal.target_amount > 0 else 0
-        goal_summaries.append({
-            'goal': goal,
-            'account': goal.account,
-            'current_amount': goal.current_amount,
-            'target_amount': goal.target_amount,
-            'deposit': goal_out,
-            'withdraw': goal_in,
-            'progress_percent': percent,
-        })
-    total_transactions = transactions.count()
-    total_income = transactions.filter(type='income').aggregate(total=Sum('amount'))['total'] or 0
-    total_expense = transactions.filter(type='expense').aggregate(total=Sum('amount'))['total'] or 0
-    context = {
-        'account_summaries': account_summaries,
-        'goal_summaries': goal_summaries,
-        'total_transactions': total_transactions,
-        'total_income': total_income,
-        'total_expense': total_expense,
-    }
-    return render(request, "reports.html", context)
\ No newline at end of file
+async def reports(request):
+    user = await _auser(request)
+    # After a change, serve the previous report and let a worker rebuild it.
+    schedule = tasks.aschedule_report_refresh
+    report, analytics = await asyncio.gather(
+        caching.acached_stale(user, 'reports', abuild_report, schedule),
+        # CPU-bound column scan: keep it off the event loop.
+        caching.acached_stale(user, 'analytics', sync_to_async(build_analytics), schedule),
+    )
+    return render(request, "reports.html", {**report, 'analytics': analytics})
+
+def _export_response(request, stream_factory, base):
+    format = request.GET.get('format', 'csv')
+    if format not in exports.FORMATS:
+        format = 'csv'
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    content_type = 'application/gzip' if compress else exports.FORMATS[format][0]
+    response = StreamingHttpResponse(stream_factory(format, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(base, format, compress)}"'
+    return response
+
+@login_required
+@read_from_replica
+def transaction_export(request):
+    filter_form = TransactionFilterForm(request.GET, user=request.user)
+    # The stream is consumed after the view returns, so pin the read alias now.
+    transactions = filter_form.filter(Transaction.objects.using(read_alias()).filter(account__user=request.user))
+    history = filter_form.history(request.user)
+    return _export_response(
+        request,
+        lambda format, compress: exports.export_transactions(transactions, format, compress, history=history),
+        'transactions',
+    )
+
+@login_required
+@read_from_replica
+def report_export(request):
+    report = build_report(request.user)
+    return _export_response(
+        request,
+        lambda format, compress: exports.export_report(report, format, compress),
+        'report',
+    )
+
+@user_passes_test(lambda user: user.is_staff)
+def performance_stats(request):
+    return JsonResponse({'views': middleware.snapshot(), 'cache': caching.stats()})
+
+@login_required
+def job_list(request):
+    recent = Job.objects.filter(user=request.user).order_by('-pk')[:20]
+    return JsonResponse({'jobs': [jobs.as_dict(job) for job in recent]})
+
+@login_required
+def job_status(request, pk):
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return JsonResponse(jobs.as_dict(job))